@@ -0,0 +1,443 @@
+"""Local address autocomplete and resolution over a memory-mapped index.
+
+The index file is built once from gazetteer and postal code dumps:
+
+    python address_index.py data/gazetteer_in.tsv IN.txt -o .cache/address_index.bin
+
+Sources may be GeoNames postal code dumps (12 columns, one row per pincode
+and place), GeoNames gazetteer dumps (19 columns) or the simple
+``name, admin1, latitude, longitude[, population[, kind]]`` layout of the
+bundled seed file, which is also how landmarks can be added.
+"""
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import uuid
+import logging
+import argparse
+import threading
+import unicodedata
+from functools import lru_cache
+import numpy as np
+import metrics
+from offline_geocoder import haversine_km, DEFAULT_GAZETTEER, GEONAMES_CLASSES
+from geocoding import get_geocoder
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_PATH = os.path.join(BASE_DIR, ".cache", "address_index.bin")
+
+MAGIC = b"ADDRIDX1"
+ALIGN = 8
+
+# Weight of a query token matched by prefix or by edit distance, relative to an exact match
+PREFIX_QUALITY = 0.8
+FUZZY_QUALITY = 0.7
+# Share of a query's known tokens the best match must cover to be trusted without Nominatim
+MIN_COVERAGE = 0.8
+# Near-tied matches closer than this are the same place listed twice (e.g. two pincodes)
+SAME_PLACE_KM = 5.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase ASCII word tokens with accents folded"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return _TOKEN_RE.findall(text)
+
+
+class AddressMatch:
+    """A local index entry matched to a typed address"""
+
+    def __init__(self, label, kind, latitude, longitude, score, coverage, unknown_words=0):
+        self.label = label
+        self.kind = kind
+        self.latitude = latitude
+        self.longitude = longitude
+        self.score = score
+        self.coverage = coverage
+        # Query words found nowhere in the index, such as house numbers and streets
+        self.unknown_words = unknown_words
+
+
+# Building
+
+def load_address_sources(paths):
+    """Read entries as (label, kind, lat, lon, prior, search_text) from source files"""
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) >= 19:
+                    # GeoNames gazetteer: populated places and admin areas only
+                    if parts[6] not in GEONAMES_CLASSES:
+                        continue
+                    population = float(parts[14] or 0)
+                    entries.append((parts[1], "city", float(parts[4]), float(parts[5]),
+                                    math.log10(population + 10), f"{parts[1]} {parts[3]}"))
+                elif len(parts) >= 12:
+                    # GeoNames postal codes: code, place, state, district, sub-district
+                    postal_code, place, state, district = parts[1], parts[2], parts[3], parts[5]
+                    if not parts[9] or not parts[10]:
+                        continue
+                    label = ", ".join(p for p in (place, district, state) if p) + f" {postal_code}"
+                    entries.append((label, "locality", float(parts[9]), float(parts[10]), 1.0,
+                                    f"{place} {district} {parts[7]} {state} {postal_code}"))
+                else:
+                    name, admin, lat, lon = parts[:4]
+                    population = float(parts[4]) if len(parts) > 4 and parts[4] else 0.0
+                    kind = parts[5] if len(parts) > 5 and parts[5] else "city"
+                    label = f"{name}, {admin}" if admin else name
+                    entries.append((label, kind, float(lat), float(lon),
+                                    math.log10(population + 10), f"{name} {admin}"))
+    return entries
+
+
+def _radix_nodes(tokens):
+    """Compressed trie over sorted byte tokens; each node covers a contiguous token range"""
+    # (label token index, label start, label length, first child, child count, lo, hi)
+    nodes = [[0, 0, 0, 0, 0, 0, len(tokens)]]
+    queue = [(0, 0)]  # (node, depth)
+    while queue:
+        next_queue = []
+        for node, depth in queue:
+            lo, hi = nodes[node][5], nodes[node][6]
+            start = lo
+            # A token ending exactly at this depth sorts first and is the node itself
+            if start < hi and len(tokens[start]) == depth:
+                start += 1
+            children = []
+            while start < hi:
+                first = tokens[start][depth]
+                end = start
+                while end < hi and tokens[end][depth] == first:
+                    end += 1
+                # Extend the edge label while every token in the group agrees
+                label_end = depth + 1
+                while all(len(tokens[i]) > label_end for i in range(start, end)) and \
+                        len({tokens[i][label_end] for i in range(start, end)}) == 1:
+                    label_end += 1
+                children.append(([start, depth, label_end - depth, 0, 0, start, end], label_end))
+                start = end
+            nodes[node][3], nodes[node][4] = len(nodes), len(children)
+            for child, child_depth in children:
+                next_queue.append((len(nodes), child_depth))
+                nodes.append(child)
+        queue = next_queue
+    return nodes
+
+
+def _write_arrays(path, arrays, meta):
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = [offset, array.dtype.str, len(array)]
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"arrays": layout, **meta}).encode()
+    base = -(-(len(MAGIC) + 4 + len(header)) // ALIGN) * ALIGN
+    # Unique per writer, so replicas building the index at once never share a file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + len(header).to_bytes(4, "little") + header)
+        for name, array in arrays.items():
+            f.seek(base + layout[name][0])
+            f.write(array.tobytes())
+        f.truncate(base + offset)
+    os.replace(tmp_path, path)
+
+
+def build_index(entries, path):
+    """Compile entries from load_address_sources into an index file at ``path``"""
+    kinds = sorted({entry[1] for entry in entries})
+    postings, entry_tokens = {}, []
+    for entry_id, (_, _, _, _, _, text) in enumerate(entries):
+        entry_token_set = set(tokenize(text))
+        entry_tokens.append(min(len(entry_token_set), 255))
+        for token in entry_token_set:
+            postings.setdefault(token.encode(), []).append(entry_id)
+    tokens = sorted(postings)
+    nodes = _radix_nodes(tokens)
+
+    labels = [entry[0].encode() for entry in entries]
+    label_offsets = np.cumsum([0] + [len(label) for label in labels]).astype(np.uint32)
+    token_offsets = np.cumsum([0] + [len(token) for token in tokens]).astype(np.uint32)
+    counts = [len(postings[token]) for token in tokens]
+    node_array = np.array(nodes, dtype=np.uint32).reshape(-1, 7)
+
+    arrays = {
+        "entry_lat": np.array([e[2] for e in entries], dtype=np.float32),
+        "entry_lon": np.array([e[3] for e in entries], dtype=np.float32),
+        "entry_prior": np.array([e[4] for e in entries], dtype=np.float32),
+        "entry_kind": np.array([kinds.index(e[1]) for e in entries], dtype=np.uint8),
+        "entry_tokens": np.array(entry_tokens, dtype=np.uint8),
+        "label_offsets": label_offsets,
+        "labels": np.frombuffer(b"".join(labels), dtype=np.uint8),
+        "token_offsets": token_offsets,
+        "tokens": np.frombuffer(b"".join(tokens), dtype=np.uint8),
+        "token_idf": np.log((len(entries) + 1) / (np.array(counts, dtype=np.float32) + 0.5)).astype(np.float32),
+        "posting_offsets": np.cumsum([0] + counts).astype(np.uint32),
+        "postings": np.array([e for token in tokens for e in postings[token]], dtype=np.uint32),
+        # Edge labels are slices of the first token under each node
+        "node_label_start": (token_offsets[node_array[:, 0]] + node_array[:, 1]).astype(np.uint32),
+        "node_label_len": node_array[:, 2].copy(),
+        "node_first_child": node_array[:, 3].copy(),
+        "node_children": node_array[:, 4].copy(),
+        "node_lo": node_array[:, 5].copy(),
+        "node_hi": node_array[:, 6].copy(),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _write_arrays(path, arrays, {"kinds": kinds})
+    logger.info(f"Address index with {len(entries)} entries, {len(tokens)} tokens, {len(nodes)} trie nodes written to {path}")
+
+
+# Querying
+
+class AddressIndex:
+    """Read-only view of an index file through mmap.
+
+    Nothing is loaded up front: NumPy arrays are views on the mapping, so
+    only the pages a query touches are read and the OS can evict them under
+    memory pressure. Prefix lookups walk the compressed trie to the node
+    covering every token with that prefix; because postings are stored in
+    token order, that node maps to a single slice of the postings array.
+    Tokens with no exact match are looked up by edit distance with a
+    Levenshtein walk over the same trie.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an address index")
+        header_len = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 4], "little")
+        header = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + header_len])
+        base = -(-(len(MAGIC) + 4 + header_len) // ALIGN) * ALIGN
+        self.kinds = header["kinds"]
+        for name, (offset, dtype, count) in header["arrays"].items():
+            setattr(self, name, np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=count, offset=base + offset))
+        self._tokens_bytes = memoryview(self._mmap)[base + header["arrays"]["tokens"][0]:]
+        self._suggest = lru_cache(maxsize=1024)(self._suggest_uncached)
+        # Earlier words of an address being typed repeat on every keystroke
+        self._token_hits = lru_cache(maxsize=4096)(self._token_hits_uncached)
+
+    def __len__(self):
+        return len(self.entry_lat)
+
+    def _token(self, i):
+        return bytes(self._tokens_bytes[self.token_offsets[i]:self.token_offsets[i + 1]])
+
+    def _label(self, node):
+        start = self.node_label_start[node]
+        return bytes(self._tokens_bytes[start:start + self.node_label_len[node]])
+
+    def _child(self, node, byte):
+        first = self.node_first_child[node]
+        for child in range(first, first + self.node_children[node]):
+            if self._tokens_bytes[self.node_label_start[child]] == byte:
+                return child
+        return None
+
+    def prefix_range(self, prefix):
+        """Token ID range [lo, hi) of every token starting with ``prefix``"""
+        node, i = 0, 0
+        while i < len(prefix):
+            node = self._child(node, prefix[i])
+            if node is None:
+                return 0, 0
+            label = self._label(node)
+            common = min(len(label), len(prefix) - i)
+            if label[:common] != prefix[i:i + common]:
+                return 0, 0
+            i += len(label)
+        return int(self.node_lo[node]), int(self.node_hi[node])
+
+    def fuzzy_tokens(self, word, max_distance):
+        """Token IDs within ``max_distance`` edits of ``word`` that share its first letter.
+
+        Typos in the first letter are rare, and pinning it confines the walk
+        to one subtree of the root.
+        """
+        matches = []
+        stack = [(0, list(range(len(word) + 1)), 0)]
+        while stack:
+            node, row, depth = stack.pop()
+            first = self.node_first_child[node]
+            children = range(first, first + self.node_children[node])
+            if node == 0:
+                child = self._child(0, word[0])
+                children = () if child is None else (child,)
+            for child in children:
+                child_row, pruned = row, False
+                for byte in self._label(child):
+                    previous = child_row
+                    child_row = [previous[0] + 1]
+                    for j in range(1, len(word) + 1):
+                        cost = 0 if word[j - 1] == byte else 1
+                        child_row.append(min(child_row[j - 1] + 1, previous[j] + 1, previous[j - 1] + cost))
+                    if min(child_row) > max_distance:
+                        pruned = True
+                        break
+                if pruned:
+                    continue
+                child_depth = depth + int(self.node_label_len[child])
+                lo = int(self.node_lo[child])
+                if child_row[-1] <= max_distance and self.token_offsets[lo + 1] - self.token_offsets[lo] == child_depth:
+                    matches.append(lo)
+                stack.append((child, child_row, child_depth))
+        return matches
+
+    def _postings(self, lo, hi):
+        return self.postings[self.posting_offsets[lo]:self.posting_offsets[hi]]
+
+    def _token_hits_uncached(self, word, as_prefix):
+        """(entry IDs, weights, unit weight) for one query token, or None if unknown"""
+        encoded = word.encode()
+        lo, hi = self.prefix_range(encoded)
+        exact = lo < hi and self._token(lo) == encoded
+        if exact and not (as_prefix and len(word) > 1):
+            idf = float(self.token_idf[lo])
+            entries = self._postings(lo, lo + 1)
+            return entries, np.full(len(entries), idf, dtype=np.float32), idf
+        if lo < hi and as_prefix and len(word) > 1:
+            counts = np.diff(self.posting_offsets[lo:hi + 1]).astype(np.int64)
+            quality = np.full(hi - lo, PREFIX_QUALITY, dtype=np.float32)
+            if exact:
+                quality[0] = 1.0
+            weights = np.repeat(self.token_idf[lo:hi] * quality, counts)
+            return self._postings(lo, hi), weights, float(self.token_idf[lo:hi].max())
+        if len(word) >= 4 and not word.isdigit():
+            candidates = self.fuzzy_tokens(encoded, 1 if len(word) < 8 else 2)
+            if candidates:
+                entries = np.concatenate([self._postings(t, t + 1) for t in candidates])
+                idf = self.token_idf[candidates]
+                weights = np.repeat(idf * FUZZY_QUALITY, [self.posting_offsets[t + 1] - self.posting_offsets[t] for t in candidates])
+                return entries, weights.astype(np.float32), float(idf.max())
+        return None
+
+    def _suggest_uncached(self, words, last_is_prefix, limit):
+        scores = np.zeros(len(self), dtype=np.float32)
+        covered = np.zeros(len(self), dtype=np.float32)
+        matched = np.zeros(len(self), dtype=np.float32)
+        known, unknown_words = 0.0, 0
+        for i, word in enumerate(words):
+            hits = self._token_hits(word, last_is_prefix and i == len(words) - 1)
+            if hits is None:
+                # House numbers, "near", "opp." and the like: not evidence either way
+                unknown_words += 1
+                continue
+            entries, weights, unit = hits
+            best = np.zeros(len(self), dtype=np.float32)
+            np.maximum.at(best, entries, weights)
+            scores += best
+            covered += unit * (best > 0)
+            matched += best > 0
+            known += unit
+        if not known:
+            return ()
+        candidates = np.flatnonzero(scores)
+        # Entries with words the query did not mention rank below exact
+        # namesakes, so "Mumbai" prefers Mumbai over Navi Mumbai
+        ranked = scores[candidates] * (matched[candidates] + 1) / (self.entry_tokens[candidates] + 1.0)
+        ranked += 0.01 * self.entry_prior[candidates]
+        order = np.argsort(-ranked)[:limit]
+        return tuple(
+            AddressMatch(
+                self._entry_label(e), self.kinds[self.entry_kind[e]],
+                float(self.entry_lat[e]), float(self.entry_lon[e]),
+                float(ranked[i]), float(covered[e] / known), unknown_words,
+            )
+            for i, e in zip(order.tolist(), candidates[order].tolist())
+        )
+
+    def _entry_label(self, entry):
+        start, end = self.label_offsets[entry], self.label_offsets[entry + 1]
+        return bytes(self.labels[start:end]).decode("utf-8")
+
+    def suggest(self, text, limit=5):
+        """Best local matches for a partly typed address, best first"""
+        words = tuple(tokenize(text))
+        if not words:
+            return []
+        last_is_prefix = not text[-1:].isspace() and text[-1:] not in ",."
+        return list(self._suggest(words, last_is_prefix, limit))
+
+    def resolve(self, text, min_coverage=MIN_COVERAGE, allow_coarse=False):
+        """Return the single confident match for a complete address, or None.
+
+        A city-level match for an address that also names things the index
+        does not know (a street, a building) is too coarse to trust unless
+        ``allow_coarse`` is set.
+        """
+        matches = self._suggest(tuple(tokenize(text)), False, 2)
+        if not matches or matches[0].coverage < min_coverage:
+            return None
+        best = matches[0]
+        if best.kind == "city" and best.unknown_words and not allow_coarse:
+            return None
+        if len(matches) > 1 and matches[1].score >= 0.95 * best.score:
+            distance = haversine_km(best.latitude, best.longitude, matches[1].latitude, matches[1].longitude)
+            if distance > SAME_PLACE_KM:
+                return None
+        return best
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_address_index():
+    """Return the process-wide address index, building it from the seed gazetteer if missing"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = os.getenv("ADDRESS_INDEX_PATH", DEFAULT_INDEX_PATH)
+                if not os.path.exists(path):
+                    build_index(load_address_sources([os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER)]), path)
+                _index = AddressIndex(path)
+                logger.info(f"Address index loaded with {len(_index)} entries from {path}")
+    return _index
+
+
+def resolve_address(text):
+    """Coordinates for a typed address, asking Nominatim only without a confident local match.
+
+    If Nominatim finds nothing either, a city-level local match is better
+    than no location at all.
+    """
+    index = get_address_index()
+    match = index.resolve(text)
+    if match is None:
+        try:
+            coordinates = get_geocoder().geocode(text)
+        except Exception as e:
+            logger.error(f"Address geocoding error: {e}")
+            coordinates = None
+        if coordinates:
+            metrics.inc("address_resolutions_total", 1, "Typed address resolutions by source", source="nominatim")
+            return coordinates
+        match = index.resolve(text, allow_coarse=True)
+    metrics.inc("address_resolutions_total", 1, "Typed address resolutions by source",
+                source="local" if match else "unresolved")
+    return (match.latitude, match.longitude) if match else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the local address index")
+    parser.add_argument("sources", nargs="+", help="gazetteer, postal code or landmark files")
+    parser.add_argument("-o", "--output", default=os.getenv("ADDRESS_INDEX_PATH", DEFAULT_INDEX_PATH))
+    args = parser.parse_args(argv)
+    build_index(load_address_sources(args.sources), args.output)
+
+
+if __name__ == "__main__":
+    import bootstrap  # noqa: F401  logging setup
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import os
+import html
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+import metrics
+from geocoding import get_geocoder, nominatim_enabled
+from offline_geocoder import get_offline_geocoder
+from address_index import resolve_address
+from telegram_client import get_client, TelegramError
+from photo_dedup import get_photo_index
+
+# Admin chat that receives alerts not routed to a regional chat; the bot
+# token is read by telegram_client
+ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
+
+# How long delivery waits for address lookups before leaving them out of the alert
+ALERT_GEOCODE_TIMEOUT = float(os.getenv("ALERT_GEOCODE_TIMEOUT", "5"))
+# Lookups answered from cache within this many seconds go into the first message, saving an edit
+ALERT_LOOKUP_GRACE = float(os.getenv("ALERT_LOOKUP_GRACE", "0.05"))
+
+logger = logging.getLogger(__name__)
+
+# Address lookups and photo uploads of an alert run here, off the delivery thread
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ALERT_WORKERS", "8")),
+    thread_name_prefix="alert",
+)
+
+
+def photo_bytes(photo):
+    """Accept either raw bytes or an uploaded file object"""
+    return photo.getvalue() if hasattr(photo, "getvalue") else photo
+
+
+def alert_chat(emergency_details):
+    """Admin chat for an alert: the one its route picked, or ADMIN_CHAT_ID"""
+    return (emergency_details.get('route') or {}).get('chat_id') or ADMIN_CHAT_ID
+
+
+def delivery_chat(emergency_details, progress):
+    """Chat an alert is delivered to: where it was posted, or where its route points"""
+    if "message_id" in progress:
+        # Alerts posted before routing existed have no chat_id and went to ADMIN_CHAT_ID
+        return progress.get("chat_id", ADMIN_CHAT_ID)
+    return alert_chat(emergency_details)
+
+
+def chat_delay(chat_id):
+    """Seconds a message to ``chat_id`` would wait for its Telegram quota right now"""
+    return get_client().rate_limiter.delay(chat_id)
+
+
+def send_photos(client, chat_id, uploaded_files, caption, **params):
+    """Send a report's photos as one album, skipping repeats and reusing delivered uploads.
+
+    Near-duplicates within the report are dropped and photos matching one
+    sent recently go out by file_id instead of being uploaded again.
+    """
+    index = get_photo_index()
+    planned = index.plan([photo_bytes(file) for file in uploaded_files])
+    try:
+        messages = client.send_media_group(chat_id, [photo.payload for photo in planned], caption=caption, **params)
+    except TelegramError as e:
+        reused = [photo for photo in planned if photo.file_id and photo.data is not None]
+        if not reused or e.error_code != 400:
+            raise
+        # A file_id Telegram no longer accepts: upload the bytes after all
+        logger.warning(f"Reused photo rejected, uploading instead: {e.description}")
+        index.forget(reused)
+        for photo in reused:
+            photo.file_id = None
+        # Only the rejected reuses fall back to bytes; bot photos have none and stay file_ids
+        messages = client.send_media_group(chat_id, [photo.payload for photo in planned], caption=caption, **params)
+    index.remember(planned, messages)
+    return messages
+
+
+def _coordinates(location):
+    """(latitude, longitude) of a "lat,lon" string or a dict with both keys"""
+    if isinstance(location, str):
+        lat, lon = map(float, location.split(','))
+        return lat, lon
+    return location.get('latitude'), location.get('longitude')
+
+
+def _reverse_address(lat, lon):
+    try:
+        return get_geocoder().reverse(lat, lon)
+    except Exception as geo_error:
+        logger.error(f"Geocoding error: {geo_error}")
+        return None
+
+
+def _address_coordinates(text_address):
+    try:
+        coordinates = resolve_address(text_address)
+        return list(coordinates) if coordinates else None
+    except Exception as geo_error:
+        logger.error(f"Address geocoding error: {geo_error}")
+        return None
+
+
+def _start_lookups(emergency_details):
+    futures = {}
+    if emergency_details.get('current_location') and nominatim_enabled():
+        try:
+            lat, lon = _coordinates(emergency_details['current_location'])
+            futures["address"] = _executor.submit(_reverse_address, lat, lon)
+        except Exception as loc_error:
+            logger.error(f"Location parsing error: {loc_error}")
+    if emergency_details.get('text_address'):
+        futures["address_coordinates"] = _executor.submit(_address_coordinates, emergency_details['text_address'])
+    return futures
+
+
+def _collect_lookups(futures, deadline=None):
+    addresses = {}
+    for name, future in futures.items():
+        try:
+            addresses[name] = future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            metrics.inc("alert_lookups_timed_out_total", 1, "Address lookups not finished by the alert deadline",
+                        lookup=name)
+            logger.warning(f"Alert {name} lookup missed its deadline")
+    return addresses
+
+
+def lookup_addresses(emergency_details, timeout=None):
+    """Geocode an alert's location and typed address concurrently, waiting at most ``timeout`` seconds.
+
+    Returns a JSON-serializable dict with the reverse geocoded ``address``
+    and the ``address_coordinates`` of the typed address. A lookup that has
+    not finished in time is left out, but keeps running so its result lands
+    in the geocoding cache.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    return _collect_lookups(_start_lookups(emergency_details), deadline)
+
+
+def build_alert_message(emergency_details, addresses=None):
+    """Compose the admin alert text, enriched with geocoded addresses where available.
+
+    ``addresses`` comes from ``lookup_addresses``; pass ``{}`` for the core
+    alert that needs no network lookups. When omitted, lookups run inline.
+    """
+    if addresses is None:
+        addresses = lookup_addresses(emergency_details)
+
+    alert_message = (
+        "🚨 NEW EMERGENCY ALERT 🚨\n\n"
+        f"Type: {emergency_details['type']}\n"
+        f"Time: {emergency_details['time']}\n"
+    )
+    assessment = emergency_details.get('triage')
+    if assessment:
+        alert_message += f"⚠️ Severity: {assessment['level'].upper()} ({assessment['score']})"
+        if assessment.get('reasons'):
+            alert_message += f" · {', '.join(assessment['reasons'])}"
+        alert_message += "\n"
+    route = emergency_details.get('route')
+    if route is not None:
+        areas = ", ".join(html.escape(name) for name in route['areas'])
+        alert_message += f"🧭 Area: {areas or 'outside all service areas'}\n"
+    if emergency_details.get('description'):
+        # Free text from the reporter; the alert is sent with parse_mode=HTML
+        alert_message += f"📝 Description: {html.escape(emergency_details['description'])}\n"
+    alert_message += "\n"
+
+    # Handle location information
+    if emergency_details.get('current_location'):
+        try:
+            lat, lon = _coordinates(emergency_details['current_location'])
+
+            # Create Google Maps link
+            maps_link = f"https://www.google.com/maps?q={lat},{lon}"
+
+            # Add location information to message
+            alert_message += (
+                f"📍 Location Coordinates: {lat}, {lon}\n"
+                f"🗺️ Google Maps: {maps_link}\n"
+            )
+
+            # Nearest locality from the local gazetteer never needs the network
+            place = get_offline_geocoder().reverse(lat, lon)
+            if place:
+                alert_message += f"🏙️ Nearest Locality: {html.escape(place.describe())}\n"
+
+            if addresses.get("address"):
+                alert_message += f"📌 Reverse Geocoded Address: {html.escape(addresses['address'])}\n"
+
+        except Exception as loc_error:
+            logger.error(f"Location parsing error: {loc_error}")
+            alert_message += f"📍 Location (raw): {html.escape(str(emergency_details['current_location']))}\n"
+
+    if emergency_details.get('text_address'):
+        # Typed by the reporter or sent by a partner, so escaped like the description
+        alert_message += f"🏠 Provided Address: {html.escape(emergency_details['text_address'])}\n"
+        coordinates = addresses.get("address_coordinates")
+        if coordinates:
+            maps_link = f"https://www.google.com/maps?q={coordinates[0]},{coordinates[1]}"
+            alert_message += f"🗺️ Address Google Maps: {maps_link}\n"
+
+    if emergency_details.get('photos_unavailable'):
+        alert_message += f"📷 {emergency_details['photos_unavailable']} photo(s) unavailable\n"
+
+    return alert_message
+
+
+def deliver_alert(emergency_details, uploaded_files, progress=None):
+    """Deliver an alert, skipping stages already recorded in ``progress``.
+
+    The core alert (type, time, coordinates and map link) is sent before
+    anything that needs the network, unless the address lookups are answered
+    from cache within ``ALERT_LOOKUP_GRACE``. Address lookups and the photo upload
+    then run concurrently, and addresses found within
+    ``ALERT_GEOCODE_TIMEOUT`` seconds of the start are added by editing the
+    alert. Photos are always waited for, as retrying them is the outbox's job.
+
+    The alert goes to the chat its route picked; ``progress`` records it with
+    the message, so later edits and photos follow the message even if the
+    alert is re-routed. ``progress`` is updated in place as each stage
+    succeeds, so a caller that persists it can retry without re-sending what
+    already went out. Raises on failure.
+    """
+    progress = {} if progress is None else progress
+    client = get_client()
+    started = time.monotonic()
+    chat_id = delivery_chat(emergency_details, progress)
+
+    lookups = None if "addresses" in progress else _start_lookups(emergency_details)
+    if lookups is not None and "message_id" not in progress:
+        if not wait(lookups.values(), ALERT_LOOKUP_GRACE).not_done:
+            progress["addresses"] = _collect_lookups(lookups)
+            lookups = None
+
+    # Send text message
+    if "message_id" not in progress:
+        result = client.send_message(
+            chat_id, build_alert_message(emergency_details, progress.get("addresses", {})), parse_mode="HTML"
+        )
+        progress["message_id"] = result["message_id"]
+        progress["chat_id"] = chat_id
+        metrics.observe("alert_first_notification_seconds", time.monotonic() - started,
+                        "Time from delivery start until the admin chat has the core alert")
+
+    # Send photos if any, as a single album, while the addresses resolve
+    photos = None
+    if uploaded_files and not progress.get("photos_sent"):
+        photos = _executor.submit(send_photos, client, chat_id, uploaded_files, caption="Emergency situation photo")
+
+    try:
+        if lookups is not None:
+            addresses = _collect_lookups(lookups, started + ALERT_GEOCODE_TIMEOUT)
+            if any(addresses.values()):
+                client.edit_message_text(
+                    chat_id, progress["message_id"], build_alert_message(emergency_details, addresses),
+                    parse_mode="HTML",
+                )
+            progress["addresses"] = addresses
+    except TelegramError as e:
+        # The alert already went out; a missing address is not worth a retry
+        logger.error(f"Could not add addresses to alert: {e}")
+        progress["addresses"] = {}
+    finally:
+        if photos is not None:
+            photos.result()
+            progress["photos_sent"] = True
+
+    return progress
+
+
+def build_incident_update(parent_details, emergency_details, addresses=None):
+    """The original alert text followed by the running report count of its incident"""
+    incident = emergency_details['incident']
+    message = build_alert_message(parent_details, addresses)
+    message += f"\n👥 Reports: {incident['reports']} (latest at {emergency_details['time']})\n"
+    if emergency_details.get('text_address') and emergency_details['text_address'] != parent_details.get('text_address'):
+        message += f"🏠 Latest Provided Address: {html.escape(emergency_details['text_address'])}\n"
+    return message
+
+
+def deliver_incident_update(emergency_details, uploaded_files, parent_details, parent_progress,
+                            progress=None, edit=True):
+    """Fold a report into the alert already posted for its incident.
+
+    The original message is edited to show the report count instead of a new
+    alert being sent, and any photos are posted as a reply to it, in the chat
+    the alert went to. ``edit`` is False when a newer report for the same
+    incident will carry the edit.
+    """
+    progress = {} if progress is None else progress
+    client = get_client()
+    message_id = parent_progress["message_id"]
+    chat_id = parent_progress.get("chat_id", ADMIN_CHAT_ID)
+
+    if edit and not progress.get("edited"):
+        try:
+            client.edit_message_text(
+                chat_id, message_id,
+                # Lookups that missed the alert's deadline are retried, from the cache by now
+                build_incident_update(parent_details, emergency_details, parent_progress.get("addresses") or None),
+                parse_mode="HTML",
+            )
+        except TelegramError as e:
+            # A report that arrives out of order can produce identical text
+            if "message is not modified" not in str(e.description):
+                raise
+        progress["edited"] = True
+
+    if uploaded_files and not progress.get("photos_sent"):
+        send_photos(
+            client, chat_id, uploaded_files,
+            caption=f"Photo from report #{emergency_details['incident']['reports']}",
+            reply_to_message_id=message_id,
+        )
+        progress["photos_sent"] = True
+
+    return progress
+
+
+def send_emergency_alert_to_admin(emergency_details, uploaded_files):
+    """Send emergency details and images to admin chat"""
+    try:
+        deliver_alert(emergency_details, uploaded_files)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send emergency alert: {e}")
+        return False
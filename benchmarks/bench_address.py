@@ -0,0 +1,97 @@
+"""Address autocomplete latency and index size at national postal-code scale.
+
+    python benchmarks/bench_address.py [--postal IN.txt] [--places 150000]
+
+Uses a GeoNames postal code dump when given, otherwise a synthetic one of
+--places localities with made-up names, then replays typing of addresses
+keystroke by keystroke and times suggest() for each prefix.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from address_index import AddressIndex, build_index, load_address_sources  # noqa: E402
+from offline_geocoder import DEFAULT_GAZETTEER  # noqa: E402
+
+SYLLABLES = ["ra", "ma", "pur", "nag", "ga", "bad", "kot", "ha", "li", "sha", "van", "dev", "ja", "ni", "khe", "da"]
+STATES = ["Maharashtra", "Karnataka", "Tamil Nadu", "Uttar Pradesh", "West Bengal", "Gujarat", "Kerala"]
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e3
+    return f"p50 {np.percentile(samples, 50):.2f} ms, p99 {np.percentile(samples, 99):.2f} ms, max {samples[-1]:.2f} ms"
+
+
+def synthetic_postal(path, count, rng):
+    def name():
+        return "".join(rng.choice(SYLLABLES, size=rng.integers(2, 5))).capitalize()
+
+    districts = [name() for _ in range(700)]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            district = districts[rng.integers(len(districts))]
+            state = STATES[rng.integers(len(STATES))]
+            lat, lon = rng.uniform(8, 35), rng.uniform(68, 97)
+            f.write(f"IN\t{110000 + i % 750000}\t{name()} {name()}\t{state}\t\t{district}\t\t{district}\t\t"
+                    f"{lat:.4f}\t{lon:.4f}\t4\n")
+
+
+def typed_queries(index, rng, count):
+    """Labels of random entries with a house number and a typo, as a user would type them"""
+    queries = []
+    for entry in rng.integers(len(index), size=count):
+        label = index._entry_label(int(entry)).split(",")
+        text = f"{rng.integers(1, 200)} {', '.join(label[:2])}"
+        position = rng.integers(4, len(text))
+        queries.append(text[:position] + text[position + 1:])
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--postal", help="GeoNames postal code dump, e.g. IN.txt")
+    parser.add_argument("--places", type=int, default=150000, help="size of the synthetic postal dump")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as workdir:
+        postal = args.postal
+        if postal is None:
+            postal = os.path.join(workdir, "postal.txt")
+            synthetic_postal(postal, args.places, rng)
+        index_path = os.path.join(workdir, "address_index.bin")
+
+        started = time.perf_counter()
+        build_index(load_address_sources([DEFAULT_GAZETTEER, postal]), index_path)
+        print(f"index built in {time.perf_counter() - started:.1f} s, {os.path.getsize(index_path) / 2 ** 20:.1f} MiB on disk")
+
+        tracemalloc.start()
+        index = AddressIndex(index_path)
+        heap, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{len(index)} entries mapped, {heap / 1024:.0f} KB on the Python heap")
+
+        keystrokes, resolves, resolved = [], [], 0
+        for query in typed_queries(index, rng, args.queries):
+            index._suggest.cache_clear()
+            index._token_hits.cache_clear()
+            for end in range(1, len(query) + 1):
+                started = time.perf_counter()
+                index.suggest(query[:end])
+                keystrokes.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            resolved += index.resolve(query) is not None
+            resolves.append(time.perf_counter() - started)
+        print(f"  suggest per keystroke ({len(keystrokes)}): {percentiles(keystrokes)}")
+        print(f"  resolve ({resolved}/{len(resolves)} confident): {percentiles(resolves)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Time to the first admin notification when Nominatim is slow.
+
+    python benchmarks/bench_alert_fanout.py [--nominatim-latency 2] [--alerts 5]
+
+Delivers alerts with a location, a typed address and photos against stub
+servers, once the old sequential way (geocode, then send the text, then the
+photos) and once through ``alerts.deliver_alert``, which sends the core
+alert first and adds the addresses by editing it. Every alert uses fresh
+coordinates and address text so the geocoding cache never answers.
+"""
+import io
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from statistics import median
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import TelegramStub, NominatimStub  # noqa: E402
+
+
+class TimingTelegramStub(TelegramStub):
+    """Records when each Bot API method was first called since ``reset``"""
+
+    def reset(self):
+        with self._lock:
+            self.started, self.first_call = time.monotonic(), {}
+
+    def respond(self, endpoint, query, body, headers):
+        with self._lock:
+            self.first_call.setdefault(endpoint, time.monotonic() - self.started)
+        return super().respond(endpoint, query, body, headers)
+
+
+def photo(seed):
+    image = Image.new("RGB", (800, 600), (seed * 40 % 256, 90, 160))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def details(i):
+    return {
+        "type": "Accident",
+        "time": "2024-01-01 12:00:00",
+        "current_location": {"latitude": 19.0 + i * 0.01, "longitude": 72.8 + i * 0.01},
+        "text_address": f"Gate {i}, Unknown Industrial Estate, Mumbai",
+    }
+
+
+def sequential(alerts, emergency_details, photos):
+    # Delivery before the fan-out: lookups inline, then each send in turn
+    client = alerts.get_client()
+    client.send_message(alerts.ADMIN_CHAT_ID, alerts.build_alert_message(emergency_details), parse_mode="HTML")
+    client.send_media_group(alerts.ADMIN_CHAT_ID, photos, caption="Emergency situation photo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nominatim-latency", type=float, default=2.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--geocode-timeout", type=float, default=5.0)
+    parser.add_argument("--alerts", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    telegram = TimingTelegramStub(latency=args.telegram_latency).start()
+    nominatim = NominatimStub(latency=args.nominatim_latency).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.update({
+            "TELEGRAM_BOT_TOKEN": "123:stub",
+            "TELEGRAM_API_BASE": telegram.url,
+            "TELEGRAM_CHAT_RATE": "1000000",
+            "TELEGRAM_GLOBAL_RATE": "1000000",
+            "ADMIN_CHAT_ID": "1",
+            "NOMINATIM_DOMAIN": nominatim.netloc,
+            "NOMINATIM_SCHEME": "http",
+            "NOMINATIM_MIN_INTERVAL": "0",
+            "GEOCODE_CACHE_PATH": os.path.join(workdir, "geocode.sqlite3"),
+            "ADDRESS_INDEX_PATH": os.path.join(workdir, "address_index.bin"),
+            "NOMINATIM_TIMEOUT": "30",
+            "ALERT_GEOCODE_TIMEOUT": str(args.geocode_timeout),
+        })
+        import alerts
+
+        photos = [photo(i) for i in range(3)]
+        for label, deliver in (
+            ("sequential", lambda i: sequential(alerts, details(i), photos)),
+            ("fan-out", lambda i: alerts.deliver_alert(details(1000 + i), photos)),
+        ):
+            first, total, edits = [], [], 0
+            for i in range(args.alerts):
+                telegram.reset()
+                started = time.monotonic()
+                deliver(i)
+                total.append(time.monotonic() - started)
+                first.append(telegram.first_call["sendMessage"])
+                edits += "editMessageText" in telegram.first_call
+            print(f"{label:10s}: first admin notification {median(first) * 1e3:6.0f} ms, "
+                  f"delivery done {median(total) * 1e3:6.0f} ms, {edits}/{args.alerts} address edits")
+        # Lookups that missed the deadline still write to the geocoding cache in workdir
+        alerts._executor.shutdown(wait=True)
+
+    telegram.stop()
+    nominatim.stop()
+
+
+if __name__ == "__main__":
+    main()
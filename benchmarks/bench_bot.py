@@ -0,0 +1,179 @@
+"""Telegram intake under many concurrent conversations, against a local fake Bot API.
+
+    python benchmarks/bench_bot.py [--chats 300] [--think 0.2] [--latency 0.02]
+
+Every simulated user walks the whole flow (/start, type, location or typed
+address, one photo, a description, Done, confirm), answering each bot reply after --think
+seconds. All conversations start at once. Reports per-reply latency, total
+throughput, whether every confirmed report reached the admin chat and how
+many photos were uploaded rather than forwarded by file_id (should be 0).
+"""
+import io
+import os
+import sys
+import time
+import heapq
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import BotApiStub, NominatimStub  # noqa: E402
+from run import configure_environment  # noqa: E402
+
+ADDRESSES = ["Andheri, Mumbai", "Koramangala, Bengaluru", "Connaught Place, Delhi", "Salt Lake, Kolkata"]
+DESCRIPTIONS = ["He collapsed and is not breathing", "Minor injuries, everyone is stable", "Smoke from the kitchen"]
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e3
+    return f"p50 {np.percentile(samples, 50):.0f} ms, p99 {np.percentile(samples, 99):.0f} ms, max {samples[-1]:.0f} ms"
+
+
+def jpeg_bytes():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (1280, 960), (200, 60, 40)).save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+class Driver:
+    """Simulated users: each answers the bot's last reply after a think time"""
+
+    def __init__(self, telegram, chats, think, emergency_types, confirm_text, rng):
+        self.telegram = telegram
+        self.think = think
+        self.confirm_text = confirm_text
+        self.scripts = {}
+        self.confirm_keys = []
+        self.latencies = []
+        self.completed = 0
+        self._sent_at = {}
+        self._message_id = 0
+        self._due = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self.finished = threading.Event()
+        self.total = chats
+        for chat_id in range(1000, 1000 + chats):
+            if chat_id % 2:
+                location = {"location": {"latitude": float(rng.uniform(8, 30)), "longitude": float(rng.uniform(70, 90))}}
+            else:
+                location = {"text": ADDRESSES[chat_id % len(ADDRESSES)]}
+            self.scripts[chat_id] = [
+                {"text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}]},
+                {"text": emergency_types[chat_id % len(emergency_types)]},
+                location,
+                {"photo": [{"file_id": f"photo-{chat_id}", "file_unique_id": f"u{chat_id}", "width": 1280,
+                            "height": 960}]},
+                {"text": DESCRIPTIONS[chat_id % len(DESCRIPTIONS)]},
+                {"text": "Done"},
+                {"text": confirm_text},
+            ]
+
+    def _send(self, chat_id):
+        fields = self.scripts[chat_id].pop(0)
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        if fields.get("text") == self.confirm_text:
+            self.confirm_keys.append(f"telegram-{chat_id}-{message_id}")
+        self._sent_at[chat_id] = time.perf_counter()
+        self.telegram.push_update({
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"},
+            **fields,
+        })
+
+    def on_send(self, chat_id, params):
+        sent_at = self._sent_at.pop(chat_id, None)
+        if sent_at is None:
+            return
+        self.latencies.append(time.perf_counter() - sent_at)
+        if not self.scripts[chat_id]:
+            with self._lock:
+                self.completed += 1
+                if self.completed == self.total:
+                    self.finished.set()
+            return
+        with self._lock:
+            heapq.heappush(self._due, (time.perf_counter() + self.think, chat_id))
+            self._wakeup.notify()
+
+    def run(self):
+        """Start every conversation, then answer replies as their think time passes"""
+        for chat_id in self.scripts:
+            self._send(chat_id)
+        while not self.finished.is_set():
+            with self._lock:
+                if not self._due:
+                    self._wakeup.wait(0.1)
+                    continue
+                due, chat_id = self._due[0]
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    self._wakeup.wait(wait)
+                    continue
+                heapq.heappop(self._due)
+            self._send(chat_id)
+
+
+async def run_bot(bot, base_url, driver, timeout):
+    application = bot.build_application("123:stub", base_url)
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=1)
+        driver_thread = threading.Thread(target=driver.run, daemon=True)
+        driver_thread.start()
+        await asyncio.to_thread(driver.finished.wait, timeout)
+        await application.updater.stop()
+        await application.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--think", type=float, default=0.2, help="seconds a user takes to answer")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added per Bot API call")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    telegram = BotApiStub(latency=args.latency, file_bytes=jpeg_bytes()).start()
+    nominatim = NominatimStub(latency=0.05).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(telegram, nominatim, workdir)
+        import bot
+        from dispatch import get_ticket
+        from ingest import wait_for_delivery
+
+        driver = Driver(telegram, args.chats, args.think, list(bot.EMERGENCY_CAPABILITIES), bot.CONFIRM_ALERT, rng)
+        telegram.on_send = driver.on_send
+
+        started = time.perf_counter()
+        asyncio.run(run_bot(bot, telegram.url, driver, args.timeout))
+        elapsed = time.perf_counter() - started
+        print(f"{driver.completed}/{args.chats} conversations finished in {elapsed:.1f} s "
+              f"({len(driver.latencies) / elapsed:.0f} updates/s, think time {args.think} s)")
+        print(f"  bot reply latency ({len(driver.latencies)}): {percentiles(driver.latencies)}")
+
+        started = time.perf_counter()
+        pending = wait_for_delivery(driver.confirm_keys, args.timeout)
+        sent = sum(get_ticket(key).status == "sent" for key in driver.confirm_keys)
+        print(f"  {sent}/{len(driver.confirm_keys)} alerts delivered to the admin chat "
+              f"{time.perf_counter() - started:.1f} s after the last confirmation, {len(pending)} pending")
+        print(f"  {telegram.uploads} photo(s) uploaded, {telegram.requests['download']} downloaded")
+        print(f"  peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    telegram.stop()
+    nominatim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Nearest-unit ETA query and position update latency for large fleets.
+
+    python benchmarks/bench_eta.py [--units 10000] [--queries 10000]
+
+Builds a synthetic fleet of ambulances, fire units and hospitals spread over
+India, then times k-nearest queries for every emergency type and in-place
+position updates of moving units. Every query is checked against a scan of
+the whole fleet, also on a sparse fleet (2% maternity units) and a uniform
+one around latitude 60; the run exits non-zero on any mismatch.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eta import EtaEngine, EMERGENCY_CAPABILITIES, DEFAULT_SPEED_KMH  # noqa: E402
+from offline_geocoder import haversine_km  # noqa: E402
+
+LAT_RANGE = (8.0, 35.0)
+LON_RANGE = (68.0, 97.0)
+# Far enough north that a degree of longitude is half a degree of latitude
+NORTH_LAT_RANGE = (55.0, 65.0)
+
+UNIT_TEMPLATES = [
+    ("ambulance", {"ambulance"}),
+    ("ambulance", {"ambulance", "cardiac"}),
+    ("ambulance", {"ambulance", "trauma"}),
+    ("fire", {"fire"}),
+    ("hospital", {"ambulance", "maternity", "cardiac", "trauma"}),
+]
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e6
+    return f"p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us, max {samples[-1]:.1f} us"
+
+
+def synthetic_fleet(rng, count, lat_range=LAT_RANGE, templates=UNIT_TEMPLATES, weights=None):
+    lats, lons = rng.uniform(*lat_range, count), rng.uniform(*LON_RANGE, count)
+    kinds = rng.choice(len(templates), size=count, p=weights)
+    return [
+        (f"unit-{i}", *templates[kinds[i]], float(lats[i]), float(lons[i]))
+        for i in range(count)
+    ]
+
+
+def mismatches(engine, fleet, points, k):
+    """Queries whose arrival times differ from the k best of a scan over every unit"""
+    lats = np.array([unit[3] for unit in fleet])
+    lons = np.array([unit[4] for unit in fleet])
+    speeds = np.array([engine.speeds.get(unit[1], DEFAULT_SPEED_KMH) for unit in fleet])
+    wrong = 0
+    for emergency_type, wanted in EMERGENCY_CAPABILITIES.items():
+        suitable = np.array([bool(unit[2] & wanted) for unit in fleet])
+        for lat, lon in points:
+            found = [match.eta_minutes for match in engine.nearest(lat, lon, emergency_type, k=k)]
+            minutes = engine.turnout_minutes + haversine_km(lat, lon, lats[suitable], lons[suitable]) * \
+                engine.detour_factor / speeds[suitable] * 60
+            wrong += not np.allclose(found, np.sort(minutes)[:k])
+    return wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--units", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--checked", type=int, default=500, help="queries per fleet checked against a full scan")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    fleet = synthetic_fleet(rng, args.units)
+    started = time.perf_counter()
+    engine = EtaEngine(fleet)
+    print(f"{len(engine)} units indexed in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    points = np.column_stack((rng.uniform(*LAT_RANGE, args.queries), rng.uniform(*LON_RANGE, args.queries)))
+    for emergency_type in EMERGENCY_CAPABILITIES:
+        timings = []
+        for lat, lon in points:
+            started = time.perf_counter()
+            engine.nearest(lat, lon, emergency_type, k=args.k)
+            timings.append(time.perf_counter() - started)
+        print(f"  nearest {args.k} for {emergency_type}: {percentiles(timings)}")
+
+    # Units drift by up to ~5 km per update, sometimes across cell borders
+    moves = rng.integers(args.units, size=args.queries)
+    deltas = rng.uniform(-0.05, 0.05, size=(args.queries, 2))
+    timings = []
+    for slot, (dlat, dlon) in zip(moves.tolist(), deltas):
+        unit_id, _, _, lat, lon = fleet[slot]
+        started = time.perf_counter()
+        engine.update_position(unit_id, lat + dlat, lon + dlon)
+        timings.append(time.perf_counter() - started)
+    print(f"  update_position: {percentiles(timings)}")
+
+    # Checked after the moves, so the index has been updated in place
+    fleet = [(unit_id, kind, capabilities, float(engine._lats[engine._slots[unit_id]]),
+              float(engine._lons[engine._slots[unit_id]])) for unit_id, kind, capabilities, _, _ in fleet]
+    sparse = synthetic_fleet(rng, args.units, templates=UNIT_TEMPLATES[:4] + [("hospital", {"maternity"})],
+                             weights=[0.245, 0.245, 0.245, 0.245, 0.02])
+    north = synthetic_fleet(rng, args.units, lat_range=NORTH_LAT_RANGE)
+    north_points = np.column_stack((rng.uniform(*NORTH_LAT_RANGE, args.checked),
+                                    rng.uniform(*LON_RANGE, args.checked)))
+    wrong = {
+        "fleet": mismatches(engine, fleet, points[:args.checked], args.k),
+        "2% maternity": mismatches(EtaEngine(sparse), sparse, points[:args.checked], 1),
+        "lat 55-65": mismatches(EtaEngine(north), north, north_points, args.k),
+    }
+    print("mismatches against a full scan: " + ", ".join(f"{name} {count}" for name, count in wrong.items()))
+    if any(wrong.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
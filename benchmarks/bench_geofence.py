@@ -0,0 +1,134 @@
+"""Geofence build time, point lookup latency and batch re-routing throughput.
+
+    python benchmarks/bench_geofence.py [--states 6] [--districts 30] [--vertices 200] [--queries 20000]
+
+Builds two overlapping synthetic tilings of India, coarse "states" and fine
+"districts", from a jittered lattice whose shared borders are wiggly
+polylines of ``--vertices`` points, so neighbouring areas meet exactly as
+real boundaries do. Lookups are checked against a brute-force even-odd test
+over every edge, and include points offshore and across the border.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geofence import Area, GeofenceIndex, route_for, _ray_inside  # noqa: E402
+
+LAT_RANGE = (8.0, 35.0)
+LON_RANGE = (68.0, 97.0)
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e6
+    return f"p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us, max {samples[-1]:.1f} us"
+
+
+def tiling(rng, cells, vertices, level, chat_prefix):
+    """Areas tiling LAT/LON_RANGE on a jittered ``cells`` x ``cells`` lattice with wiggly shared borders"""
+    lons = np.linspace(*LON_RANGE, cells + 1)
+    lats = np.linspace(*LAT_RANGE, cells + 1)
+    grid = np.stack(np.meshgrid(lons, lats), axis=-1)
+    jitter = 0.3 * (LON_RANGE[1] - LON_RANGE[0]) / cells
+    grid[1:-1, 1:-1] += rng.uniform(-jitter, jitter, (cells - 1, cells - 1, 2))
+    borders = {}
+
+    def border(a, b):
+        # Shared by the two areas on either side, so generated once per lattice edge
+        key = (a, b) if a < b else (b, a)
+        if key not in borders:
+            start, end = grid[key[0]], grid[key[1]]
+            t = np.linspace(0, 1, vertices)[:, None]
+            normal = np.array([-(end - start)[1], (end - start)[0]])
+            wiggle = np.sin(np.outer(t[:, 0], rng.uniform(3, 12, 3)) * np.pi).sum(axis=1) * 0.01 * t[:, 0] * (1 - t[:, 0])
+            points = start + t * (end - start) + wiggle[:, None] * normal
+            on_outline = all(i in (0, cells) for i in (key[0][0], key[1][0])) or \
+                all(j in (0, cells) for j in (key[0][1], key[1][1]))
+            borders[key] = np.linspace(start, end, 2) if on_outline else points
+        points = borders[key]
+        return points if key == (a, b) else points[::-1]
+
+    boundaries = []
+    for i in range(cells):
+        for j in range(cells):
+            corners = [(i, j), (i, j + 1), (i + 1, j + 1), (i + 1, j)]
+            ring = np.concatenate([border(corners[k], corners[(k + 1) % 4])[:-1] for k in range(4)])
+            name = f"{level} {i}-{j}"
+            chat = f"{chat_prefix}{i * cells + j}" if rng.random() < 0.8 else None
+            boundaries.append((Area(name, level, chat), [np.vstack([ring, ring[:1]])]))
+    return boundaries
+
+
+def brute_force(boundaries, lats, lons):
+    found = [[] for _ in lats]
+    for number, (_, rings) in enumerate(boundaries):
+        edges = np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings])
+        x1, y1, x2, y2 = (column[None, :] for column in edges.T)
+        inside = _ray_inside(lons[:, None], lats[:, None], x1, y1, x2, y2)
+        for point in np.flatnonzero(inside).tolist():
+            found[point].append(number)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--states", type=int, default=6, help="states per side of the lattice")
+    parser.add_argument("--districts", type=int, default=30, help="districts per side of the lattice")
+    parser.add_argument("--vertices", type=int, default=200, help="points on each shared border")
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=200000, help="incidents re-routed in one batch")
+    parser.add_argument("--cell-size", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(23)
+    boundaries = tiling(rng, args.states, args.vertices, "state", "-100") + \
+        tiling(rng, args.districts, args.vertices, "district", "-200")
+    edges = sum(len(ring) - 1 for _, rings in boundaries for ring in rings)
+    started = time.perf_counter()
+    index = GeofenceIndex(boundaries, cell_size=args.cell_size)
+    crossed = sum(entry[1] is not None for entry in index._cells.values())
+    print(f"{len(index)} areas, {edges:,} edges indexed in {(time.perf_counter() - started) * 1000:.0f} ms: "
+          f"{len(index._cells):,} cells, {crossed:,} on a boundary")
+
+    # A margin around the tiling, so some points are outside every area
+    lats = rng.uniform(LAT_RANGE[0] - 2, LAT_RANGE[1] + 2, args.queries)
+    lons = rng.uniform(LON_RANGE[0] - 2, LON_RANGE[1] + 2, args.queries)
+    # Points within metres of a border, where the edge test decides
+    near = rng.integers(len(boundaries), size=args.queries // 4)
+    for k, number in enumerate(near.tolist()):
+        ring = boundaries[number][1][0]
+        vertex = rng.integers(len(ring) - 1)
+        lons[k], lats[k] = ring[vertex] + rng.normal(0, 1e-4, 2)
+
+    index.locate(float(lats[0]), float(lons[0]))
+    timings, results = [], []
+    for lat, lon in zip(lats.tolist(), lons.tolist()):
+        started = time.perf_counter()
+        results.append(index.locate(lat, lon))
+        timings.append(time.perf_counter() - started)
+    print(f"locate: {percentiles(timings)}; "
+          f"{sum(not areas for areas in results)} of {args.queries} points outside every area")
+
+    positions = {id(area): number for number, area in enumerate(index.areas)}
+    expected = brute_force(boundaries, lats, lons)
+    wrong = sum(sorted(positions[id(area)] for area in areas) != sorted(truth)
+                for areas, truth in zip(results, expected))
+    batch_results = index.locate_many(lats, lons)
+    batch_wrong = sum([id(a) for a in one] != [id(a) for a in many] for one, many in zip(results, batch_results))
+    print(f"mismatches against brute force: {wrong}; batch vs single: {batch_wrong}")
+
+    lats = rng.uniform(*LAT_RANGE, args.batch)
+    lons = rng.uniform(*LON_RANGE, args.batch)
+    started = time.perf_counter()
+    routes = [route_for(areas) for areas in index.locate_many(lats, lons)]
+    elapsed = time.perf_counter() - started
+    regional = sum(route["chat_id"] is not None for route in routes)
+    print(f"re-routed {args.batch:,} incidents in {elapsed * 1000:.0f} ms "
+          f"({args.batch / elapsed:,.0f}/s), {regional:,} to a regional chat")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Admin incident map refresh cost with tens of thousands of open incidents.
+
+    python benchmarks/bench_incident_map.py [--incidents 20000] [--churn 20]
+
+Loads synthetic incidents into a scratch incident store, then times the
+initial sync, an incremental sync after a few changes, server-side
+clustering for typical viewports and the size of the layer sent to the
+browser, against drawing every incident as its own folium marker. Finally
+it opens, resolves and ages out batches of incidents and checks that the
+map's slots stay bounded and that it still matches one built from scratch;
+the run exits non-zero if either check fails.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import warnings
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from incident_store import SqliteIncidentStore, IncidentRecord, REPORTED, NOTIFIED, FAILED, RESOLVED  # noqa: E402
+from incident_map import IncidentMap  # noqa: E402
+import map_render  # noqa: E402
+
+# (name, (south, west, north, east), zoom)
+VIEWS = [
+    ("country", (6.0, 66.0, 36.0, 92.0), 5),
+    ("state", (17.0, 72.0, 21.0, 77.0), 8),
+    ("city", (18.85, 72.75, 19.3, 73.05), 12),
+    ("street", (19.05, 72.85, 19.07, 72.88), 16),
+]
+
+
+def timed(fn, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, min(samples) * 1e3
+
+
+def layer_bytes(layer):
+    figure = map_render.base_map((20.59, 78.96), 5)
+    layer.add_to(figure)
+    return len(figure.get_root().render())
+
+
+def churn(store, incident_map, rounds, size):
+    """Open and resolve ``size`` incidents per round and add ``size`` already expired; return the peak slot count"""
+    peak = 0
+    for round_ in range(rounds):
+        stale = time.time() - 2 * incident_map.window
+        store.put_many(
+            [IncidentRecord(f"open{round_}-{i}", "Fire", latitude=19.0 + i * 1e-4, longitude=72.9) for i in range(size)]
+            + [IncidentRecord(f"stale{round_}-{i}", "Accident", latitude=20.0, longitude=73.0 + i * 1e-4,
+                              created_at=stale) for i in range(size)]
+        )
+        incident_map.sync(store)
+        peak = max(peak, len(incident_map._lats))
+        store.update_status([(f"open{round_}-{i}", RESOLVED) for i in range(size)])
+        incident_map.sync(store)
+    return peak
+
+
+def single_markers(incident_map):
+    return sorted((feature["properties"]["id"], feature["properties"]["status"], feature["properties"]["reports"],
+                   tuple(feature["geometry"]["coordinates"]))
+                  for feature in incident_map.features(zoom=16)["features"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--incidents", type=int, default=20000)
+    parser.add_argument("--churn", type=int, default=20, help="rounds of opening and closing incidents")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    rng = np.random.default_rng(3)
+    # Half spread across the country, half concentrated around one city
+    lats = np.concatenate([rng.uniform(8, 32, args.incidents // 2), rng.normal(19.07, 0.1, args.incidents - args.incidents // 2)])
+    lons = np.concatenate([rng.uniform(70, 90, args.incidents // 2), rng.normal(72.88, 0.1, args.incidents - args.incidents // 2)])
+    statuses = (REPORTED, NOTIFIED, FAILED)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store = SqliteIncidentStore(os.path.join(workdir, "incidents.sqlite3"))
+        store.put_many([
+            IncidentRecord(f"r{i}", "Fire" if i % 2 else "Accident", statuses[i % 3], float(lat), float(lon))
+            for i, (lat, lon) in enumerate(zip(lats, lons))
+        ])
+
+        incident_map = IncidentMap()
+        started = time.perf_counter()
+        incident_map.sync(store)
+        print(f"{len(incident_map)} open incidents, initial sync {(time.perf_counter() - started) * 1e3:.0f} ms")
+
+        store.update_status([(f"r{i}", NOTIFIED) for i in range(0, 50)])
+        store.put_many([IncidentRecord(f"new{i}", "Fire", latitude=19.0, longitude=72.9) for i in range(10)])
+        started = time.perf_counter()
+        incident_map.sync(store)
+        print(f"incremental sync of 60 changes {(time.perf_counter() - started) * 1e3:.1f} ms")
+        _, idle = timed(lambda: incident_map.sync(store))
+        print(f"idle sync {idle:.2f} ms")
+
+        for name, bounds, zoom in VIEWS:
+            geojson, elapsed = timed(lambda: incident_map.features(bounds, zoom))
+            (_, render) = timed(lambda: layer_bytes(map_render.incident_layer(geojson)), repeat=3)
+            size = layer_bytes(map_render.incident_layer(geojson))
+            print(f"  {name:8s} zoom {zoom:2d}: {len(geojson['features']):5d} features, cluster {elapsed:.1f} ms, "
+                  f"render {render:.0f} ms, {size / 1024:.0f} KiB")
+
+        markers = [(float(lat), float(lon), "Incident") for lat, lon in zip(lats, lons)]
+        started = time.perf_counter()
+        size = layer_bytes(map_render.marker_layer(markers))
+        print(f"  one folium marker per incident: {(time.perf_counter() - started) * 1e3:.0f} ms, {size / 1024:.0f} KiB")
+
+        # Closed and expired incidents must give their slots back
+        batch = max(args.incidents // 10, 100)
+        before = len(incident_map._lats)
+        peak = churn(store, incident_map, args.churn, batch)
+        fresh = IncidentMap()
+        fresh.sync(store)
+        # Without reclaiming, every churned incident would keep a slot
+        visible = sum(incident_map.counts().values())
+        bounded = len(incident_map) == visible and peak <= 4 * max(visible, 1024)
+        matches = single_markers(incident_map) == single_markers(fresh) and incident_map.counts() == fresh.counts()
+        print(f"churn of {args.churn * 2 * batch} incidents: {visible} open, slots {before} -> peak {peak}, "
+              f"{'bounded' if bounded else 'UNBOUNDED'}, {'matches' if matches else 'DIFFERS from'} a fresh map")
+        if not (bounded and matches):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
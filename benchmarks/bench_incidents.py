@@ -0,0 +1,102 @@
+"""Incident clustering latency and memory with thousands of live incidents.
+
+    python benchmarks/bench_incidents.py [--incidents 5000] [--reports 50000]
+
+Seeds the clusterer with --incidents live incidents spread over India, then
+streams reports of which --duplicate-rate fall within 200 m of a live incident
+of the same type, and compares per-report latency with a linear scan.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from datetime import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from incidents import IncidentClusterer, TIME_FORMAT  # noqa: E402
+from offline_geocoder import haversine_km  # noqa: E402
+
+LAT_RANGE = (8.0, 35.0)
+LON_RANGE = (68.0, 97.0)
+TYPES = ["Accident", "Fire", "Heart Attack", "Pregnancy", "Other"]
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e6
+    return f"p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us, max {samples[-1]:.1f} us"
+
+
+def make_report(emergency_type, lat, lon, timestamp):
+    return {
+        "type": emergency_type,
+        "time": datetime.fromtimestamp(timestamp).strftime(TIME_FORMAT),
+        "current_location": {"latitude": float(lat), "longitude": float(lon)},
+    }
+
+
+def linear_match(types, lats, lons, report, radius_km):
+    location = report["current_location"]
+    distances = haversine_km(location["latitude"], location["longitude"], lats, lons)
+    return np.flatnonzero((types == report["type"]) & (distances <= radius_km))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--incidents", type=int, default=5000)
+    parser.add_argument("--reports", type=int, default=50000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.7)
+    parser.add_argument("--radius-km", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    now = time.time()
+    clusterer = IncidentClusterer(radius_km=args.radius_km)
+
+    seeds = [
+        (TYPES[rng.integers(len(TYPES))], rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+        for _ in range(args.incidents)
+    ]
+    tracemalloc.start()
+    for i, (emergency_type, lat, lon) in enumerate(seeds):
+        clusterer.observe(make_report(emergency_type, lat, lon, now), f"seed-{i}")
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(clusterer)} live incidents seeded, {current / 1024:.0f} KB")
+
+    reports = []
+    for _ in range(args.reports):
+        if rng.random() < args.duplicate_rate:
+            emergency_type, lat, lon = seeds[rng.integers(len(seeds))]
+            # Within about 200 m of the original report
+            lat += rng.uniform(-0.0012, 0.0012)
+            lon += rng.uniform(-0.0012, 0.0012)
+        else:
+            emergency_type = TYPES[rng.integers(len(TYPES))]
+            lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        reports.append(make_report(emergency_type, lat, lon, now + rng.uniform(0, 600)))
+
+    timings, merged = [], 0
+    for i, report in enumerate(reports):
+        started = time.perf_counter()
+        _, was_merged = clusterer.observe(report, f"report-{i}")
+        timings.append(time.perf_counter() - started)
+        merged += was_merged
+    print(f"{len(reports)} reports, {merged} merged ({merged / len(reports):.0%}), {len(clusterer)} live incidents")
+    print(f"  clustered observe: {percentiles(timings)}")
+
+    types = np.array([s[0] for s in seeds])
+    lats = np.array([s[1] for s in seeds])
+    lons = np.array([s[2] for s in seeds])
+    timings = []
+    for report in reports[:1000]:
+        started = time.perf_counter()
+        linear_match(types, lats, lons, report, args.radius_km)
+        timings.append(time.perf_counter() - started)
+    print(f"  linear scan over {len(seeds)} incidents: {percentiles(timings)}")
+
+
+if __name__ == "__main__":
+    main()
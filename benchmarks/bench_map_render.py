@@ -0,0 +1,87 @@
+"""Per-rerun map render time and component payload, before and after map_render.
+
+    python benchmarks/bench_map_render.py [--reruns 50]
+
+Runs outside a Streamlit server: the streamlit-folium component call is
+intercepted so its arguments (what is sent to the browser) can be measured.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import folium  # noqa: E402
+import streamlit_folium  # noqa: E402
+import map_render  # noqa: E402
+
+CENTER = (20.5937, 78.9629)
+captured = []
+
+
+def capture_component(**kwargs):
+    captured.append(kwargs)
+    return kwargs["default"]
+
+
+def payload_bytes(kwargs):
+    return len(json.dumps({k: v for k, v in kwargs.items() if k != "on_change"}, default=str))
+
+
+def clicks(n):
+    return [(19.0 + i * 0.01, 72.8 + i * 0.01) for i in range(n)]
+
+
+def legacy_rerun(lat, lon):
+    m = folium.Map(location=list(CENTER), zoom_start=5, tiles="cartodbdark_matter", control_scale=True)
+    folium.Marker([lat, lon], popup="Emergency Location",
+                  icon=folium.Icon(color="red", icon="exclamation-triangle")).add_to(m)
+    streamlit_folium.st_folium(m, width=700, height=500)
+
+
+def cached_rerun(lat, lon):
+    map_render.interactive_map(CENTER, 5, [(lat, lon, "Emergency Location")], key="location_map")
+
+
+def legacy_preview(lat, lon):
+    m = folium.Map(location=[lat, lon], zoom_start=15, tiles="cartodbdark_matter")
+    folium.Marker([lat, lon], popup="Your Location",
+                  icon=folium.Icon(color="red", icon="exclamation-triangle")).add_to(m)
+    streamlit_folium.st_folium(m, width=700, height=400)
+
+
+def measure(label, render, points, static=False):
+    captured.clear()
+    timings, sizes = [], []
+    for lat, lon in points:
+        started = time.perf_counter()
+        result = render(lat, lon)
+        timings.append(time.perf_counter() - started)
+        sizes.append(len(result.encode()) if static else payload_bytes(captured[-1]))
+    remounts = len({c["key"] for c in captured}) if captured else 0
+    timings.sort()
+    print(f"{label:<28} render p50 {timings[len(timings) // 2] * 1000:6.2f} ms  "
+          f"payload {sum(sizes) / len(sizes):7.0f} B  component mounts {remounts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=50)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    streamlit_folium._component_func = capture_component
+    points = clicks(args.reruns)
+
+    print(f"{args.reruns} reruns, each with a new click position")
+    measure("location map (before)", legacy_rerun, points)
+    measure("location map (after)", cached_rerun, points)
+    measure("confirmation map (before)", legacy_preview, points)
+    measure("confirmation map (static)", map_render.static_map_html, points, static=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Perceptual-hash photo deduplication: hashing cost, index lookups and uploads saved.
+
+    python benchmarks/bench_photo_dedup.py [--indexed 20000] [--reports 50]
+
+Hashes synthetic camera-sized JPEGs, times near-duplicate lookups against
+an index of delivered photos, checks that recompressed, resized and
+brightened copies match while distinct scenes do not, and delivers reports
+where bystanders resend each other's photos to a Bot API stub, counting
+photo uploads with and without the index.
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import TelegramStub  # noqa: E402
+from telegram_client import TelegramClient, RateLimiter  # noqa: E402
+from photo_dedup import PhotoIndex, PlannedPhoto, _grayscale, phash, dhash  # noqa: E402
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e6
+    return f"p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us"
+
+
+def scene(seed, size=(1600, 1200)):
+    """A smooth random picture, upsampled from coarse noise like real photos' low frequencies"""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize(size, Image.BICUBIC)
+    detail = rng.integers(-20, 20, (size[1], size[0], 3))
+    return Image.fromarray(np.clip(np.asarray(image, dtype=np.int16) + detail, 0, 255).astype(np.uint8))
+
+
+def jpeg(image, quality=80):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def variants(image):
+    width, height = image.size
+    return {
+        "recompressed": jpeg(image, 55),
+        "resized": jpeg(image.resize((width // 2, height // 2))),
+        "brightened": jpeg(ImageEnhance.Brightness(image).enhance(1.15)),
+        "cropped 3%": jpeg(image.crop((width * 3 // 100, height * 3 // 100, width, height))),
+    }
+
+
+def random_hashes(rng, count):
+    return rng.integers(0, 2 ** 64 - 1, count, dtype=np.uint64, endpoint=True).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--indexed", type=int, default=20000)
+    parser.add_argument("--scenes", type=int, default=40)
+    parser.add_argument("--reports", type=int, default=50)
+    args = parser.parse_args()
+
+    scenes = [scene(seed) for seed in range(args.scenes)]
+    originals = [jpeg(image) for image in scenes]
+
+    samples = []
+    for data in originals:
+        started = time.perf_counter()
+        image = _grayscale(data)
+        phash(image), dhash(image)
+        samples.append(time.perf_counter() - started)
+    print(f"hash one {scenes[0].size[0]}x{scenes[0].size[1]} JPEG: {np.median(samples) * 1e3:.1f} ms median")
+
+    # An index of unrelated delivered photos plus the original scenes
+    rng = np.random.default_rng(1)
+    index = PhotoIndex()
+    noise = [PlannedPhoto(b"", p, d) for p, d in zip(random_hashes(rng, args.indexed), random_hashes(rng, args.indexed))]
+    index.remember(noise, [{"photo": [{"file_id": f"noise-{i}"}]} for i in range(len(noise))])
+    planned = index.plan(originals)
+    index.remember(planned, [{"photo": [{"file_id": f"scene-{i}"}]} for i in range(len(planned))])
+    print(f"{len(index)} photos indexed")
+
+    hits, misses, false_matches, lookups = {}, 0, 0, []
+    for i, image in enumerate(scenes):
+        for name, data in variants(image).items():
+            file_id = index.lookup(data)
+            hits.setdefault(name, 0)
+            hits[name] += file_id == f"scene-{i}"
+            misses += file_id is None
+            false_matches += file_id is not None and file_id != f"scene-{i}"
+        phash_value, dhash_value = index.hashes(originals[i])
+        for _ in range(200):
+            started = time.perf_counter()
+            with index._lock:
+                index._match(phash_value, dhash_value, time.time())
+            lookups.append(time.perf_counter() - started)
+    print(f"lookup among {len(index)}: {percentiles(lookups)}")
+    for name, count in hits.items():
+        print(f"  {name:13s} matched {count}/{len(scenes)}")
+    distinct = [jpeg(scene(seed)) for seed in range(1000, 1000 + args.scenes)]
+    false_matches += sum(index.lookup(data) is not None for data in distinct)
+    print(f"  false matches {false_matches}, distinct scenes matched {sum(index.lookup(d) is not None for d in distinct)}")
+
+    # Reports of the same few scenes: each reporter attaches two shots, one
+    # of them often a copy of what someone else already sent
+    report_rng = np.random.default_rng(2)
+    reports = []
+    for _ in range(args.reports):
+        first, second = report_rng.integers(0, 8, 2)
+        reports.append([jpeg(scenes[first], int(report_rng.integers(60, 90))), originals[second], originals[second]])
+
+    for label, use_index in (("one upload per file", False), ("perceptual dedup", True)):
+        with TelegramStub() as stub:
+            client = TelegramClient("stub-token", base_url=stub.url, rate_limiter=RateLimiter(1e6, 1e6, 1e6))
+            index = PhotoIndex()
+            started, uploaded = time.perf_counter(), 0
+            for photos in reports:
+                if use_index:
+                    planned = index.plan(photos)
+                    payloads = [photo.payload for photo in planned]
+                    messages = client.send_media_group("1", payloads)
+                    index.remember(planned, messages)
+                else:
+                    payloads = photos
+                    client.send_media_group("1", payloads)
+                uploaded += sum(len(payload) for payload in payloads if isinstance(payload, bytes))
+            elapsed = time.perf_counter() - started
+            photos_total = sum(len(photos) for photos in reports)
+            print(f"{label:20s}: {stub.uploads:3d} uploads for {photos_total} photos, "
+                  f"{uploaded / 2 ** 20:.1f} MiB, {elapsed * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Offline gazetteer vs. Nominatim reverse geocoding latency.
+
+    python benchmarks/bench_reverse_geocode.py [--queries 10000] [--network 5]
+
+Every offline lookup is also checked against a linear scan, on India and on
+a synthetic gazetteer around latitude 60 where longitude cells are half as
+wide; the run exits non-zero on any mismatch. With --network N it also makes
+N real Nominatim requests (throttled to 1/s).
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from offline_geocoder import OfflineGeocoder, load_gazetteer, haversine_km, DEFAULT_GAZETTEER  # noqa: E402
+from geocoding import GeocodingService  # noqa: E402
+
+# Rough bounding box of mainland India
+LAT_RANGE = (8.0, 35.0)
+LON_RANGE = (68.0, 97.0)
+# Far enough north that a degree of longitude is half a degree of latitude
+NORTH_LAT_RANGE = (55.0, 65.0)
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e6
+    return f"p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us, max {samples[-1]:.1f} us"
+
+
+def bench_offline(geocoder, points):
+    timings = []
+    for lat, lon in points:
+        started = time.perf_counter()
+        geocoder.reverse(lat, lon)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def mismatches(geocoder, points):
+    """Lookups whose place is farther than the nearest one found by a linear scan"""
+    wrong = 0
+    for lat, lon in points:
+        place = geocoder.reverse(lat, lon)
+        nearest = haversine_km(lat, lon, geocoder.lats, geocoder.lons).min()
+        wrong += place is None or place.distance_km > nearest + 1e-9
+    return wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gazetteer", default=os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER))
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--synthetic", type=int, default=100000, help="size of the synthetic gazetteer")
+    parser.add_argument("--network", type=int, default=0, help="live Nominatim lookups to time")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    points = np.column_stack((rng.uniform(*LAT_RANGE, args.queries), rng.uniform(*LON_RANGE, args.queries)))
+
+    started = time.perf_counter()
+    names, admins, lats, lons = load_gazetteer(args.gazetteer)
+    geocoder = OfflineGeocoder(names, admins, lats, lons)
+    print(f"gazetteer {len(geocoder)} places, built in {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(f"  offline reverse: {percentiles(bench_offline(geocoder, points))}")
+
+    n = args.synthetic
+    synthetic = OfflineGeocoder(
+        [f"place{i}" for i in range(n)], [""] * n,
+        rng.uniform(*LAT_RANGE, n), rng.uniform(*LON_RANGE, n),
+    )
+    print(f"synthetic {n} places")
+    print(f"  offline reverse: {percentiles(bench_offline(synthetic, points))}")
+
+    sparse = OfflineGeocoder(
+        [f"place{i}" for i in range(n // 100)], [""] * (n // 100),
+        rng.uniform(*NORTH_LAT_RANGE, n // 100), rng.uniform(*LON_RANGE, n // 100),
+    )
+    north = np.column_stack((rng.uniform(*NORTH_LAT_RANGE, args.queries), rng.uniform(*LON_RANGE, args.queries)))
+    wrong = {
+        "gazetteer": mismatches(geocoder, points),
+        "synthetic": mismatches(synthetic, points),
+        f"{n // 100} places at lat 55-65": mismatches(sparse, north),
+    }
+    print("mismatches against a linear scan: " + ", ".join(f"{name} {count}" for name, count in wrong.items()))
+
+    if args.network:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            service = GeocodingService(os.path.join(cache_dir, "geocode.sqlite3"))
+            timings, errors = [], 0
+            for lat, lon in points[:args.network]:
+                started = time.perf_counter()
+                try:
+                    service.reverse(lat, lon)
+                except Exception:
+                    errors += 1
+                timings.append(time.perf_counter() - started)
+            print(f"nominatim (uncached, incl. 1 req/s throttle), {errors} errors")
+            print(f"  network reverse: {percentiles(timings)}")
+
+    if any(wrong.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
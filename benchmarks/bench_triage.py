@@ -0,0 +1,116 @@
+"""Triage scoring throughput and how far a critical alert jumps a backlog.
+
+    python benchmarks/bench_triage.py [--reports 20000] [--backlog 200]
+
+Scores synthetic reports with and without descriptions, then queues a
+backlog of routine alerts followed by one critical report in a scratch
+outbox and delivers them to a Bot API stub, printing where the critical
+alert landed in the delivery order and how long it waited.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stubs import TelegramStub, NominatimStub  # noqa: E402
+from run import configure_environment  # noqa: E402
+
+
+class RecordingTelegramStub(TelegramStub):
+    """Keeps the body of every sendMessage call, in arrival order"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = []
+
+    def respond(self, endpoint, query, body, headers):
+        if endpoint == "sendMessage":
+            with self._lock:
+                self.sent.append(body)
+        return super().respond(endpoint, query, body, headers)
+
+
+DESCRIPTIONS = [
+    None,
+    "",
+    "He collapsed in the office and is unconscious, not breathing",
+    "Minor scratch, he is stable and talking",
+    "Car hit a scooter near the signal, rider bleeding heavily from the head, two children in the car",
+    "Smoke coming from the third floor, people trapped, gas cylinder in the kitchen",
+    "Her water broke an hour ago and contractions are every five minutes",
+    "not bleeding but he cannot breathe properly and his lips are turning blue",
+    "Elderly woman fell down the stairs, conscious, possible broken hip",
+    "Severe allergic reaction after eating peanuts, face swelling",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=20000)
+    parser.add_argument("--backlog", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added per Telegram call")
+    args = parser.parse_args()
+
+    telegram = RecordingTelegramStub(latency=args.latency).start()
+    nominatim = NominatimStub().start()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(telegram, nominatim, workdir)
+        os.environ["NOMINATIM_ENRICH"] = "0"
+        from eta import EMERGENCY_CAPABILITIES
+        from triage import get_triage_engine
+        from outbox import Outbox
+
+        engine = get_triage_engine()
+        types = list(EMERGENCY_CAPABILITIES)
+        rng = np.random.default_rng(5)
+        reports = [(types[rng.integers(len(types))], DESCRIPTIONS[rng.integers(len(DESCRIPTIONS))])
+                   for _ in range(args.reports)]
+        engine.assess(*reports[0])
+
+        samples = []
+        started = time.perf_counter()
+        for emergency_type, description in reports:
+            report_started = time.perf_counter()
+            engine.assess(emergency_type, description)
+            samples.append(time.perf_counter() - report_started)
+        elapsed = time.perf_counter() - started
+        samples = np.asarray(samples) * 1e6
+        print(f"{len(reports)} reports scored in {elapsed * 1e3:.0f} ms: {len(reports) / elapsed:,.0f} reports/s, "
+              f"p50 {np.percentile(samples, 50):.1f} us, p99 {np.percentile(samples, 99):.1f} us, "
+              f"max {samples.max():.0f} us")
+
+        for emergency_type, description in [("Heart/Chest Pain", DESCRIPTIONS[2]), ("Accident", DESCRIPTIONS[3]),
+                                             ("Medical Emergency", DESCRIPTIONS[7])]:
+            result = engine.assess(emergency_type, description)
+            print(f"  {emergency_type:18s} {result.level:8s} {result.score:3d}  {', '.join(result.reasons)}")
+
+        for label, prioritize in (("FIFO", False), ("priority", True)):
+            outbox = Outbox(os.path.join(workdir, f"{label}.sqlite3"), os.path.join(workdir, f"{label}-spool"))
+            details = {"type": "Other Emergency", "time": "2024-01-01 12:00:00", "text_address": "Andheri, Mumbai"}
+            routine = engine.assess(details["type"], "minor, stable").as_dict()
+            outbox.enqueue_many([({**details, "triage": routine}, None, f"routine-{i}") for i in range(args.backlog)])
+            critical = {**details, "type": "Heart/Chest Pain", "description": DESCRIPTIONS[2]}
+            if prioritize:
+                critical["triage"] = engine.assess(critical["type"], critical["description"]).as_dict()
+            queued_at = time.perf_counter()
+            outbox.enqueue(critical, idempotency_key="critical")
+
+            telegram.sent.clear()
+            marker = "Heart/Chest Pain".encode()
+            while not any(marker in body for body in telegram.sent):
+                outbox.drain_once()
+            waited = time.perf_counter() - queued_at
+            position = next(i for i, body in enumerate(telegram.sent, 1) if marker in body)
+            print(f"{label:8s}: critical alert delivered {position} of {args.backlog + 1}, after {waited:.2f} s")
+
+    telegram.stop()
+    nominatim.stop()
+
+
+if __name__ == "__main__":
+    main()
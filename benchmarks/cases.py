@@ -0,0 +1,153 @@
+"""Benchmarks for the es.py hot paths. Imported by run.py after the stubs are up."""
+import io
+import os
+import random
+from PIL import Image
+from streamlit.testing.v1 import AppTest
+
+from harness import benchmark
+from alerts import send_emergency_alert_to_admin
+from geocoding import GeocodingService, get_geocoder
+from offline_geocoder import get_offline_geocoder
+from imaging import preprocess_image
+from outbox import get_outbox
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "es.py")
+
+DETAILS = {
+    "type": "Accident",
+    "time": "2024-01-01 12:00:00",
+    "current_location": {"latitude": 19.0760, "longitude": 72.8777},
+    "text_address": "Chhatrapati Shivaji Terminus, Fort, Mumbai",
+}
+
+
+def _photo(width=4000, height=3000, seed=0):
+    # Noise compresses badly, which makes it a worst case for upload size
+    rng = random.Random(seed)
+    image = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+_PHOTOS = {}
+
+
+def photos(count):
+    if count not in _PHOTOS:
+        _PHOTOS[count] = [preprocess_image(_photo(seed=i)).transmit for i in range(count)]
+    return _PHOTOS[count]
+
+
+# Alert delivery
+
+@benchmark("alert.send.text_only")
+def send_text_only(ctx, state):
+    assert send_emergency_alert_to_admin(DETAILS, [])
+
+
+@benchmark("alert.send.four_photos", repeat=10)
+def send_four_photos(ctx, state):
+    assert send_emergency_alert_to_admin(DETAILS, photos(4))
+
+
+@benchmark("outbox.enqueue")
+def outbox_enqueue(ctx, state):
+    get_outbox().enqueue(DETAILS, idempotency_key=f"bench-{ctx.next_id()}")
+
+
+# Geocoding
+
+def _cold_service(ctx):
+    path = os.path.join(ctx.workdir, f"geocode-{ctx.next_id()}.sqlite3")
+    return GeocodingService(path, min_interval=0, domain=ctx.nominatim.netloc, scheme="http")
+
+
+@benchmark("geocode.reverse.cold", setup=_cold_service)
+def reverse_cold(ctx, service):
+    service.reverse(19.0760, 72.8777)
+
+
+@benchmark("geocode.reverse.warm")
+def reverse_warm(ctx, state):
+    get_geocoder().reverse(19.0760, 72.8777)
+
+
+@benchmark("geocode.forward.warm")
+def forward_warm(ctx, state):
+    get_geocoder().geocode(DETAILS["text_address"])
+
+
+@benchmark("geocode.reverse.offline", repeat=200)
+def reverse_offline(ctx, state):
+    get_offline_geocoder().reverse(19.0760, 72.8777)
+
+
+# Photo handling
+
+@benchmark("photo.preprocess.12mp", repeat=5, setup=lambda ctx: _photo())
+def preprocess_12mp(ctx, data):
+    preprocess_image(data)
+
+
+# Wizard steps, driven through Streamlit's AppTest harness. Each benchmark
+# times one interaction: the click plus the rerun it triggers.
+
+def _app():
+    return AppTest.from_file(APP_PATH, default_timeout=30)
+
+
+def _click(at, label):
+    for button in at.button:
+        if button.label == label:
+            button.click().run()
+            return at
+    raise AssertionError(f"no button labelled {label!r} on step {at.session_state.step}")
+
+
+def _enter_address(at):
+    at.text_area[0].input(DETAILS["text_address"])
+    return _click(at, "Continue")
+
+
+WIZARD = [
+    ("emergency_type", lambda at: _click(at, "Continue Here")),
+    ("location_choice", lambda at: _click(at, "🚗 Accident")),
+    ("text_address", lambda at: _click(at, "✍️ Enter Address Manually")),
+    ("photos", _enter_address),
+    ("summary", lambda at: _click(at, "Send Emergency Alert")),
+    ("alert_sent", lambda at: _click(at, "🚨 CONFIRM AND SEND ALERT 🚨")),
+]
+
+
+def _at_step(index):
+    def setup(ctx):
+        at = _app().run()
+        for _, action in WIZARD[:index]:
+            action(at)
+        return at
+    return setup
+
+
+def _register_step(index, step, action):
+    @benchmark(f"wizard.{index + 1}.{step}", repeat=5, setup=_at_step(index))
+    def run_step(ctx, at):
+        action(at)
+        assert not at.exception, at.exception
+
+
+@benchmark("wizard.0.platform_choice", repeat=5)
+def wizard_first_render(ctx, state):
+    at = _app().run()
+    assert not at.exception, at.exception
+
+
+for _index, (_step, _action) in enumerate(WIZARD):
+    _register_step(_index, _step, _action)
+
+
+@benchmark("wizard.map.current_location", repeat=5, setup=_at_step(2))
+def wizard_map_step(ctx, at):
+    _click(at, "📍 Share Location on Map")
+    assert not at.exception, at.exception
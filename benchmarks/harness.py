@@ -0,0 +1,122 @@
+"""Minimal benchmark runner: wall time, allocations, round trips and baselines."""
+import gc
+import json
+import time
+import tracemalloc
+from statistics import median
+
+BENCHMARKS = []
+
+
+class Benchmark:
+    def __init__(self, name, fn, repeat, setup):
+        self.name = name
+        self.fn = fn
+        self.repeat = repeat
+        self.setup = setup
+
+
+def benchmark(name, repeat=20, setup=None):
+    """Register ``fn(ctx, state)``; ``setup(ctx)`` runs untimed before every iteration"""
+    def register(fn):
+        BENCHMARKS.append(Benchmark(name, fn, repeat, setup))
+        return fn
+    return register
+
+
+class Context:
+    """Shared state handed to every benchmark: the stub servers and scratch space"""
+
+    def __init__(self, telegram, nominatim, workdir):
+        self.telegram = telegram
+        self.nominatim = nominatim
+        self.workdir = workdir
+        self.counter = 0
+
+    def round_trips(self):
+        return self.telegram.total_requests() + self.nominatim.total_requests()
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+
+def _iteration(bench, ctx):
+    state = bench.setup(ctx) if bench.setup else None
+    before = ctx.round_trips()
+    started = time.perf_counter()
+    bench.fn(ctx, state)
+    elapsed = time.perf_counter() - started
+    return elapsed, ctx.round_trips() - before
+
+
+def run_benchmark(bench, ctx, repeat=None):
+    repeat = repeat or bench.repeat
+    _iteration(bench, ctx)  # warm-up: imports, connection pools, caches
+
+    timings, trips = [], []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            elapsed, round_trips = _iteration(bench, ctx)
+            timings.append(elapsed)
+            trips.append(round_trips)
+    finally:
+        gc.enable()
+
+    # Allocation figures come from a separate traced run so tracing overhead
+    # does not distort the timings above
+    state = bench.setup(ctx) if bench.setup else None
+    tracemalloc.start()
+    bench.fn(ctx, state)
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "median_ms": median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "min_ms": timings[0] * 1000,
+        "round_trips": sum(trips) / len(trips),
+        "allocated_kb": allocated / 1024,
+        "peak_kb": peak / 1024,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return human-readable regressions of median time or round trips beyond ``threshold``"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if result["median_ms"] > previous["median_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: median {previous['median_ms']:.2f} -> {result['median_ms']:.2f} ms "
+                f"(+{(result['median_ms'] / previous['median_ms'] - 1) * 100:.0f}%)"
+            )
+        if result["round_trips"] > previous["round_trips"] + 0.5:
+            regressions.append(
+                f"{name}: round trips {previous['round_trips']:.1f} -> {result['round_trips']:.1f}"
+            )
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def format_table(results):
+    lines = [f"{'benchmark':<36}{'median ms':>11}{'p95 ms':>10}{'trips':>7}{'alloc KB':>11}{'peak KB':>10}"]
+    for name, r in results.items():
+        lines.append(
+            f"{name:<36}{r['median_ms']:>11.3f}{r['p95_ms']:>10.3f}{r['round_trips']:>7.1f}"
+            f"{r['allocated_kb']:>11.1f}{r['peak_kb']:>10.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,373 @@
+"""Ramp concurrent wizard sessions against one app process to find where reruns slow down.
+
+    python benchmarks/load.py                                  # closed loop, 1,2,4,8,16 sessions at once
+    python benchmarks/load.py --concurrency 4,8,16,32 --sessions 64
+    python benchmarks/load.py --arrival-rate 3                 # Poisson arrivals, capped by each stage's concurrency
+    python benchmarks/load.py --output after.json --baseline before.json
+
+Every session walks the wizard like a user: platform choice, emergency type,
+a map location or a typed address, photos, the summary with a description,
+confirm, then the dispatched page polling until the admin chat has the
+alert. Sessions run as Streamlit AppTest instances on threads in this
+process, sharing its caches, outbox and worker pools as browser sessions on
+one ``streamlit run es.py`` server do; script runs themselves take turns
+(see ``prepare_apptest``). The websocket and browser rendering are not
+included. Map clicks and file uploads cannot be scripted through
+AppTest: the clicked point is written to session state, and photos are
+preprocessed and spooled exactly as the photos step does.
+
+Per stage it reports session throughput, rerun latency (one interaction
+plus its rerun), dispatch latency (confirm to delivered to the Telegram
+stub), resident memory per live session and the error rate. The first
+stage over RERUN_BUDGET_MS at p95, above 1% errors, or not gaining
+throughput from the added concurrency is reported as the saturation point.
+"""
+import io
+import gc
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stubs import TelegramStub, NominatimStub  # noqa: E402
+from run import configure_environment  # noqa: E402
+
+APP_PATH = os.path.join(os.path.dirname(BENCH_DIR), "es.py")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+TYPES = ["🏥 Medical Emergency", "🚗 Accident", "❤️ Heart/Chest Pain", "👶 Pregnancy", "🔥 Fire", "🆘 Other Emergency"]
+ADDRESSES = ["Andheri West, Mumbai", "Koramangala, Bengaluru", "Connaught Place, New Delhi", "Salt Lake, Kolkata"]
+DESCRIPTIONS = ["", "He collapsed and is not breathing", "Minor injuries, everyone is stable",
+                "Smoke from the second floor, people trapped"]
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    values = np.asarray(samples) * 1e3
+    return {name: float(np.percentile(values, q)) for name, q in (("p50", 50), ("p95", 95), ("p99", 99))}
+
+
+def test_photo(seed, size=(1600, 1200)):
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(coarse).resize(size, Image.BICUBIC).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class SessionError(Exception):
+    pass
+
+
+def prepare_apptest():
+    """Make AppTest usable from many threads, with the script compiled once as on a server.
+
+    An AppTest run swaps process globals (the runtime singleton, config
+    patches) in and out, and concurrent runs drop each other's widget
+    events, so runs are serialized here; background work (dispatch,
+    delivery, photo preprocessing, lookups) still overlaps freely. On one
+    interpreter the GIL serializes script execution much the same way, but
+    a rerun that blocks on the network holds the others back here where a
+    server would let them through, so saturation comes out early rather
+    than late. AppTest also recompiles the script on every run, which the
+    server does once for all sessions.
+    """
+    from streamlit.testing.v1.app_test import AppTest
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    run, run_lock = AppTest._run, threading.Lock()
+
+    def serialized_run(self, *args, **kwargs):
+        with run_lock:
+            return run(self, *args, **kwargs)
+
+    AppTest._run = serialized_run
+    script_cache, get_bytecode = ScriptCache(), ScriptCache.get_bytecode
+    ScriptCache.get_bytecode = lambda self, script_path: get_bytecode(script_cache, script_path)
+
+
+class Session:
+    """One scripted user going through the wizard, timing every interaction"""
+
+    def __init__(self, number, args, photos, recorder):
+        from streamlit.testing.v1 import AppTest
+        self.number = number
+        self.args = args
+        self.photos = photos
+        self.recorder = recorder
+        self.random = random.Random(number)
+        self.at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+
+    def _timed(self, step, action, think=True):
+        started = time.perf_counter()
+        action()
+        self.recorder.rerun(step, time.perf_counter() - started)
+        if self.at.exception:
+            raise SessionError(f"{step}: {self.at.exception[0].message}")
+        if think and self.args.think:
+            time.sleep(self.random.expovariate(1 / self.args.think))
+
+    def _click(self, label):
+        for button in self.at.button:
+            if button.label == label:
+                return button.click().run
+        raise SessionError(f"no button {label!r} on step {self.at.session_state.step}")
+
+    def run(self):
+        at = self.at
+        self._timed("platform_choice", at.run)
+        self._timed("emergency_type", self._click("Continue Here"))
+        self._timed("location_choice", self._click(TYPES[self.number % len(TYPES)]))
+        if self.number % 2:
+            self._timed("current_location", self._click("📍 Share Location on Map"))
+            # Stands in for the map click and "Confirm Location"
+            at.session_state["current_location"] = {
+                "latitude": self.random.uniform(18.9, 19.2), "longitude": self.random.uniform(72.8, 73.0),
+            }
+            at.session_state["step"] = "photos"
+            self._timed("photos", at.run)
+        else:
+            self._timed("text_address", self._click("✍️ Enter Address Manually"))
+            at.text_area[0].input(ADDRESSES[self.number % len(ADDRESSES)])
+            self._timed("photos", self._click("Continue"))
+        self._timed("summary", self._click("Send Emergency Alert"))
+        if self.photos:
+            from imaging import submit_preprocess
+            session_id = at.session_state["blob_session"]
+            # What the photos step keeps once uploads are processed
+            at.session_state["photos"] = [submit_preprocess(data, f"photo{i}.jpg", session_id).result()
+                                          for i, data in enumerate(self.photos)]
+            self._timed("summary", at.run)
+        at.text_area[0].input(DESCRIPTIONS[self.number % len(DESCRIPTIONS)])
+        confirmed = time.perf_counter()
+        self._timed("confirm", self._click("🚨 CONFIRM AND SEND ALERT 🚨"), think=False)
+        ticket_id = at.session_state["dispatch_ticket"]
+
+        from dispatch import get_ticket
+        deadline = confirmed + self.args.dispatch_timeout
+        next_poll = confirmed + self.args.poll
+        while True:
+            ticket = get_ticket(ticket_id)
+            if ticket is not None and ticket.done:
+                break
+            if time.perf_counter() > deadline:
+                raise SessionError(f"alert {ticket_id} not delivered within {self.args.dispatch_timeout}s")
+            time.sleep(0.05)
+            # The dispatched page reruns every couple of seconds while it polls
+            if time.perf_counter() >= next_poll:
+                self._timed("dispatched", at.run, think=False)
+                next_poll += self.args.poll
+        if ticket.status != "sent":
+            raise SessionError(f"alert {ticket_id} ended as {ticket.status}")
+        self.recorder.dispatched(time.perf_counter() - confirmed)
+
+
+class Recorder:
+    """Thread-safe collection of one stage's measurements"""
+
+    def __init__(self):
+        self.reruns = []
+        self.by_step = defaultdict(list)
+        self.dispatch = []
+        self.queued = []
+        self.errors = []
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def rerun(self, step, elapsed):
+        with self._lock:
+            self.reruns.append(elapsed)
+            self.by_step[step].append(elapsed)
+
+    def dispatched(self, elapsed):
+        with self._lock:
+            self.dispatch.append(elapsed)
+            self.completed += 1
+
+    def error(self, message):
+        with self._lock:
+            self.errors.append(message)
+
+
+def run_stage(concurrency, args, photos, first_number, finished):
+    """Run ``args.sessions`` sessions at most ``concurrency`` at a time and summarize them.
+
+    Finished sessions are appended to ``finished`` and should be kept for
+    the whole run: memory they free would be reused by the next stage's
+    sessions and hide what those cost.
+    """
+    recorder = Recorder()
+    slots = threading.Semaphore(concurrency)
+    finished_lock = threading.Lock()
+
+    def one(number, arrived):
+        with slots:
+            recorder.queued.append(time.perf_counter() - arrived)
+            session = None
+            try:
+                session = Session(number, args, photos, recorder)
+                session.run()
+            except Exception as e:
+                recorder.error(f"{type(e).__name__}: {e}")
+            finally:
+                with finished_lock:
+                    finished.append(session)
+
+    gc.collect()
+    rss_before = rss_bytes()
+    arrivals = random.Random(concurrency)
+    threads, started = [], time.perf_counter()
+    for i in range(args.sessions):
+        thread = threading.Thread(target=one, args=(first_number + i, time.perf_counter()), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if args.arrival_rate:
+            time.sleep(arrivals.expovariate(args.arrival_rate))
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    rss_after = rss_bytes()
+
+    return {
+        "concurrency": concurrency,
+        "sessions": args.sessions,
+        "completed": recorder.completed,
+        "elapsed_s": elapsed,
+        "sessions_per_s": recorder.completed / elapsed,
+        "rerun_ms": percentiles(recorder.reruns),
+        "rerun_by_step_p95_ms": {step: percentiles(samples)["p95"] for step, samples in recorder.by_step.items()},
+        "dispatch_ms": percentiles(recorder.dispatch),
+        "queued_ms": percentiles(recorder.queued),
+        "mib_per_session": max(0, rss_after - rss_before) / args.sessions / 2 ** 20,
+        "error_rate": len(recorder.errors) / args.sessions,
+        "errors": sorted(set(recorder.errors))[:5],
+    }
+
+
+def saturation(stages, budget_ms, open_loop=False):
+    """The first stage that is over budget, failing, or not gaining throughput, with the reason.
+
+    With open-loop arrivals throughput is set by the arrival rate, so only
+    latency and errors count.
+    """
+    previous = None
+    for stage in stages:
+        if stage["error_rate"] > 0.01:
+            return stage, f"{stage['error_rate']:.0%} of sessions failed"
+        p95 = stage["rerun_ms"]["p95"]
+        if p95 is not None and p95 > budget_ms:
+            return stage, f"p95 rerun {p95:.0f} ms over the {budget_ms:.0f} ms budget"
+        if previous and not open_loop and stage["sessions_per_s"] < 1.1 * previous["sessions_per_s"]:
+            return stage, "throughput stopped growing with concurrency"
+        previous = stage
+    return None, None
+
+
+def format_ms(value):
+    return f"{value:7.0f}" if value is not None else "      -"
+
+
+def print_stage(stage):
+    rerun, dispatch = stage["rerun_ms"], stage["dispatch_ms"]
+    print(f"{stage['concurrency']:5d} {stage['completed']:4d}/{stage['sessions']:<4d} {stage['sessions_per_s']:7.2f} "
+          f"{format_ms(rerun['p50'])} {format_ms(rerun['p95'])} {format_ms(rerun['p99'])} "
+          f"{format_ms(dispatch['p50'])} {format_ms(dispatch['p95'])} {format_ms(dispatch['p99'])} "
+          f"{stage['mib_per_session']:8.2f} {stage['error_rate']:6.1%}")
+    slowest = max(stage["rerun_by_step_p95_ms"].items(), key=lambda item: item[1] or 0, default=None)
+    if slowest:
+        print(f"      slowest step at p95: {slowest[0]} {slowest[1]:.0f} ms")
+    for error in stage["errors"]:
+        print(f"      error: {error}")
+
+
+def compare(stages, baseline):
+    """Print p95 rerun and throughput changes against a previous run at the same concurrency"""
+    previous = {stage["concurrency"]: stage for stage in baseline["stages"]}
+    print("\nvs. baseline:")
+    for stage in stages:
+        before = previous.get(stage["concurrency"])
+        if before is None or not before["sessions_per_s"] or before["rerun_ms"]["p95"] is None:
+            continue
+        p95_change = stage["rerun_ms"]["p95"] / before["rerun_ms"]["p95"] - 1
+        throughput_change = stage["sessions_per_s"] / before["sessions_per_s"] - 1
+        print(f"  concurrency {stage['concurrency']:3d}: p95 rerun {p95_change:+.0%}, throughput {throughput_change:+.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="comma-separated concurrent sessions per stage")
+    parser.add_argument("--sessions", type=int, default=16, help="sessions started per stage")
+    parser.add_argument("--arrival-rate", type=float, default=0.0,
+                        help="new sessions per second (Poisson); 0 starts them all at once")
+    parser.add_argument("--think", type=float, default=0.5, help="mean seconds a user spends on each step")
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds between reruns of the dispatched page")
+    parser.add_argument("--photos", type=int, default=1, help="photos attached to each report")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--nominatim-latency", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=30, help="seconds allowed for one rerun")
+    parser.add_argument("--dispatch-timeout", type=float, default=120)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    telegram = TelegramStub(latency=args.telegram_latency).start()
+    nominatim = NominatimStub(latency=args.nominatim_latency).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(telegram, nominatim, workdir)
+        from bootstrap import RERUN_BUDGET_MS
+
+        prepare_apptest()
+        photos = [test_photo(i) for i in range(args.photos)]
+        # Imports, caches, worker pools and allocator arenas warm up outside the measured stages
+        warmup = argparse.Namespace(**{**vars(args), "think": 0})
+        for number in range(-3, 0):
+            Session(number, warmup, photos, Recorder()).run()
+
+        print("  conc  done      s/s  rerun p50    p95    p99  dispatch p50  p95    p99  MiB/sess errors")
+        stages, number, finished = [], 1, []
+        for concurrency in [int(value) for value in args.concurrency.split(",")]:
+            stage = run_stage(concurrency, args, photos, number, finished)
+            number += args.sessions
+            print_stage(stage)
+            stages.append(stage)
+
+        stage, reason = saturation(stages, RERUN_BUDGET_MS, open_loop=bool(args.arrival_rate))
+        if stage is None:
+            print(f"\nNo saturation up to {stages[-1]['concurrency']} concurrent sessions")
+        else:
+            print(f"\nSaturated at {stage['concurrency']} concurrent sessions: {reason}")
+
+        results = {"args": vars(args), "rerun_budget_ms": RERUN_BUDGET_MS, "stages": stages,
+                   "saturation": stage["concurrency"] if stage else None}
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                compare(stages, json.load(f))
+
+    telegram.stop()
+    nominatim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Run the es.py micro-benchmarks against local Telegram and Nominatim stubs.
+
+    python benchmarks/run.py                      # run and print results
+    python benchmarks/run.py --save-baseline      # record benchmarks/baseline.json
+    python benchmarks/run.py --threshold 0.25     # fail if >25% slower than baseline
+
+No network access is needed: every outbound call goes to the stubs.
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stubs import TelegramStub, NominatimStub  # noqa: E402
+import harness  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def configure_environment(telegram, nominatim, workdir):
+    """Point every app module at the stubs and a scratch directory before they are imported"""
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123:stub",
+        "TELEGRAM_API_BASE": telegram.url,
+        "TELEGRAM_CHAT_RATE": "1000000",
+        "TELEGRAM_GLOBAL_RATE": "1000000",
+        "ADMIN_CHAT_ID": "1",
+        "NOMINATIM_DOMAIN": nominatim.netloc,
+        "NOMINATIM_SCHEME": "http",
+        "NOMINATIM_MIN_INTERVAL": "0",
+        "GEOCODE_CACHE_PATH": os.path.join(workdir, "geocode.sqlite3"),
+        "OUTBOX_DIR": os.path.join(workdir, "outbox"),
+        "ADDRESS_INDEX_PATH": os.path.join(workdir, "address_index.bin"),
+        "SESSION_SPOOL_DIR": os.path.join(workdir, "sessions"),
+        "INCIDENT_STORE_URL": f"sqlite://{os.path.join(workdir, 'incidents.sqlite3')}",
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="es.py hot-path benchmarks")
+    parser.add_argument("-k", "--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, help="override iterations per benchmark")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs. baseline")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="seconds added per Telegram call")
+    parser.add_argument("--nominatim-latency", type=float, default=0.05, help="seconds added per Nominatim call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub responses that fail")
+    args = parser.parse_args()
+
+    telegram = TelegramStub(latency=args.telegram_latency, error_rate=args.error_rate).start()
+    nominatim = NominatimStub(latency=args.nominatim_latency, error_rate=args.error_rate).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(telegram, nominatim, workdir)
+        import cases  # noqa: F401  registers the benchmarks
+        from outbox import get_outbox
+
+        # Alerts queued by one case would otherwise be delivered in the
+        # background during later ones and count towards their round trips
+        get_outbox().stop(timeout=5)
+
+        ctx = harness.Context(telegram, nominatim, workdir)
+        results = {}
+        for bench in harness.BENCHMARKS:
+            if args.filter in bench.name:
+                results[bench.name] = harness.run_benchmark(bench, ctx, args.repeat)
+                print(f"  {bench.name}: {results[bench.name]['median_ms']:.3f} ms", file=sys.stderr)
+
+    telegram.stop()
+    nominatim.stop()
+    print(harness.format_table(results))
+
+    if args.save_baseline:
+        harness.save_baseline(args.baseline, results)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        regressions = harness.compare(results, harness.load_baseline(args.baseline), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            print("\n".join(f"  {line}" for line in regressions))
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
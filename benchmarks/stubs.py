@@ -0,0 +1,237 @@
+"""Local stand-ins for the Telegram Bot API and Nominatim.
+
+Both servers run in a background thread, add a configurable delay to every
+response, can fail a fraction of requests, and count requests per endpoint so
+benchmarks can report network round trips.
+"""
+import json
+import time
+import random
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 resets connections under hundreds of concurrent clients
+    request_queue_size = 1024
+
+
+class StubServer:
+    """Threaded HTTP server with latency and error injection"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self, b"")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                stub._handle(self, self.rfile.read(length))
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def netloc(self):
+        return f"127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def total_requests(self):
+        with self._lock:
+            return sum(self.requests.values())
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _handle(self, handler, body):
+        parsed = urlparse(handler.path)
+        endpoint = parsed.path.rsplit("/", 1)[-1]
+        with self._lock:
+            self.requests[endpoint] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_fail():
+            status, payload = self.error_response(endpoint)
+        else:
+            status, payload = self.respond(endpoint, parse_qs(parsed.query), body, handler.headers)
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def error_response(self, endpoint):
+        return 500, {"error": "injected failure"}
+
+    def respond(self, endpoint, query, body, headers):
+        raise NotImplementedError
+
+
+class TelegramStub(StubServer):
+    """Bot API stub that accepts every send and returns incrementing message IDs.
+
+    ``uploads`` counts photos sent as bytes rather than by file_id.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._message_id = 0
+        self.uploads = 0
+
+    def _next_message(self, chat_id=None, **fields):
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        return {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id}, **fields}
+
+    def _next_photo(self):
+        message = self._next_message()
+        file_id = f"stub-file-{message['message_id']}"
+        message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+        return message
+
+    def error_response(self, endpoint):
+        return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error: injected"}
+
+    def respond(self, endpoint, query, body, headers):
+        if endpoint == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Stub", "username": "StubBot"}}
+        if endpoint == "sendMediaGroup":
+            # Media items arrive as a JSON string inside a form field or a JSON body
+            media = max(body.count(b'"type": "photo"') + body.count(b'\\"type\\": \\"photo\\"'), 1)
+            with self._lock:
+                self.uploads += body.count(b"attach://")
+            return 200, {"ok": True, "result": [self._next_photo() for _ in range(media)]}
+        if endpoint == "sendPhoto":
+            if b"filename=" in body:
+                with self._lock:
+                    self.uploads += 1
+            return 200, {"ok": True, "result": self._next_photo()}
+        if endpoint in ("sendMessage", "editMessageText"):
+            return 200, {"ok": True, "result": self._next_message()}
+        return 200, {"ok": True, "result": True}
+
+
+class NominatimStub(StubServer):
+    """Nominatim stub answering /search and /reverse with a fixed place"""
+
+    latitude = 19.0760
+    longitude = 72.8777
+    address = "Chhatrapati Shivaji Terminus, Fort, Mumbai, Maharashtra, 400001, India"
+
+    def _place(self, lat=None, lon=None):
+        return {
+            "place_id": 1,
+            "lat": str(lat if lat is not None else self.latitude),
+            "lon": str(lon if lon is not None else self.longitude),
+            "display_name": self.address,
+            "address": {"city": "Mumbai", "state": "Maharashtra", "country": "India"},
+        }
+
+    def respond(self, endpoint, query, body, headers):
+        if endpoint == "reverse":
+            return 200, self._place(query.get("lat", [None])[0], query.get("lon", [None])[0])
+        if endpoint == "search":
+            return 200, [self._place()]
+        return 404, {"error": "unknown endpoint"}
+
+
+class BotApiStub(TelegramStub):
+    """Bot API stub that also feeds updates to a polling bot and serves file downloads.
+
+    Queue user messages with ``push_update``; ``getUpdates`` long-polls for
+    them. ``on_send(chat_id, fields)`` is called for every message the bot
+    sends, so a driver can answer like a user would.
+    """
+
+    def __init__(self, *args, file_bytes=b"", on_send=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.file_bytes = file_bytes
+        self.on_send = on_send
+        self._updates = []
+        self._update_id = 0
+        self._updates_changed = threading.Condition(self._lock)
+
+    def push_update(self, message):
+        with self._lock:
+            self._update_id += 1
+            self._updates.append({"update_id": self._update_id, "message": message})
+            self._updates_changed.notify_all()
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset", 0) or 0)
+        deadline = time.monotonic() + float(params.get("timeout", 0) or 0)
+        with self._lock:
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._updates_changed.wait(deadline - time.monotonic())
+            return self._updates[:int(params.get("limit", 100) or 100)]
+
+    def _handle(self, handler, body):
+        if handler.path.startswith("/file/"):
+            with self._lock:
+                self.requests["download"] += 1
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/octet-stream")
+            handler.send_header("Content-Length", str(len(self.file_bytes)))
+            handler.end_headers()
+            handler.wfile.write(self.file_bytes)
+            return
+        try:
+            super()._handle(handler, body)
+        except (BrokenPipeError, ConnectionResetError):
+            # A long poll the bot gave up on while shutting down
+            pass
+
+    def respond(self, endpoint, query, body, headers):
+        params = {key: values[0] for key, values in parse_qs(body.decode("utf-8", "replace")).items()}
+        params.update({key: values[0] for key, values in query.items()})
+        if endpoint == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+        if endpoint == "getFile":
+            file_id = params.get("file_id", "")
+            return 200, {"ok": True, "result": {
+                "file_id": file_id, "file_unique_id": file_id, "file_size": len(self.file_bytes),
+                "file_path": f"photos/{file_id}.jpg",
+            }}
+        if endpoint == "sendMessage" and "chat_id" in params:
+            message = self._next_message(text=params.get("text", ""))
+            message["chat"] = {"id": int(params["chat_id"]), "type": "private"}
+            if self.on_send is not None:
+                self.on_send(int(params["chat_id"]), params)
+            return 200, {"ok": True, "result": message}
+        return super().respond(endpoint, query, body, headers)
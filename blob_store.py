@@ -0,0 +1,262 @@
+import os
+import mmap
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import resource
+import threading
+from collections import OrderedDict
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class BlobHandle:
+    """Reference to bytes in the session spool; this is all session state keeps"""
+
+    def __init__(self, digest, size, path):
+        self.digest = digest
+        self.size = size
+        self.path = path
+
+    def __len__(self):
+        return self.size
+
+    def view(self):
+        """Zero-copy read-only view of the blob through mmap"""
+        if not self.size:
+            return memoryview(b"")
+        with open(self.path, "rb") as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def getvalue(self):
+        return bytes(self.view())
+
+
+class StoredPhoto:
+    """A preprocessed photo whose thumbnail and transmit variants live in the spool"""
+
+    def __init__(self, name, original_size, thumbnail, transmit, elapsed):
+        self.name = name
+        self.original_size = original_size
+        self.thumbnail = thumbnail
+        self.transmit = transmit
+        self.elapsed = elapsed
+
+    @property
+    def bytes_saved(self):
+        return max(0, self.original_size - len(self.transmit))
+
+    def getvalue(self):
+        """Return the transmit variant, so this can stand in for an uploaded file"""
+        return self.transmit.getvalue()
+
+
+class _Session:
+    def __init__(self, now):
+        self.blobs = {}
+        self.last_access = now
+        self.expires_at = None
+
+    @property
+    def bytes(self):
+        return sum(self.blobs.values())
+
+
+class BlobStore:
+    """Per-session photo bytes spilled to a content-addressed spool directory.
+
+    Session state holds only BlobHandles. Each session's blobs are tracked in
+    an LRU order; a session expires ``ttl`` seconds after its last access
+    (``put()`` or ``touch()``), or ``dispatched_ttl`` seconds after
+    ``release()`` once its alert has been handed to the outbox. When the spool
+    exceeds ``max_bytes``, released sessions are evicted early, least recently
+    used first; live sessions are never evicted for size, so the limit can be
+    overshot while they hold their photos. A file is deleted when no session
+    references its digest any more.
+    """
+
+    def __init__(self, spool_dir, ttl=3600.0, dispatched_ttl=300.0, max_bytes=2 * 2 ** 30):
+        self.spool_dir = spool_dir
+        self.ttl = ttl
+        self.dispatched_ttl = dispatched_ttl
+        self.max_bytes = max_bytes
+        os.makedirs(spool_dir, exist_ok=True)
+        self._sessions = OrderedDict()
+        self._refs = {}
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _path(self, digest):
+        return os.path.join(self.spool_dir, digest)
+
+    def put(self, session_id, data):
+        """Spool bytes for a session and return their handle"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        with self._lock:
+            # Under the lock so another session cannot evict the file mid-write
+            if digest not in self._sizes:
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._sizes[digest] = len(data)
+                self._total += len(data)
+            now = time.time()
+            session = self._touch(session_id, now)
+            session.blobs[digest] = len(data)
+            self._refs.setdefault(digest, set()).add(session_id)
+            self._evict(now)
+        self._report()
+        return BlobHandle(digest, len(data), path)
+
+    def put_photo(self, session_id, processed):
+        """Spool a ProcessedImage so that only handles stay in memory"""
+        return StoredPhoto(
+            processed.name,
+            processed.original_size,
+            self.put(session_id, processed.thumbnail),
+            self.put(session_id, processed.transmit),
+            processed.elapsed,
+        )
+
+    def _touch(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(now)
+        session.last_access = now
+        session.expires_at = None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def touch(self, session_id):
+        """Mark a session as active, postponing its expiry; a released session stays released"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.time()
+                self._sessions.move_to_end(session_id)
+
+    def release(self, session_id, ttl=None):
+        """Let a session's blobs expire soon, typically once its alert is queued"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.expires_at = time.time() + (self.dispatched_ttl if ttl is None else ttl)
+            self._evict(time.time())
+        self._report()
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        for digest in session.blobs:
+            holders = self._refs.get(digest)
+            if holders is None:
+                continue
+            holders.discard(session_id)
+            if not holders:
+                del self._refs[digest]
+                self._total -= self._sizes.pop(digest)
+                try:
+                    os.remove(self._path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self, now):
+        expired = [
+            session_id for session_id, session in self._sessions.items()
+            if (session.expires_at is not None and session.expires_at <= now)
+            or now - session.last_access > self.ttl
+        ]
+        for session_id in expired:
+            self._drop(session_id)
+        if self._total <= self.max_bytes:
+            return
+        # Only sessions whose alert is already queued; a live session's photos
+        # are still to be submitted
+        released = [session_id for session_id, session in self._sessions.items() if session.expires_at is not None]
+        for session_id in released:
+            if self._total <= self.max_bytes:
+                return
+            logger.warning(f"Session spool over {self.max_bytes} bytes, evicting released session {session_id}")
+            self._drop(session_id)
+        if self._total > self.max_bytes:
+            logger.warning(f"Session spool at {self._total} bytes, over {self.max_bytes}, held by live sessions")
+
+    def sweep(self):
+        """Drop expired sessions; put() and release() also do this as they go"""
+        with self._lock:
+            self._evict(time.time())
+        self._report()
+
+    def stats(self):
+        """Spooled bytes per session and in total, plus this process's peak RSS"""
+        with self._lock:
+            per_session = {session_id: session.bytes for session_id, session in self._sessions.items()}
+            spooled = self._total
+        return {
+            "sessions": len(per_session),
+            "spooled_bytes": spooled,
+            "per_session_bytes": per_session,
+            "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+
+    def _report(self):
+        if not metrics.enabled():
+            return
+        stats = self.stats()
+        metrics.set_gauge("session_spool_bytes", stats["spooled_bytes"], "Photo bytes spooled for live sessions")
+        metrics.set_gauge("session_spool_sessions", stats["sessions"], "Sessions holding spooled photos")
+        metrics.set_gauge("session_spool_max_session_bytes", max(stats["per_session_bytes"].values(), default=0),
+                          "Spooled bytes of the largest session")
+        metrics.set_gauge("process_max_rss_bytes", stats["max_rss_bytes"], "Peak resident memory of this worker")
+
+    def session_bytes(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.bytes if session else 0
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_stale_spools(base_dir):
+    """Delete spools left behind by worker processes that no longer exist"""
+    for name in os.listdir(base_dir):
+        if name.isdigit() and int(name) != os.getpid() and not _pid_alive(int(name)):
+            shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Return this process's session blob store, spooling under SESSION_SPOOL_DIR"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                base_dir = os.getenv("SESSION_SPOOL_DIR", os.path.join(BASE_DIR, ".cache", "sessions"))
+                os.makedirs(base_dir, exist_ok=True)
+                _remove_stale_spools(base_dir)
+                # Each worker process owns its own spool; session state never crosses processes
+                _store = BlobStore(
+                    os.path.join(base_dir, str(os.getpid())),
+                    ttl=float(os.getenv("SESSION_SPOOL_TTL", "3600")),
+                    dispatched_ttl=float(os.getenv("SESSION_SPOOL_DISPATCHED_TTL", "300")),
+                    max_bytes=int(os.getenv("SESSION_SPOOL_MAX_BYTES", str(2 * 2 ** 30))),
+                )
+    return _store
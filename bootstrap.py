@@ -0,0 +1,150 @@
+"""Process-level startup for the Streamlit app.
+
+Streamlit re-executes ``es.py`` on every interaction, but modules it imports
+stay in ``sys.modules``. Everything here therefore runs once per process:
+environment loading, logging setup, lazy imports and the rerun timing report.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import importlib
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+PROCESS_STARTED = time.perf_counter()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+load_dotenv()
+
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NLTK_DATA_DIR = os.getenv("NLTK_DATA_DIR", os.path.join(BASE_DIR, "nltk_data"))
+NLTK_PACKAGES = ["punkt", "punkt_tab", "stopwords"]
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "3000"))
+RERUN_BUDGET_MS = float(os.getenv("RERUN_BUDGET_MS", "300"))
+REPORT_EVERY = 50
+
+
+class LazyModule:
+    """Module proxy that performs the real import on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    logger.info(f"Imported {self._name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+_lazy_modules = {}
+
+
+def lazy_import(name):
+    """Return a shared lazy proxy for a module; cheap to call on every rerun"""
+    module = _lazy_modules.get(name)
+    if module is None:
+        module = _lazy_modules.setdefault(name, LazyModule(name))
+    return module
+
+
+def get_nltk():
+    """Import NLTK pointed at the data provisioned at build time; never downloads"""
+    nltk = lazy_import("nltk")
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    return nltk
+
+
+def provision_nltk_data(dest=NLTK_DATA_DIR):
+    """Download NLTK corpora into the app directory; run at build time, not per request"""
+    import nltk
+    os.makedirs(dest, exist_ok=True)
+    for package in NLTK_PACKAGES:
+        if not nltk.download(package, download_dir=dest, quiet=True):
+            raise RuntimeError(f"Failed to download NLTK package {package}")
+    logger.info(f"Provisioned NLTK data in {dest}")
+
+
+class TimingReport:
+    """Cold-start and per-rerun wall time, checked against configured budgets"""
+
+    def __init__(self, samples=500):
+        self.cold_start_ms = None
+        self.reruns = 0
+        self.over_budget = 0
+        self._durations = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms):
+        with self._lock:
+            self.reruns += 1
+            self._durations.append(elapsed_ms)
+            first = self.cold_start_ms is None
+            if first:
+                self.cold_start_ms = (time.perf_counter() - PROCESS_STARTED) * 1000
+            if elapsed_ms > RERUN_BUDGET_MS:
+                self.over_budget += 1
+            reruns = self.reruns
+
+        if first:
+            level = logging.WARNING if self.cold_start_ms > STARTUP_BUDGET_MS else logging.INFO
+            logger.log(level, f"Cold start took {self.cold_start_ms:.0f} ms (budget {STARTUP_BUDGET_MS:.0f} ms)")
+        elif elapsed_ms > RERUN_BUDGET_MS:
+            logger.warning(f"Rerun took {elapsed_ms:.0f} ms (budget {RERUN_BUDGET_MS:.0f} ms)")
+        if reruns % REPORT_EVERY == 0:
+            logger.info(f"Rerun timing: {self.summary()}")
+
+    def summary(self):
+        with self._lock:
+            durations = sorted(self._durations)
+        if not durations:
+            return {"cold_start_ms": self.cold_start_ms, "reruns": 0}
+        return {
+            "cold_start_ms": self.cold_start_ms,
+            "reruns": self.reruns,
+            "over_budget": self.over_budget,
+            "p50_ms": durations[len(durations) // 2],
+            "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            "max_ms": durations[-1],
+        }
+
+
+timing_report = TimingReport()
+
+
+@contextmanager
+def rerun_timer():
+    """Time one execution of the Streamlit script, including st.rerun() exits"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing_report.record((time.perf_counter() - started) * 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build-time setup for the emergency app")
+    parser.add_argument("--provision-nltk", action="store_true", help="download NLTK data into NLTK_DATA_DIR")
+    args = parser.parse_args()
+    if args.provision_nltk:
+        provision_nltk_data()
+    else:
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,324 @@
+"""Telegram intake for CareGenieBot, following the same steps as the web wizard.
+
+    python bot.py                                     # long polling
+    python bot.py --webhook-url https://host/telegram --port 8443
+
+Emergency type, then a shared location or typed address, then photos and an
+optional description, then confirmation. Conversations run concurrently on one asyncio event loop; the
+blocking parts (address resolution, arrival estimates, the outbox write) are
+moved to worker threads so one slow lookup never stalls other chats. Updates
+from one chat are still handled in order, one at a time, so a confirm never
+overtakes the photos sent before it. Photos are forwarded by file_id rather
+than downloaded and uploaded again. Confirmed reports go through
+``submit_alert``, so they are clustered, recorded and delivered to the admin
+chat exactly like alerts sent from the web app.
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from urllib.parse import urlparse
+from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.ext import (Application, BaseUpdateProcessor, CommandHandler, ConversationHandler, MessageHandler,
+                          filters)
+from address_index import resolve_address
+from dispatch import submit_alert, get_ticket
+from eta import EMERGENCY_CAPABILITIES, estimate_minutes
+from geofence import locate
+from incidents import TIME_FORMAT
+from offline_geocoder import get_offline_geocoder
+from outbox import SENT, FAILED
+from telegram_client import MEDIA_GROUP_MAX, TelegramFile
+from triage import DESCRIPTION_MAX_CHARS
+
+logger = logging.getLogger(__name__)
+
+TYPE, LOCATION, PHOTOS, CONFIRM = range(4)
+
+SHARE_LOCATION = "📍 Share Location"
+DONE = "Done"
+CONFIRM_ALERT = "🚨 CONFIRM AND SEND ALERT 🚨"
+CANCEL = "Cancel"
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates from different chats concurrently and those of one chat in order.
+
+    The conversation state of a chat lives in ``user_data`` and the
+    ConversationHandler, so two of its updates must never interleave. An
+    update waiting for its chat still counts against ``max_concurrent_updates``.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # chat_id -> [lock, updates holding or waiting for it]
+        self._chats = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+        entry = self._chats.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def _keyboard(rows):
+    return ReplyKeyboardMarkup(rows, resize_keyboard=True, one_time_keyboard=True)
+
+
+TYPE_KEYBOARD = _keyboard([list(EMERGENCY_CAPABILITIES)[i:i + 2] for i in range(0, len(EMERGENCY_CAPABILITIES), 2)])
+LOCATION_KEYBOARD = _keyboard([[KeyboardButton(SHARE_LOCATION, request_location=True)]])
+PHOTOS_KEYBOARD = _keyboard([[DONE]])
+CONFIRM_KEYBOARD = _keyboard([[CONFIRM_ALERT], [CANCEL]])
+
+
+def _new_report(user_data):
+    """Drop the report being drafted, keeping the ticket of the last one sent for /status"""
+    ticket = user_data.get('ticket')
+    user_data.clear()
+    if ticket is not None:
+        user_data['ticket'] = ticket
+
+
+async def start(update, context):
+    _new_report(context.user_data)
+    await update.message.reply_text("🚨 What kind of emergency is it?", reply_markup=TYPE_KEYBOARD)
+    return TYPE
+
+
+async def choose_type(update, context):
+    context.user_data['type'] = update.message.text
+    await update.message.reply_text(
+        "Share your location, or type your address (street, area, city).", reply_markup=LOCATION_KEYBOARD
+    )
+    return LOCATION
+
+
+async def unknown_type(update, context):
+    await update.message.reply_text("Please pick one of the emergency types below.", reply_markup=TYPE_KEYBOARD)
+    return TYPE
+
+
+async def _ask_for_photos(update, note):
+    await update.message.reply_text(
+        f"{note}\n\n📷 Send photos of the situation if you can, and a few words on what is happening, "
+        f"then tap {DONE}.", reply_markup=PHOTOS_KEYBOARD
+    )
+    return PHOTOS
+
+
+async def shared_location(update, context):
+    lat, lon = update.message.location.latitude, update.message.location.longitude
+    # The first call loads the boundaries; None when no service areas are configured
+    if await asyncio.to_thread(locate, lat, lon) == []:
+        await update.message.reply_text("That location is outside the areas we serve. Share your location "
+                                        "again or type your address. Call 112 if you need help right now.",
+                                        reply_markup=LOCATION_KEYBOARD)
+        return LOCATION
+    context.user_data['current_location'] = {"latitude": lat, "longitude": lon}
+    # The first call loads the gazetteer, so keep it off the event loop too
+    place = await asyncio.to_thread(lambda: get_offline_geocoder().reverse(lat, lon))
+    note = f"📍 Location received: {lat:.6f}, {lon:.6f}"
+    if place:
+        note += f"\nNear {place.describe()}"
+    return await _ask_for_photos(update, note)
+
+
+async def typed_address(update, context):
+    text_address = update.message.text.strip()
+    context.user_data['text_address'] = text_address
+    try:
+        coordinates = await asyncio.to_thread(resolve_address, text_address)
+    except Exception as e:
+        logger.error(f"Address geocoding error: {e}")
+        coordinates = None
+    if coordinates:
+        context.user_data['current_location'] = {"latitude": coordinates[0], "longitude": coordinates[1]}
+        note = "Address verified and location coordinates captured"
+        if await asyncio.to_thread(locate, *coordinates) == []:
+            # A typed address may be misresolved, so still send it; it goes to the central team
+            note += "\n⚠️ This address looks outside the areas we serve; your report goes to our central team"
+    else:
+        note = "Couldn't find exact coordinates for this address, but we'll still proceed"
+    return await _ask_for_photos(update, note)
+
+
+async def add_photo(update, context):
+    photos = context.user_data.setdefault('photos', [])
+    if len(photos) >= MEDIA_GROUP_MAX:
+        await update.message.reply_text(f"That's the limit of {MEDIA_GROUP_MAX} photos. Tap {DONE} to continue.",
+                                        reply_markup=PHOTOS_KEYBOARD)
+        return PHOTOS
+    # The largest size Telegram offers is last; the same picture sent twice keeps its file_unique_id
+    photo = update.message.photo[-1]
+    seen = context.user_data.setdefault('photo_ids', set())
+    if photo.file_unique_id not in seen:
+        seen.add(photo.file_unique_id)
+        photos.append(TelegramFile(photo.file_id))
+    await update.message.reply_text(f"Photo {len(photos)} received. Send more or tap {DONE}.",
+                                    reply_markup=PHOTOS_KEYBOARD)
+    return PHOTOS
+
+
+async def describe(update, context):
+    # Triage reads the description to decide how soon the alert goes out; details
+    # sent over several messages are joined, not replaced
+    text = update.message.text.strip()
+    earlier = context.user_data.get('description')
+    description = f"{earlier}\n{text}" if earlier else text
+    context.user_data['description'] = description[:DESCRIPTION_MAX_CHARS]
+    reply = "Description noted."
+    if len(description) > DESCRIPTION_MAX_CHARS:
+        reply = f"Description noted, shortened to {DESCRIPTION_MAX_CHARS} characters."
+    await update.message.reply_text(f"{reply} Send more details, photos or tap {DONE}.", reply_markup=PHOTOS_KEYBOARD)
+    return PHOTOS
+
+
+async def photos_done(update, context):
+    data = context.user_data
+    lines = ["🔍 Confirm Emergency Details", "", f"Emergency Type: {data['type']}"]
+    if data.get('current_location'):
+        location = data['current_location']
+        lines.append(f"Coordinates: {location['latitude']:.6f}, {location['longitude']:.6f}")
+    if data.get('text_address'):
+        lines.append(f"Address: {data['text_address']}")
+    if data.get('description'):
+        lines.append(f"Description: {data['description']}")
+    photos = data.get('photos')
+    lines.append(f"Photos Attached: {len(photos)} image(s)" if photos else "Photos Attached: None")
+    await update.message.reply_text("\n".join(lines), reply_markup=CONFIRM_KEYBOARD)
+    return CONFIRM
+
+
+async def confirm(update, context):
+    data = context.user_data
+    emergency_details = {
+        'type': data['type'],
+        'time': datetime.now().strftime(TIME_FORMAT),
+        'current_location': data.get('current_location'),
+        'text_address': data.get('text_address'),
+        'description': data.get('description'),
+    }
+    try:
+        estimated_minutes = await asyncio.to_thread(estimate_minutes, emergency_details)
+        # Keyed on the confirming message, so a redelivered update cannot alert twice
+        ticket = await asyncio.to_thread(
+            submit_alert, emergency_details, data.get('photos'),
+            f"telegram-{update.effective_chat.id}-{update.message.message_id}",
+            estimated_minutes=estimated_minutes,
+        )
+    except Exception as e:
+        # The report is kept, so tapping confirm again resubmits it
+        logger.error(f"Failed to submit emergency alert: {e}")
+        await update.message.reply_text(
+            f"❌ Failed to send alert. Tap {CONFIRM_ALERT} to try again, "
+            "or call your local emergency number (112) if you need help right now.",
+            reply_markup=CONFIRM_KEYBOARD,
+        )
+        return CONFIRM
+    data.clear()
+    data['ticket'] = ticket
+    text = "🚑 Help is on the way! Emergency services have been notified."
+    if estimated_minutes is not None:
+        text += f"\nEstimated arrival time: {estimated_minutes} minutes"
+    text += "\n\nSend /status for delivery updates or /start to report another emergency."
+    await update.message.reply_text(text, reply_markup=ReplyKeyboardRemove())
+    return ConversationHandler.END
+
+
+async def cancel(update, context):
+    _new_report(context.user_data)
+    await update.message.reply_text("Cancelled. Send /start to report an emergency.", reply_markup=ReplyKeyboardRemove())
+    return ConversationHandler.END
+
+
+async def status(update, context):
+    ticket = await asyncio.to_thread(get_ticket, context.user_data.get('ticket'))
+    if ticket is None:
+        text = "No emergency reported yet. Send /start to report one."
+    elif ticket.status == SENT:
+        text = "✅ Your alert was delivered to the emergency team."
+    elif ticket.status == FAILED:
+        text = "❌ We couldn't deliver your alert. Please call your local emergency number."
+    else:
+        text = "📨 Your alert is being delivered to the emergency team."
+    await update.message.reply_text(text)
+
+
+def build_application(token, base_url=None, concurrent_updates=256, pool_size=32):
+    """Assemble the bot; ``base_url`` points it at another Bot API server, e.g. a local fake"""
+    builder = Application.builder().token(token).concurrent_updates(PerChatUpdateProcessor(concurrent_updates))
+    # httpx scans every pooled connection per request; a few dozen keep-alive
+    # connections serve hundreds of chats with less CPU than one per update
+    builder = builder.connection_pool_size(pool_size).pool_timeout(10.0)
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
+
+    text = filters.TEXT & ~filters.COMMAND
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={
+            TYPE: [MessageHandler(filters.Text(list(EMERGENCY_CAPABILITIES)), choose_type),
+                   MessageHandler(text, unknown_type)],
+            LOCATION: [MessageHandler(filters.LOCATION, shared_location),
+                       MessageHandler(text, typed_address)],
+            PHOTOS: [MessageHandler(filters.PHOTO, add_photo),
+                     MessageHandler(filters.Text([DONE]), photos_done),
+                     MessageHandler(text, describe)],
+            CONFIRM: [MessageHandler(filters.Text([CONFIRM_ALERT]), confirm),
+                      MessageHandler(filters.Text([CANCEL]), cancel)],
+        },
+        fallbacks=[CommandHandler("cancel", cancel), CommandHandler("start", start)],
+    ))
+    application.add_handler(CommandHandler("status", status))
+    return application
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Telegram emergency intake bot")
+    parser.add_argument("--webhook-url", help="public HTTPS URL Telegram should post updates to; polls if unset")
+    parser.add_argument("--listen", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BOT_CONCURRENT_UPDATES", "256")),
+                        help="updates handled at once across all chats; one at a time per chat")
+    args = parser.parse_args(argv)
+
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        parser.error("TELEGRAM_BOT_TOKEN is not set")
+    application = build_application(token, os.getenv("TELEGRAM_API_BASE"), args.concurrency)
+    if args.webhook_url:
+        # Needs the webhooks extra: pip install "python-telegram-bot[webhooks]"
+        application.run_webhook(
+            listen=args.listen,
+            port=args.port,
+            url_path=urlparse(args.webhook_url).path.lstrip("/"),
+            webhook_url=args.webhook_url,
+            secret_token=os.getenv("TELEGRAM_WEBHOOK_SECRET"),
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    return 0
+
+
+if __name__ == "__main__":
+    import bootstrap  # noqa: F401  logging setup
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import uuid
+import numpy as np
+from outbox import get_outbox, PENDING, SENT, FAILED
+from incidents import get_clusterer, report_location, report_time
+from incident_store import get_incident_store, IncidentRecord, REPORTED, NOTIFIED
+from incident_store import FAILED as INCIDENT_FAILED
+from triage import triage
+from geofence import get_geofence, route, route_for
+
+QUEUED = "queued"
+RETRYING = "retrying"
+
+
+class Ticket:
+    """Delivery status of one emergency alert, as seen by the UI"""
+
+    def __init__(self, row):
+        self.id = row["idempotency_key"]
+        self.attempts = row["attempts"]
+        self.error = row["last_error"]
+        self.created_at = row["created_at"]
+        self.updated_at = row["updated_at"]
+        # Set when the report was folded into an incident someone else reported
+        self.merged = row.get("parent_key") is not None
+        if row["status"] == PENDING:
+            self.status = RETRYING if self.attempts else QUEUED
+        else:
+            self.status = row["status"]
+
+    @property
+    def done(self):
+        return self.status in (SENT, FAILED)
+
+
+def _sync_incident_status(outcomes):
+    # Runs on the outbox worker after each batch commit
+    updates = [(key, NOTIFIED if status == SENT else INCIDENT_FAILED)
+               for key, status in outcomes if status in (SENT, FAILED)]
+    get_incident_store().update_status(updates)
+
+
+def _outbox():
+    outbox = get_outbox()
+    outbox.add_listener(_sync_incident_status)
+    return outbox
+
+
+def submit_alert(emergency_details, photos=None, idempotency_key=None, estimated_minutes=None):
+    """Record an alert in the durable outbox and return its ticket ID immediately.
+
+    Submitting again with the same ``idempotency_key`` returns the existing
+    ticket instead of queueing a duplicate alert. A report matching a recent
+    incident of the same type nearby is queued as an update to that
+    incident's alert rather than as a new one. Alerts are triaged from their
+    type and description, and the most severe are delivered first. With
+    service area boundaries configured, each alert goes to the admin chat of
+    the area it came from.
+    """
+    return submit_alerts([(emergency_details, photos, idempotency_key, estimated_minutes)])[0]
+
+
+def submit_alerts(alerts):
+    """Submit several (details, photos, idempotency_key, estimated_minutes) alerts at once.
+
+    Behaves like ``submit_alert`` for each, but records them in the incident
+    store and the outbox with one transaction each. Returns the ticket IDs in
+    input order.
+    """
+    store = get_incident_store()
+    queued, records = [], []
+    for emergency_details, photos, idempotency_key, estimated_minutes in alerts:
+        idempotency_key = idempotency_key or uuid.uuid4().hex
+        emergency_details = {**emergency_details, "triage": triage(emergency_details).as_dict()}
+        alert_route = route(emergency_details)
+        if alert_route is not None:
+            emergency_details["route"] = alert_route
+        incident, merged = get_clusterer().observe(emergency_details, idempotency_key)
+        if merged:
+            emergency_details = {**emergency_details, "incident": incident.summary()}
+        # Recorded before queueing so the delivery outcome always has a record to update
+        if store.get(idempotency_key) is None:
+            location = report_location(emergency_details) or (None, None)
+            records.append(IncidentRecord(
+                idempotency_key,
+                emergency_details.get('type'),
+                latitude=location[0],
+                longitude=location[1],
+                created_at=report_time(emergency_details),
+                estimated_minutes=estimated_minutes,
+                details=emergency_details,
+                incident_id=incident.id if incident else None,
+            ))
+        queued.append((emergency_details, photos, idempotency_key))
+    store.put_many(records)
+    return _outbox().enqueue_many(queued)
+
+
+def get_incident(ticket_id):
+    """Return the shared incident record for a ticket, from any worker process"""
+    return get_incident_store().get(ticket_id) if ticket_id else None
+
+
+def get_ticket(ticket_id):
+    """Return the ticket for an ID, or None if it is unknown"""
+    if ticket_id is None:
+        return None
+    row = _outbox().get(ticket_id)
+    return Ticket(row) if row else None
+
+
+def reroute_incidents(since=None, status=None):
+    """Recompute the route of stored incidents against the current boundaries.
+
+    Every incident with coordinates reported since ``since`` (and with
+    ``status``, if given) is classified in one batch. Changed routes are
+    saved to the incident store, and alerts still waiting in the outbox go
+    to their new chat; alerts already posted stay where they are, since
+    updates to them edit that message. Returns (incidents checked, routes
+    changed).
+    """
+    geofence = get_geofence()
+    if geofence is None:
+        raise ValueError("No service area boundaries configured (GEOFENCE_PATH)")
+    store = get_incident_store()
+    records = [record for record in store.query(status=status, since=since) if record.latitude is not None]
+    found = geofence.locate_many(np.array([record.latitude for record in records]),
+                                 np.array([record.longitude for record in records]))
+    changed = {}
+    for record, areas in zip(records, found):
+        new_route = route_for(areas)
+        if record.details.get("route") != new_route:
+            changed[record.id] = {**record.details, "route": new_route}
+    store.update_details(list(changed.items()))
+    _outbox().reroute({key: details["route"] for key, details in changed.items()})
+    return len(records), len(changed)
+
+
+def count_undelivered(since):
+    """Number of alerts queued since ``since`` (epoch seconds) not yet sent or failed"""
+    return _outbox().count_undelivered(since)
+
+
+def retry_alert(ticket_id):
+    """Requeue a ticket that exhausted its automatic retries"""
+    _outbox().retry(ticket_id)
+    get_incident_store().update_status([(ticket_id, REPORTED)])
+    return ticket_id
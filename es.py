@@ -1,116 +1,25 @@
 import streamlit as st
-import os
+import time
+import uuid
 import logging
-from dotenv import load_dotenv
-import nltk
-import re
-from geopy.geocoders import Nominatim
-from PIL import Image
-import io
-import requests
 from datetime import datetime
-import urllib.parse
-import folium
-from streamlit_folium import st_folium
-import time
 from random import randint
+import metrics
+from bootstrap import rerun_timer
+from styles import APP_CSS
+from geocoding import get_geocoder, nominatim_enabled
+from offline_geocoder import get_offline_geocoder
+from geofence import locate
+from dispatch import submit_alert, get_ticket, get_incident, retry_alert
+from imaging import submit_preprocess, summarize
+from map_render import interactive_map, location_preview
+from eta import estimate_minutes
+from address_index import get_address_index, resolve_address
+from blob_store import get_blob_store
+from triage import DESCRIPTION_MAX_CHARS
 
-# Download required NLTK data
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-nltk.download('averaged_perceptron_tagger', quiet=True)
-nltk.download('maxent_ne_chunker', quiet=True)
-nltk.download('words', quiet=True)
-
-# Load environment variables
-load_dotenv()
-
-# Tokens and IDs
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
-
-# Configure logging
-logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def send_emergency_alert_to_admin(emergency_details, uploaded_files):
-    """Send emergency details and images to admin chat"""
-    try:
-        base_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-        
-        alert_message = (
-            "🚨 NEW EMERGENCY ALERT 🚨\n\n"
-            f"Type: {emergency_details['type']}\n"
-            f"Time: {emergency_details['time']}\n\n"
-        )
-
-        # Handle location information
-        if emergency_details.get('current_location'):
-            try:
-                # Parse location string to get coordinates
-                if isinstance(emergency_details['current_location'], str):
-                    lat, lon = map(float, emergency_details['current_location'].split(','))
-                else:
-                    lat = emergency_details['current_location'].get('latitude')
-                    lon = emergency_details['current_location'].get('longitude')
-
-                # Create Google Maps link
-                maps_link = f"https://www.google.com/maps?q={lat},{lon}"
-                
-                # Add location information to message
-                alert_message += (
-                    f"📍 Location Coordinates: {lat}, {lon}\n"
-                    f"🗺️ Google Maps: {maps_link}\n"
-                )
-
-                # Try to get address from coordinates using Nominatim
-                try:
-                    geolocator = Nominatim(user_agent="emergency_app")
-                    location = geolocator.reverse(f"{lat}, {lon}")
-                    if location and location.address:
-                        alert_message += f"📌 Reverse Geocoded Address: {location.address}\n"
-                except Exception as geo_error:
-                    logger.error(f"Geocoding error: {geo_error}")
-                    
-            except Exception as loc_error:
-                logger.error(f"Location parsing error: {loc_error}")
-                alert_message += f"📍 Location (raw): {emergency_details['current_location']}\n"
-
-        if emergency_details.get('text_address'):
-            alert_message += f"🏠 Provided Address: {emergency_details['text_address']}\n"
-            # Try to get coordinates for the text address
-            try:
-                geolocator = Nominatim(user_agent="emergency_app")
-                location = geolocator.geocode(emergency_details['text_address'])
-                if location:
-                    maps_link = f"https://www.google.com/maps?q={location.latitude},{location.longitude}"
-                    alert_message += f"🗺️ Address Google Maps: {maps_link}\n"
-            except Exception as geo_error:
-                logger.error(f"Address geocoding error: {geo_error}")
-
-        # Send text message
-        message_data = {
-            "chat_id": ADMIN_CHAT_ID,
-            "text": alert_message,
-            "parse_mode": "HTML"
-        }
-        requests.post(f"{base_url}/sendMessage", json=message_data)
-
-        # Send photos if any
-        if uploaded_files:
-            for file in uploaded_files:
-                files = {"photo": file.getvalue()}
-                photo_data = {
-                    "chat_id": ADMIN_CHAT_ID,
-                    "caption": "Emergency situation photo"
-                }
-                requests.post(f"{base_url}/sendPhoto", data=photo_data, files=files)
-
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send emergency alert: {e}")
-        return False
-
 def custom_card(title, content=None, color="#FF4B4B", icon=None):
     """Enhanced card component with optional icon"""
     icon_html = f"<span style='font-size: 24px; margin-right: 10px;'>{icon}</span>" if icon else ""
@@ -149,6 +58,8 @@ def initialize_session_state():
         st.session_state.location_choice = None
     if 'photos' not in st.session_state:
         st.session_state.photos = []
+    if 'photo_jobs' not in st.session_state:
+        st.session_state.photo_jobs = {}
     if 'alert_sent' not in st.session_state:
         st.session_state.alert_sent = False
     if 'emergency_status' not in st.session_state:
@@ -157,19 +68,90 @@ def initialize_session_state():
         st.session_state.estimated_time = None
     if 'dispatch_time' not in st.session_state:
         st.session_state.dispatch_time = None
-
-def get_estimated_time():
-    """Return a random estimated arrival time between 5-15 minutes"""
+    if 'emergency_details' not in st.session_state:
+        st.session_state.emergency_details = None
+    if 'dispatch_ticket' not in st.session_state:
+        st.session_state.dispatch_ticket = None
+    if 'dispatch_polling' not in st.session_state:
+        st.session_state.dispatch_polling = False
+    if 'blob_session' not in st.session_state:
+        # Owner of this session's spooled photos; session state only keeps handles
+        st.session_state.blob_session = uuid.uuid4().hex
+    if 'alert_key' not in st.session_state:
+        # Idempotency key: repeated submits of this request map to one outbox entry
+        st.session_state.alert_key = uuid.uuid4().hex
+
+def restore_incident():
+    """Rebuild the dispatched view from the shared store after a reload or replica switch"""
+    ticket_id = st.query_params.get("incident")
+    if not ticket_id or st.session_state.alert_sent:
+        return
+    record = get_incident(ticket_id)
+    if record is None:
+        return
+    st.session_state.alert_sent = True
+    st.session_state.dispatch_ticket = record.id
+    st.session_state.dispatch_polling = True
+    st.session_state.emergency_status = "en_route"
+    st.session_state.emergency_type = record.type
+    st.session_state.emergency_details = record.details
+    st.session_state.current_location = record.details.get('current_location')
+    st.session_state.text_address = record.details.get('text_address')
+    if record.estimated_minutes is not None:
+        st.session_state.estimated_time = round(record.estimated_minutes)
+    st.session_state.dispatch_time = datetime.fromtimestamp(record.created_at)
+
+def wizard_step():
+    """Current position in the wizard, used as a metrics label"""
+    if st.session_state.get('alert_sent'):
+        return 'alert_sent'
+    return st.session_state.get('step', 'platform_choice')
+
+def track_wizard_step():
+    """Record how long the user spent on a step once they move past it"""
+    step, now = wizard_step(), time.monotonic()
+    if st.session_state.get('tracked_step') != step:
+        if st.session_state.get('tracked_step') is not None:
+            metrics.observe("wizard_step_dwell_seconds", now - st.session_state.step_entered_at,
+                            "Time users spend on each wizard step", step=st.session_state.tracked_step)
+        st.session_state.tracked_step = step
+        st.session_state.step_entered_at = now
+
+def get_estimated_time(emergency_details):
+    """Minutes until the nearest suitable unit arrives.
+
+    Falls back to a 5-15 minute estimate when no fleet is configured or the
+    report has no coordinates.
+    """
+    estimated_minutes = estimate_minutes(emergency_details)
+    if estimated_minutes is not None:
+        return estimated_minutes
     return randint(5, 15)
 
-def show_progress_bar():
-    """Show an animated progress bar"""
-    progress_bar = st.progress(0)
-    for percent_complete in range(100):
-        time.sleep(0.03)  # Slower animation
-        progress_bar.progress(percent_complete + 1)
-    time.sleep(0.5)
-    progress_bar.empty()
+def render_dispatch_status():
+    """Show the delivery status of the current alert ticket"""
+    ticket = get_ticket(st.session_state.dispatch_ticket)
+    if ticket is None:
+        st.info("Alert status is no longer available. If in doubt, call 112.")
+    elif ticket.status == "sent":
+        st.success("✅ Alert delivered to the emergency response team")
+        if ticket.merged:
+            st.info("This emergency was already reported nearby; your report was added to the open incident")
+    elif ticket.status == "failed":
+        st.error("Failed to send alert. Please try again.")
+        if st.button("Retry Sending Alert", use_container_width=True, key="retry_alert"):
+            retry_alert(ticket.id)
+            st.session_state.dispatch_polling = True
+            st.rerun()
+    elif ticket.status == "retrying":
+        st.warning(f"📡 Delivery is taking longer than usual, retrying automatically (attempt {ticket.attempts + 1})")
+    else:
+        st.info("📡 Delivering your alert to the emergency response team...")
+
+    # Once the ticket settles, rerun the whole page so polling stops
+    if ticket is not None and ticket.done and st.session_state.dispatch_polling:
+        st.session_state.dispatch_polling = False
+        st.rerun()
 
 def main():
     # Set dark theme
@@ -187,102 +169,14 @@ def main():
 
     # Initialize session state
     initialize_session_state()
+    restore_incident()
+    track_wizard_step()
+    if not st.session_state.alert_sent and (st.session_state.photos or st.session_state.photo_jobs):
+        # A reporter still on the wizard keeps their photos from expiring
+        get_blob_store().touch(st.session_state.blob_session)
 
     # Custom CSS for dark theme with white text
-    st.markdown("""
-        <style>
-        /* Dark theme styles */
-        body {
-            background-color: #121212;
-            color: #FFFFFF;
-        }
-        .main {
-            padding: 2rem;
-            max-width: 900px;
-            margin: 0 auto;
-            background-color: #121212;
-        }
-        .stButton button {
-            width: 100%;
-            border-radius: 20px;
-            height: 3em;
-            font-weight: 600;
-            background-color: #2C2C2C;
-            color: #FFFFFF;
-            border: 1px solid #404040;
-            transition: all 0.3s ease;
-        }
-        .stButton button:hover {
-            background-color: #404040;
-            border-color: #505050;
-            transform: scale(1.02);
-        }
-        .emergency-title {
-            color: #FF4B4B;
-            text-align: center;
-            margin-bottom: 1em;
-            font-size: 2.5em;
-        }
-        .stTextInput input, .stTextArea textarea {
-            background-color: #2C2C2C;
-            color: #FFFFFF;
-            border: 1px solid #404040;
-        }
-        .stTextInput input:focus, .stTextArea textarea:focus {
-            border-color: #505050;
-            box-shadow: 0 0 0 1px #505050;
-        }
-        .uploadedFile {
-            background-color: #2C2C2C;
-            color: #FFFFFF;
-            border: 1px solid #404040;
-        }
-        .css-1d391kg {
-            background-color: #1E1E1E;
-        }
-        .folium-map {
-            border: 2px solid #404040;
-            border-radius: 10px;
-        }
-        /* Override Streamlit's default white background */
-        .stApp {
-            background-color: #121212;
-        }
-        /* Emergency type buttons */
-        .emergency-btn {
-            height: 120px !important;
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            font-size: 1.2em !important;
-        }
-        .emergency-btn span {
-            font-size: 2em;
-            margin-bottom: 10px;
-        }
-        /* Progress bar styling */
-        .stProgress > div > div > div {
-            background-color: #FF4B4B;
-        }
-        /* All text elements to white */
-        p, li, div, span, .stMarkdown, .stAlert, .stSuccess, .stWarning, .stError {
-            color: #FFFFFF !important;
-        }
-        /* Input labels */
-        label {
-            color: #FFFFFF !important;
-        }
-        /* Expander headers */
-        .stExpander label {
-            color: #FFFFFF !important;
-        }
-        /* Dataframe text */
-        .stDataFrame {
-            color: #FFFFFF !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(APP_CSS, unsafe_allow_html=True)
 
     if not st.session_state.alert_sent:
         st.markdown('<h1 class="emergency-title">🚑 Emergency Assistance</h1>', unsafe_allow_html=True)
@@ -362,27 +256,26 @@ def main():
                       color="#4CAF50", icon="🗺️")
             
             # Create a dark-themed map centered on India by default
-            map_center = [20.5937, 78.9629]  # Center of India
-            m = folium.Map(
-                location=map_center,
-                zoom_start=5,
-                tiles="cartodbdark_matter",  # Dark theme tiles
-                control_scale=True
-            )
-            
-            # Add a marker if location is already selected
+            map_center = (20.5937, 78.9629)  # Center of India
+
+            # Add a marker if location is already selected; only the marker layer
+            # changes between reruns, the base map stays mounted in the browser
+            markers = []
             if st.session_state.current_location:
-                folium.Marker(
-                    [st.session_state.current_location['latitude'], 
-                     st.session_state.current_location['longitude']],
-                    popup="Emergency Location",
-                    icon=folium.Icon(color="red", icon="exclamation-triangle")
-                ).add_to(m)
-            
-            map_data = st_folium(m, width=700, height=500)
+                markers.append((st.session_state.current_location['latitude'],
+                                st.session_state.current_location['longitude'],
+                                "Emergency Location"))
+
+            last_clicked = interactive_map(map_center, 5, markers, key="location_map")
 
-            if map_data.get("last_clicked"):
-                latitude, longitude = map_data["last_clicked"]["lat"], map_data["last_clicked"]["lng"]
+            # Checked against the service areas at click time; None when no boundaries are configured
+            areas = locate(last_clicked["lat"], last_clicked["lng"]) if last_clicked else None
+
+            if last_clicked and areas == []:
+                st.error("That point is outside the areas we serve. Click your location on the map again, "
+                         "or call 112 if you need help right now.")
+            elif last_clicked:
+                latitude, longitude = last_clicked["lat"], last_clicked["lng"]
                 st.session_state.current_location = {"latitude": latitude, "longitude": longitude}
                 
                 # Show confirmation and next steps
@@ -390,14 +283,23 @@ def main():
                 
                 # Show a preview of the location
                 with st.expander("📍 Location Preview"):
-                    try:
-                        geolocator = Nominatim(user_agent="emergency_app")
-                        location = geolocator.reverse(f"{latitude}, {longitude}")
-                        if location and location.address:
-                            st.write("**Approximate Address:**")
-                            st.write(location.address)
-                    except Exception as geo_error:
-                        st.warning("Couldn't fetch address details for this location")
+                    place = get_offline_geocoder().reverse(latitude, longitude)
+                    if place:
+                        st.write("**Nearest Locality:**")
+                        st.write(place.describe())
+
+                    if areas:
+                        st.write("**Service Area:**")
+                        st.write(", ".join(area.name for area in areas))
+
+                    if nominatim_enabled():
+                        try:
+                            address = get_geocoder().reverse(latitude, longitude)
+                            if address:
+                                st.write("**Approximate Address:**")
+                                st.write(address)
+                        except Exception as geo_error:
+                            st.warning("Couldn't fetch address details for this location")
                     
                     st.write(f"**Google Maps Link:**")
                     st.write(f"https://www.google.com/maps?q={latitude},{longitude}")
@@ -415,6 +317,20 @@ def main():
                 "Complete Address (Include landmarks if possible):",
                 placeholder="e.g., 123 Main Street, Apartment 4B, Near Central Park, Mumbai, Maharashtra 400001"
             )
+
+            # Suggestions come from the local index, so refreshing them on every edit is cheap
+            suggestions = get_address_index().suggest(text_address) if text_address.strip() else []
+            if suggestions:
+                choice = st.radio(
+                    "Matching localities:",
+                    range(len(suggestions)),
+                    format_func=lambda i: suggestions[i].label,
+                    index=None,
+                    key="address_suggestion",
+                )
+                st.session_state.address_match = suggestions[choice] if choice is not None else None
+            else:
+                st.session_state.address_match = None
             
             if st.button("Continue", use_container_width=True):
                 if text_address.strip():
@@ -422,12 +338,15 @@ def main():
                     
                     # Try to geocode the address to confirm it's valid
                     try:
-                        geolocator = Nominatim(user_agent="emergency_app")
-                        location = geolocator.geocode(text_address)
-                        if location:
+                        match = st.session_state.get('address_match')
+                        if match is not None:
+                            coordinates = (match.latitude, match.longitude)
+                        else:
+                            coordinates = resolve_address(text_address)
+                        if coordinates:
                             st.session_state.current_location = {
-                                "latitude": location.latitude,
-                                "longitude": location.longitude
+                                "latitude": coordinates[0],
+                                "longitude": coordinates[1]
                             }
                             st.success("Address verified and location coordinates captured")
                         else:
@@ -452,17 +371,43 @@ def main():
                 help="Upload clear photos showing the situation, injuries, or surroundings"
             )
             
+            # Start preprocessing as soon as files arrive; jobs are keyed by upload
+            # so each photo is only processed once across reruns
+            previous_jobs = st.session_state.photo_jobs
+            st.session_state.photo_jobs = {
+                file.file_id: previous_jobs.get(file.file_id)
+                or submit_preprocess(file.getvalue(), file.name, st.session_state.blob_session)
+                for file in uploaded_files or []
+            }
+
             # Show preview of uploaded images
+            processed_photos = []
             if uploaded_files:
                 st.write("**Image Previews:**")
                 cols = st.columns(3)
-                for i, file in enumerate(uploaded_files):
+                for i, job in enumerate(st.session_state.photo_jobs.values()):
                     with cols[i % 3]:
-                        st.image(file, use_column_width=True)
+                        try:
+                            processed = job.result()
+                            thumbnail = processed.thumbnail.getvalue()
+                        except Exception as e:
+                            logger.error(f"Image preprocessing failed: {e}")
+                            st.warning("Couldn't read this image")
+                            continue
+                        processed_photos.append(processed)
+                        st.image(thumbnail, use_container_width=True)
+
+                stats = summarize(processed_photos)
+                if stats["count"]:
+                    st.caption(
+                        f"Optimized {stats['count']} photo(s): "
+                        f"{stats['original_bytes'] / 1e6:.1f} MB → {stats['transmit_bytes'] / 1e6:.1f} MB "
+                        f"in {stats['max_elapsed'] * 1000:.0f} ms"
+                    )
             
             if st.button("Send Emergency Alert", use_container_width=True):
-                if uploaded_files:
-                    st.session_state.photos = uploaded_files
+                st.session_state.photos = processed_photos
+                st.session_state.photo_jobs = {}
                 
                 st.session_state.step = 'summary'
                 st.rerun()
@@ -489,6 +434,13 @@ def main():
             
             st.write("**Photos Attached:**")
             st.write(f"{len(st.session_state.photos)} image(s)" if st.session_state.photos else "None")
+
+            # Read by the triage engine so the most severe alerts are sent first
+            description = st.text_area(
+                "Describe the situation (optional)",
+                max_chars=DESCRIPTION_MAX_CHARS,
+                placeholder="e.g. He collapsed and is not breathing",
+            )
             
             if st.button("🚨 CONFIRM AND SEND ALERT 🚨", 
                         use_container_width=True,
@@ -498,19 +450,34 @@ def main():
                     'type': st.session_state.emergency_type,
                     'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                     'current_location': st.session_state.current_location,
-                    'text_address': st.session_state.text_address
+                    'text_address': st.session_state.text_address,
+                    'description': description.strip() or None,
                 }
 
-                with st.spinner("Dispatching Emergency Services..."):
-                    show_progress_bar()
-                    if send_emergency_alert_to_admin(emergency_details, st.session_state.photos):
-                        st.session_state.alert_sent = True
-                        st.session_state.emergency_status = "en_route"
-                        st.session_state.estimated_time = get_estimated_time()
-                        st.session_state.dispatch_time = datetime.now()
-                        st.rerun()
-                    else:
-                        st.error("Failed to send alert. Please try again.")
+                # Delivery happens in the background; the dispatched view polls the ticket
+                try:
+                    estimated_time = get_estimated_time(emergency_details)
+                    ticket = submit_alert(
+                        emergency_details, st.session_state.photos, st.session_state.alert_key,
+                        estimated_minutes=estimated_time,
+                    )
+                except Exception as e:
+                    # Nothing was queued (or the same alert_key makes a retry a no-op), so stay on this step
+                    logger.error(f"Failed to submit emergency alert: {e}")
+                    st.error("Failed to send alert. Please try again.")
+                else:
+                    st.session_state.emergency_details = emergency_details
+                    st.session_state.estimated_time = estimated_time
+                    st.session_state.dispatch_ticket = ticket
+                    # The outbox holds its own links to the photos now
+                    get_blob_store().release(st.session_state.blob_session)
+                    st.session_state.dispatch_polling = True
+                    st.session_state.alert_sent = True
+                    st.session_state.emergency_status = "en_route"
+                    st.session_state.dispatch_time = datetime.now()
+                    # Lets a reload, or another replica behind the load balancer, find this incident
+                    st.query_params["incident"] = st.session_state.dispatch_ticket
+                    st.rerun()
 
     else:
         # Emergency services dispatched view
@@ -532,6 +499,8 @@ def main():
             "⏱️"
         )
 
+        st.fragment(run_every=2 if st.session_state.dispatch_polling else None)(render_dispatch_status)()
+
         custom_card(
             "📝 Important Instructions",
             """
@@ -567,28 +536,20 @@ def main():
         # Show location map if available
         if st.session_state.current_location:
             with st.expander("📍 Your Location", expanded=True):
-                m = folium.Map(
-                    location=[st.session_state.current_location['latitude'], 
-                             st.session_state.current_location['longitude']],
-                    zoom_start=15,
-                    tiles="cartodbdark_matter"
-                )
-                folium.Marker(
-                    [st.session_state.current_location['latitude'], 
-                     st.session_state.current_location['longitude']],
-                    popup="Your Location",
-                    icon=folium.Icon(color="red", icon="exclamation-triangle")
-                ).add_to(m)
-                st_folium(m, width=700, height=400)
+                location_preview(st.session_state.current_location['latitude'],
+                                 st.session_state.current_location['longitude'])
 
         # Reset button (bottom of page)
         st.markdown("---")
         if st.button("Start New Emergency Request", 
                     use_container_width=True,
                     type="secondary"):
+            get_blob_store().release(st.session_state.blob_session, ttl=0)
+            st.query_params.clear()
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
 
 if __name__ == "__main__":
-    main()
+    with rerun_timer(), metrics.span("wizard_rerun", step=wizard_step()):
+        main()
@@ -0,0 +1,277 @@
+import os
+import math
+import logging
+import threading
+from itertools import chain
+import numpy as np
+from offline_geocoder import haversine_km, beyond_km
+from incidents import report_location
+
+logger = logging.getLogger(__name__)
+
+# Capabilities each emergency type needs; a unit matches if it has any of them
+EMERGENCY_CAPABILITIES = {
+    "Medical Emergency": {"ambulance"},
+    "Accident": {"ambulance", "trauma"},
+    "Heart/Chest Pain": {"cardiac"},
+    "Pregnancy": {"maternity"},
+    "Fire": {"fire"},
+    "Other Emergency": {"ambulance"},
+}
+
+# Average urban road speed by unit kind, in km/h
+KIND_SPEEDS_KMH = {
+    "ambulance": 40.0,
+    "fire": 35.0,
+    "hospital": 40.0,
+}
+DEFAULT_SPEED_KMH = 40.0
+# Road distance relative to great-circle distance in Indian cities
+DETOUR_FACTOR = 1.4
+# Time from dispatch until the unit is moving
+TURNOUT_MINUTES = 2.0
+# Units the vectorized scan ranks in the time the ring walk visits one cell
+SCAN_UNITS_PER_CELL = 10
+
+
+class UnitMatch:
+    """A unit able to respond, with its distance and estimated arrival time"""
+
+    def __init__(self, unit_id, kind, distance_km, eta_minutes):
+        self.unit_id = unit_id
+        self.kind = kind
+        self.distance_km = distance_km
+        self.eta_minutes = eta_minutes
+
+
+def load_fleet(path):
+    """Read a fleet file into a list of (unit_id, kind, capabilities, lat, lon).
+
+    Tab-separated ``unit_id, kind, capabilities, latitude, longitude`` with
+    comma-separated capabilities, e.g. ``AMB-12  ambulance  ambulance,cardiac``.
+    Hospitals are listed the same way with the services their own ambulances
+    offer. Lines starting with ``#`` are ignored.
+    """
+    units = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            unit_id, kind, capabilities, lat, lon = line.rstrip("\n").split("\t")[:5]
+            capabilities = {c.strip() for c in capabilities.split(",") if c.strip()}
+            units.append((unit_id, kind, capabilities, float(lat), float(lon)))
+    return units
+
+
+class EtaEngine:
+    """k-nearest search over response units on a mutable grid index.
+
+    Unit positions, capability bitmasks and availability live in NumPy arrays
+    indexed by slot, and each grid cell keeps the set of slots inside it. A
+    position update rewrites one slot and, if the unit crossed a cell border,
+    moves it between two sets, so the index never needs rebuilding. Queries
+    walk outward ring by ring like OfflineGeocoder, filter each ring's slots
+    by capability and availability and rank them with a vectorized haversine.
+    The walk stops once even the fastest unit in the next ring could not beat
+    the k-th best arrival found. It starts at the first ring that can reach
+    the fleet's bounding box, and when there are at most k suitable units or
+    walking on would cost more than ranking them all (sparse capabilities, a
+    query far from the fleet), a vectorized scan of every suitable unit
+    replaces or finishes the walk.
+    """
+
+    def __init__(self, units=(), cell_size=0.25, detour_factor=DETOUR_FACTOR,
+                 turnout_minutes=TURNOUT_MINUTES, speeds=None):
+        self.cell_size = cell_size
+        self.detour_factor = detour_factor
+        self.turnout_minutes = turnout_minutes
+        self.speeds = dict(KIND_SPEEDS_KMH, **(speeds or {}))
+        self._max_speed = max(DEFAULT_SPEED_KMH, *self.speeds.values())
+        self._capability_bits = {}
+        self._slots = {}
+        self._ids, self._kinds = [], []
+        self._lats = np.empty(0)
+        self._lons = np.empty(0)
+        self._speeds = np.empty(0)
+        self._masks = np.empty(0, dtype=np.int64)
+        self._available = np.empty(0, dtype=bool)
+        self._cells = {}
+        self._unit_cells = []
+        self._bounds = None
+        self._lock = threading.Lock()
+        for unit_id, kind, capabilities, lat, lon in units:
+            self.add_unit(unit_id, kind, capabilities, lat, lon)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def _mask(self, capabilities, create=False):
+        mask = 0
+        for capability in capabilities:
+            bit = self._capability_bits.get(capability)
+            if bit is None:
+                if not create:
+                    continue
+                if len(self._capability_bits) >= 63:
+                    raise ValueError("too many distinct unit capabilities")
+                bit = self._capability_bits[capability] = len(self._capability_bits)
+            mask |= 1 << bit
+        return mask
+
+    def _grow(self):
+        capacity = max(64, 2 * len(self._lats))
+        for name in ("_lats", "_lons", "_speeds", "_masks", "_available"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _place(self, slot, cell):
+        self._cells.setdefault(cell, set()).add(slot)
+        row, col = cell
+        if self._bounds is None:
+            self._bounds = [row, row, col, col]
+        else:
+            bounds = self._bounds
+            bounds[0], bounds[1] = min(bounds[0], row), max(bounds[1], row)
+            bounds[2], bounds[3] = min(bounds[2], col), max(bounds[3], col)
+
+    def add_unit(self, unit_id, kind, capabilities, lat, lon, available=True):
+        """Add a unit, or update it in place if the ID is already known"""
+        with self._lock:
+            slot = self._slots.get(unit_id)
+            if slot is None:
+                slot = self._slots[unit_id] = len(self._ids)
+                if slot >= len(self._lats):
+                    self._grow()
+                self._ids.append(unit_id)
+                self._kinds.append(kind)
+                self._unit_cells.append(None)
+            self._kinds[slot] = kind
+            self._speeds[slot] = self.speeds.get(kind, DEFAULT_SPEED_KMH)
+            self._masks[slot] = self._mask(capabilities, create=True)
+            self._available[slot] = available
+        self.update_position(unit_id, lat, lon)
+
+    def update_position(self, unit_id, lat, lon):
+        """Move a unit; only its grid cell membership changes in the index"""
+        with self._lock:
+            slot = self._slots[unit_id]
+            self._lats[slot], self._lons[slot] = lat, lon
+            cell, previous = self._cell(lat, lon), self._unit_cells[slot]
+            if cell != previous:
+                if previous is not None:
+                    bucket = self._cells[previous]
+                    bucket.discard(slot)
+                    if not bucket:
+                        del self._cells[previous]
+                self._place(slot, cell)
+                self._unit_cells[slot] = cell
+
+    def set_available(self, unit_id, available):
+        """Mark a unit as free to respond or as already committed"""
+        with self._lock:
+            self._available[self._slots[unit_id]] = available
+
+    def _ring(self, row, col, radius):
+        if radius == 0:
+            yield row, col
+            return
+        for dc in range(-radius, radius + 1):
+            yield row - radius, col + dc
+            yield row + radius, col + dc
+        for dr in range(-radius + 1, radius):
+            yield row + dr, col - radius
+            yield row + dr, col + radius
+
+    def _max_ring(self, row, col):
+        top, bottom, left, right = self._bounds
+        return max(abs(row - top), abs(row - bottom), abs(col - left), abs(col - right))
+
+    def _min_ring(self, row, col):
+        # Rings closer than the bounding box of all units are empty
+        top, bottom, left, right = self._bounds
+        return max(0, top - row, row - bottom, left - col, col - right)
+
+    def _minutes(self, distances, speeds):
+        return self.turnout_minutes + distances * self.detour_factor / speeds * 60
+
+    def _rank(self, lat, lon, slots, k):
+        distances = haversine_km(lat, lon, self._lats[slots], self._lons[slots])
+        minutes = self._minutes(distances, self._speeds[slots])
+        if len(slots) > k:
+            keep = np.argpartition(minutes, k - 1)[:k]
+            slots, distances, minutes = slots[keep], distances[keep], minutes[keep]
+        return slots, distances, minutes
+
+    def nearest(self, lat, lon, emergency_type, k=3):
+        """Return up to ``k`` available suitable units ordered by estimated arrival"""
+        capabilities = EMERGENCY_CAPABILITIES.get(emergency_type, {"ambulance"})
+        with self._lock:
+            mask = self._mask(capabilities)
+            if not mask or self._bounds is None:
+                return []
+            count = len(self._ids)
+            suitable = np.flatnonzero(((self._masks[:count] & mask) != 0) & self._available[:count])
+            row, col = self._cell(lat, lon)
+            slots, distances, minutes = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+            scan = len(suitable) <= k
+            for radius in range(self._min_ring(row, col), 0 if scan else self._max_ring(row, col) + 1):
+                if (2 * radius + 1) ** 2 * SCAN_UNITS_PER_CELL > len(suitable):
+                    # Walking further costs more than ranking every suitable unit
+                    scan = True
+                    break
+                buckets = [self._cells[cell] for cell in self._ring(row, col, radius) if cell in self._cells]
+                if buckets:
+                    ring = np.fromiter(chain.from_iterable(buckets), dtype=np.int64)
+                    ring = ring[((self._masks[ring] & mask) != 0) & self._available[ring]]
+                    if len(ring):
+                        slots, distances, minutes = self._rank(lat, lon, np.concatenate((slots, ring)), k)
+                if len(slots) >= k:
+                    # Nothing further out arrives sooner than the fastest unit from the next ring's edge
+                    soonest = self._minutes(beyond_km(lat, lon, row, col, radius, self.cell_size), self._max_speed)
+                    if minutes.max() <= soonest:
+                        break
+            if scan:
+                slots, distances, minutes = self._rank(lat, lon, suitable, k)
+            order = np.argsort(minutes)
+            return [
+                UnitMatch(self._ids[slots[i]], self._kinds[slots[i]], float(distances[i]), float(minutes[i]))
+                for i in order
+            ]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_eta_engine():
+    """Return the process-wide ETA engine, or None if no fleet is configured"""
+    global _engine
+    if _engine is None:
+        path = os.getenv("FLEET_PATH")
+        if not path:
+            return None
+        with _engine_lock:
+            if _engine is None:
+                _engine = EtaEngine(
+                    load_fleet(path),
+                    cell_size=float(os.getenv("FLEET_CELL_SIZE", "0.25")),
+                    detour_factor=float(os.getenv("ETA_DETOUR_FACTOR", str(DETOUR_FACTOR))),
+                    turnout_minutes=float(os.getenv("ETA_TURNOUT_MINUTES", str(TURNOUT_MINUTES))),
+                )
+                logger.info(f"ETA engine loaded {len(_engine)} units from {path}")
+    return _engine
+
+
+def estimate_minutes(emergency_details):
+    """Minutes until the nearest suitable unit reaches a report, or None without a fleet or location"""
+    engine = get_eta_engine()
+    location = report_location(emergency_details)
+    if engine is None or location is None:
+        return None
+    matches = engine.nearest(*location, emergency_details['type'], k=1)
+    return max(1, round(matches[0].eta_minutes)) if matches else None
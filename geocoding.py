@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+import metrics
+from bootstrap import lazy_import
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Sentinel so a cached "no result" (None) can be told apart from a cache miss
+_MISS = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with per-entry TTL"""
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISS
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return _MISS
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """SQLite-backed key/value store with TTL, shared across reruns and restarts"""
+
+    def __init__(self, path):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocache ("
+                "key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM geocache WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM geocache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return _MISS, 0
+        return json.loads(row[0]), row[1] - time.time()
+
+    def set(self, key, value, ttl):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+
+
+def normalize_address(address):
+    """Normalize a free-form address so trivially different spellings share a cache entry"""
+    address = re.sub(r"[^\w\s,]", " ", address.lower())
+    address = re.sub(r"\s*,\s*", ", ", address)
+    address = re.sub(r"\s+", " ", address)
+    return address.strip(" ,")
+
+
+class GeocodingService:
+    """Nominatim front-end with a two-level (memory + disk) cache.
+
+    Reverse lookups are bucketed to ``precision`` decimal places, so clicks a
+    few metres apart resolve to the same entry. Forward lookups are keyed on
+    the normalized address. Empty results are cached too, with a shorter TTL.
+    Network errors are not cached and propagate to the caller.
+    """
+
+    def __init__(self, cache_path, precision=4, ttl=30 * 24 * 3600, negative_ttl=3600,
+                 lru_size=2048, user_agent="emergency_app", min_interval=1.0,
+                 domain="nominatim.openstreetmap.org", scheme="https", timeout=1.0):
+        self.precision = precision
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.min_interval = min_interval
+        self._geolocator = lazy_import("geopy.geocoders").Nominatim(
+            user_agent=user_agent, domain=domain, scheme=scheme, timeout=timeout
+        )
+        self._memory = LRUCache(lru_size)
+        self._disk = DiskCache(cache_path)
+        self._throttle_lock = threading.Lock()
+        self._last_request = 0.0
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+        metrics.inc("geocode_lookups_total", 1, "Geocoding lookups by cache result", result=name)
+
+    def _lookup(self, key, fetch):
+        value = self._memory.get(key)
+        if value is not _MISS:
+            self._count("memory_hits")
+            return value
+
+        value, remaining = self._disk.get(key)
+        if value is not _MISS:
+            self._count("disk_hits")
+            self._memory.set(key, value, remaining)
+            return value
+
+        self._count("misses")
+        try:
+            value = self._throttled(fetch, key[:3])
+        except Exception:
+            self._count("errors")
+            raise
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._memory.set(key, value, ttl)
+        self._disk.set(key, value, ttl)
+        return value
+
+    def _throttled(self, fetch, kind):
+        # Nominatim's usage policy allows at most one request per second
+        with self._throttle_lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                with metrics.span("nominatim_request", kind=kind):
+                    return fetch()
+            finally:
+                self._last_request = time.monotonic()
+
+    def quantize(self, lat, lon):
+        return f"{float(lat):.{self.precision}f}", f"{float(lon):.{self.precision}f}"
+
+    def reverse(self, lat, lon):
+        """Return the address for a coordinate pair, or None if Nominatim has none"""
+        qlat, qlon = self.quantize(lat, lon)
+
+        def fetch():
+            location = self._geolocator.reverse(f"{qlat}, {qlon}")
+            return location.address if location and location.address else None
+
+        return self._lookup(f"rev:{qlat},{qlon}", fetch)
+
+    def geocode(self, address):
+        """Return (latitude, longitude) for a free-form address, or None if not found"""
+        normalized = normalize_address(address)
+        if not normalized:
+            return None
+
+        def fetch():
+            location = self._geolocator.geocode(address)
+            return [location.latitude, location.longitude] if location else None
+
+        value = self._lookup(f"fwd:{normalized}", fetch)
+        return tuple(value) if value is not None else None
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self._memory)
+        return stats
+
+
+def nominatim_enabled():
+    """Whether reverse lookups should be enriched with a full Nominatim address"""
+    return os.getenv("NOMINATIM_ENRICH", "1") != "0"
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Return the process-wide geocoding service, creating it on first use"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = GeocodingService(
+                    cache_path=os.getenv("GEOCODE_CACHE_PATH", os.path.join(BASE_DIR, ".cache", "geocode.sqlite3")),
+                    precision=int(os.getenv("GEOCODE_PRECISION", "4")),
+                    ttl=int(os.getenv("GEOCODE_TTL", str(30 * 24 * 3600))),
+                    negative_ttl=int(os.getenv("GEOCODE_NEGATIVE_TTL", "3600")),
+                    lru_size=int(os.getenv("GEOCODE_LRU_SIZE", "2048")),
+                    min_interval=float(os.getenv("NOMINATIM_MIN_INTERVAL", "1.0")),
+                    domain=os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org"),
+                    scheme=os.getenv("NOMINATIM_SCHEME", "https"),
+                    timeout=float(os.getenv("NOMINATIM_TIMEOUT", "1")),
+                )
+                logger.info(f"Geocoding cache ready at {_service._disk.path}")
+    return _service
@@ -0,0 +1,357 @@
+"""Service area boundaries: where a point is, and which admin chat its alerts go to.
+
+Boundaries are read from a GeoJSON FeatureCollection (``GEOFENCE_PATH``) of
+Polygon and MultiPolygon features with these properties:
+
+    name      display name, e.g. "Pune"
+    level     "service_area", "district" or "state"; the most specific area routes
+    chat_id   Telegram chat for alerts from inside the area (optional)
+
+Areas may overlap: a district inside a state routes to the district's chat
+if it has one, and to the state's otherwise. Points outside every area are
+refused on the map and routed to ``ADMIN_CHAT_ID``. Without ``GEOFENCE_PATH``
+every location is accepted and all alerts go to ``ADMIN_CHAT_ID``.
+
+    python geofence.py check 18.52 73.85
+    python geofence.py reroute --since 24     # after editing boundaries
+"""
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+from incidents import report_location
+
+logger = logging.getLogger(__name__)
+
+# Most specific first
+LEVELS = ("service_area", "district", "state")
+
+# Where the crossing test ends in each boundary cell, as a fraction of the
+# cell; off-centre so boundaries drawn along round coordinates miss it
+_REFERENCE = (0.4142, 0.5774)
+# Points x edges compared at once while building
+_CHUNK = 1 << 21
+
+
+class Area:
+    """A named boundary and the admin chat its alerts go to"""
+
+    def __init__(self, name, level=None, chat_id=None, properties=None):
+        self.name = name
+        self.level = level
+        self.chat_id = str(chat_id) if chat_id not in (None, "") else None
+        self.properties = properties or {}
+
+    @property
+    def rank(self):
+        return LEVELS.index(self.level) if self.level in LEVELS else len(LEVELS)
+
+    def describe(self):
+        return f"{self.name} ({self.level})" if self.level else self.name
+
+
+def _rings(geometry):
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError(f"unsupported geometry {geometry['type']!r}")
+    # Holes are rings too: the even-odd rule leaves them outside
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon if len(ring) >= 3]
+
+
+def load_geojson(path):
+    """Read boundaries into a list of (Area, rings), rings as (n, 2) longitude/latitude arrays"""
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+    features = collection["features"] if collection.get("type") == "FeatureCollection" else [collection]
+    boundaries = []
+    for number, feature in enumerate(features):
+        properties = feature.get("properties") or {}
+        name = properties.get("name") or f"area {number + 1}"
+        try:
+            rings = _rings(feature["geometry"])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping boundary {name!r} in {path}: {e}")
+            continue
+        boundaries.append((Area(name, properties.get("level"), properties.get("chat_id"), properties), rings))
+    return boundaries
+
+
+def _ray_inside(px, py, x1, y1, x2, y2):
+    """Even-odd test of points (column vectors) against edges (row vectors)"""
+    straddles = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    return (np.count_nonzero(straddles & (px < crossing_x), axis=-1) & 1).astype(bool)
+
+
+def _crossings(px, py, qx, qy, x1, y1, x2, y2):
+    """Whether each segment P-Q properly crosses each edge; shared endpoints count on one side only"""
+    dx, dy = qx - px, qy - py
+    ex, ey = x2 - x1, y2 - y1
+    return (((dx * (y1 - py) - dy * (x1 - px)) > 0) != ((dx * (y2 - py) - dy * (x2 - px)) > 0)) & \
+        (((ex * (py - y1) - ey * (px - x1)) > 0) != ((ex * (qy - y1) - ey * (qx - x1)) > 0))
+
+
+class GeofenceIndex:
+    """Point-in-polygon lookup over a grid of pre-clipped boundary cells.
+
+    Every area's bounding box is cut into square cells. A cell its boundary
+    does not pass through lies wholly inside or wholly outside the area,
+    which a scanline fill decides once when the index is built, so points
+    there are classified by a dictionary lookup. Cells the boundary crosses
+    keep only the edges passing through them, and whether a fixed reference
+    point in the cell is inside: a query point is on the same side as the
+    reference point when the segment between them crosses the kept edges an
+    even number of times. Either way a lookup touches a handful of edges
+    however detailed the boundaries are, and takes microseconds.
+    """
+
+    def __init__(self, boundaries, cell_size=0.1):
+        self.cell_size = cell_size
+        self.areas = [area for area, _ in boundaries]
+        self._rank = [area.rank for area in self.areas]
+        edges, owners = [], []
+        for number, (_, rings) in enumerate(boundaries):
+            for ring in rings:
+                if not np.array_equal(ring[0], ring[-1]):
+                    ring = np.vstack([ring, ring[:1]])
+                edges.append(np.hstack([ring[:-1], ring[1:]]))
+                owners.append(np.full(len(ring) - 1, number))
+        edges = np.concatenate(edges) if edges else np.empty((0, 4))
+        owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.int64)
+        keep = (edges[:, 0] != edges[:, 2]) | (edges[:, 1] != edges[:, 3])
+        self._edges, self._owners = np.ascontiguousarray(edges[keep]), owners[keep]
+        # Edges are grouped by area, in area order
+        self._spans = np.searchsorted(self._owners, np.arange(len(self.areas) + 1))
+        self._cells = {}
+        self._build()
+
+    def __len__(self):
+        return len(self.areas)
+
+    def _edge_cells(self):
+        # (row, col, edge) for every cell each edge passes through
+        x1, y1, x2, y2 = self._edges.T
+        size = self.cell_size
+        col0 = np.floor(np.minimum(x1, x2) / size).astype(np.int64)
+        col1 = np.floor(np.maximum(x1, x2) / size).astype(np.int64)
+        row0 = np.floor(np.minimum(y1, y2) / size).astype(np.int64)
+        row1 = np.floor(np.maximum(y1, y2) / size).astype(np.int64)
+        widths = col1 - col0 + 1
+        counts = widths * (row1 - row0 + 1)
+        edge = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cols = col0[edge] + offsets % widths[edge]
+        rows = row0[edge] + offsets // widths[edge]
+        # Within its bounding box a slanted edge misses the cells whose four
+        # corners all lie on the same side of it
+        x1, y1, x2, y2 = x1[edge], y1[edge], x2[edge], y2[edge]
+        above = np.zeros(len(edge), dtype=np.int8)
+        for dx in (0, 1):
+            for dy in (0, 1):
+                side = (x2 - x1) * ((rows + dy) * size - y1) - (y2 - y1) * ((cols + dx) * size - x1)
+                above += np.sign(side).astype(np.int8)
+        touches = np.abs(above) < 4
+        return rows[touches], cols[touches], edge[touches]
+
+    def _area_edges(self, number):
+        return self._edges[self._spans[number]:self._spans[number + 1]]
+
+    def _interior_cells(self, number, boundary):
+        # Scanline fill through cell centres: between alternate crossings is inside
+        x1, y1, x2, y2 = (column[None, :] for column in self._area_edges(number).T)
+        if not x1.size:
+            return
+        size = self.cell_size
+        rows = np.arange(math.floor(y1.min() / size), math.floor(y1.max() / size) + 1)
+        centres = ((rows + 0.5) * size)[:, None]
+        straddles = (y1 > centres) != (y2 > centres)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_x = np.where(straddles, x1 + (centres - y1) * (x2 - x1) / (y2 - y1), np.inf)
+        crossing_x.sort(axis=1)
+        for row, xs in zip(rows.tolist(), crossing_x):
+            xs = xs[:np.count_nonzero(np.isfinite(xs))]
+            for start, end in zip(xs[0::2], xs[1::2]):
+                for col in range(math.ceil(start / size - 0.5), math.floor(end / size - 0.5) + 1):
+                    if (row, col) not in boundary:
+                        yield row, col
+
+    def _build(self):
+        rows, cols, edge = self._edge_cells()
+        owner = self._owners[edge]
+        order = np.lexsort((owner, cols, rows))
+        rows, cols, edge, owner = rows[order], cols[order], edge[order], owner[order]
+        starts = np.flatnonzero(np.concatenate(([True], (np.diff(rows) != 0) | (np.diff(cols) != 0))))
+        ends = np.append(starts[1:], len(rows))
+
+        boundary, crossed_by = {}, {}
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            cell = (int(rows[start]), int(cols[start]))
+            boundary[cell] = (edge[start:end], owner[start:end])
+            for number in set(owner[start:end].tolist()):
+                crossed_by.setdefault(number, []).append(cell)
+
+        full = {}
+        for number in range(len(self.areas)):
+            for cell in self._interior_cells(number, set(crossed_by.get(number, ()))):
+                full.setdefault(cell, []).append(number)
+
+        # Reference points of boundary cells, and whether each is inside the areas crossing the cell
+        size = self.cell_size
+        reference = {cell: ((cell[1] + _REFERENCE[0]) * size, (cell[0] + _REFERENCE[1]) * size) for cell in boundary}
+        reference_inside = {}
+        for number, cells in crossed_by.items():
+            x1, y1, x2, y2 = (column[None, :] for column in self._area_edges(number).T)
+            points = np.array([reference[cell] for cell in cells])
+            step = max(1, _CHUNK // x1.size)
+            for chunk in range(0, len(cells), step):
+                px, py = points[chunk:chunk + step, 0:1], points[chunk:chunk + step, 1:2]
+                for cell, inside in zip(cells[chunk:chunk + step], _ray_inside(px, py, x1, y1, x2, y2).tolist()):
+                    reference_inside[(cell, number)] = inside
+
+        for cell in set(full) | set(boundary):
+            whole = tuple(sorted(full.get(cell, ()), key=self._rank.__getitem__))
+            if cell not in boundary:
+                self._cells[cell] = (whole, None)
+                continue
+            edges, owners = boundary[cell]
+            local, positions = np.unique(owners, return_inverse=True)
+            local = local.tolist()
+            x1, y1, x2, y2 = (np.ascontiguousarray(column) for column in self._edges[edges].T)
+            self._cells[cell] = (whole, (
+                local, np.array([reference_inside[(cell, number)] for number in local]),
+                positions, x1, y1, x2, y2, reference[cell],
+            ))
+
+    def _sorted(self, numbers):
+        return [self.areas[number] for number in sorted(numbers, key=self._rank.__getitem__)]
+
+    def locate(self, lat, lon):
+        """Areas containing a point, most specific first"""
+        entry = self._cells.get((math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)))
+        if entry is None:
+            return []
+        whole, crossed = entry
+        if crossed is None:
+            return [self.areas[number] for number in whole]
+        local, reference_inside, positions, x1, y1, x2, y2, (rx, ry) = crossed
+        flips = np.bincount(positions[_crossings(lon, lat, rx, ry, x1, y1, x2, y2)], minlength=len(local)) & 1
+        inside = [number for number, flip, ref in zip(local, flips.tolist(), reference_inside.tolist()) if flip != ref]
+        return self._sorted(list(whole) + inside)
+
+    def locate_many(self, lats, lons):
+        """``locate`` for arrays of points, vectorized per grid cell"""
+        lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+        found = [[] for _ in range(len(lats))]
+        if not len(lats):
+            return found
+        rows = np.floor(lats / self.cell_size).astype(np.int64)
+        cols = np.floor(lons / self.cell_size).astype(np.int64)
+        cells, inverse = np.unique(np.stack([rows, cols], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(inverse, minlength=len(cells)))))
+        for number, (row, col) in enumerate(cells.tolist()):
+            entry = self._cells.get((row, col))
+            if entry is None:
+                continue
+            members = order[bounds[number]:bounds[number + 1]]
+            whole, crossed = entry
+            inside = [list(whole) for _ in members]
+            if crossed is not None:
+                local, reference_inside, positions, x1, y1, x2, y2, (rx, ry) = crossed
+                crosses = _crossings(lons[members, None], lats[members, None], rx, ry, x1, y1, x2, y2)
+                # Crossings per point and local area, by a one-hot matrix product
+                flips = (crosses.astype(np.int64) @ np.eye(len(local), dtype=np.int64)[positions]) & 1
+                for point, row_flips in enumerate(flips != reference_inside):
+                    inside[point].extend(local[i] for i in np.flatnonzero(row_flips).tolist())
+            for point, numbers in zip(members.tolist(), inside):
+                found[point] = self._sorted(numbers)
+        return found
+
+
+def route_for(areas):
+    """JSON-serializable route of a report from the areas containing it, most specific first"""
+    chat = next((area for area in areas if area.chat_id), None)
+    return {
+        "areas": [area.name for area in areas],
+        "area": chat.name if chat else None,
+        "chat_id": chat.chat_id if chat else None,
+    }
+
+
+_geofence = None
+_geofence_lock = threading.Lock()
+
+
+def get_geofence():
+    """Return the process-wide geofence index, or None if no boundaries are configured"""
+    global _geofence
+    if _geofence is None:
+        path = os.getenv("GEOFENCE_PATH")
+        if not path:
+            return None
+        with _geofence_lock:
+            if _geofence is None:
+                started = time.perf_counter()
+                index = GeofenceIndex(load_geojson(path), cell_size=float(os.getenv("GEOFENCE_CELL_SIZE", "0.1")))
+                logger.info(f"Geofence loaded {len(index)} areas from {path} "
+                            f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+                _geofence = index
+    return _geofence
+
+
+def locate(lat, lon):
+    """Areas containing a point, most specific first, or None if no boundaries are configured"""
+    geofence = get_geofence()
+    return None if geofence is None else geofence.locate(lat, lon)
+
+
+def route(emergency_details):
+    """Route of a report from its location, or None without boundaries or a location"""
+    geofence = get_geofence()
+    location = report_location(emergency_details)
+    if geofence is None or location is None:
+        return None
+    return route_for(geofence.locate(*location))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect service areas and re-route stored incidents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("check", help="print the areas containing a point and its route")
+    check.add_argument("latitude", type=float)
+    check.add_argument("longitude", type=float)
+    reroute = commands.add_parser("reroute", help="recompute the route of stored incidents")
+    reroute.add_argument("--since", type=float, help="only incidents reported in the last SINCE hours")
+    reroute.add_argument("--status", help="only incidents with this status, e.g. reported")
+    args = parser.parse_args(argv)
+
+    if get_geofence() is None:
+        parser.error("GEOFENCE_PATH is not set")
+    if args.command == "check":
+        areas = locate(args.latitude, args.longitude)
+        for area in areas:
+            print(area.describe() + (f" -> chat {area.chat_id}" if area.chat_id else ""))
+        print(json.dumps(route_for(areas)))
+        return 0 if areas else 1
+
+    from dispatch import reroute_incidents
+    since = time.time() - args.since * 3600 if args.since is not None else None
+    started = time.perf_counter()
+    checked, changed = reroute_incidents(since=since, status=args.status)
+    logger.info(f"Re-routed {changed} of {checked} incidents in {time.perf_counter() - started:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    import bootstrap  # noqa: F401  logging setup
+    sys.exit(main())
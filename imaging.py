@@ -0,0 +1,111 @@
+import io
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+import metrics
+from blob_store import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1600"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+THUMBNAIL_EDGE = int(os.getenv("THUMBNAIL_EDGE", "320"))
+THUMBNAIL_QUALITY = 70
+
+# Pillow releases the GIL while decoding, resizing and encoding, so threads
+# parallelize well here without the pickling cost of a process pool.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    thread_name_prefix="imaging",
+)
+
+
+class ProcessedImage:
+    """An uploaded photo reduced to a preview thumbnail and a transmit-ready JPEG"""
+
+    def __init__(self, name, original_size, thumbnail, transmit, elapsed):
+        self.name = name
+        self.original_size = original_size
+        self.thumbnail = thumbnail
+        self.transmit = transmit
+        self.elapsed = elapsed
+
+    @property
+    def bytes_saved(self):
+        return max(0, self.original_size - len(self.transmit))
+
+    def getvalue(self):
+        """Return the transmit variant, so this can stand in for an uploaded file"""
+        return self.transmit
+
+
+def _encode(image, max_edge, quality):
+    image = image.copy()
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # No exif= argument, so location and device metadata are dropped
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def preprocess_image(data, name="", max_edge=None, quality=None, thumbnail_edge=None):
+    """Decode, orient, strip metadata, downsize and re-encode one photo"""
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    quality = quality or IMAGE_QUALITY
+    thumbnail_edge = thumbnail_edge or THUMBNAIL_EDGE
+    started = time.perf_counter()
+
+    image = Image.open(io.BytesIO(data))
+    # Let the JPEG decoder scale down by a power of two while decoding
+    image.draft("RGB", (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    transmit = _encode(image, max_edge, quality)
+    thumbnail = _encode(image, thumbnail_edge, THUMBNAIL_QUALITY)
+
+    processed = ProcessedImage(name, len(data), thumbnail, transmit, time.perf_counter() - started)
+    metrics.observe("image_preprocess_seconds", processed.elapsed, "Photo preprocessing time")
+    metrics.inc("image_bytes_saved_total", processed.bytes_saved, "Upload bytes saved by preprocessing")
+    logger.info(
+        f"Preprocessed {name or 'photo'}: {len(data) / 1024:.0f} KB -> "
+        f"{len(transmit) / 1024:.0f} KB in {processed.elapsed * 1000:.0f} ms"
+    )
+    return processed
+
+
+def _preprocess_and_spool(data, name, session_id):
+    return get_blob_store().put_photo(session_id, preprocess_image(data, name))
+
+
+def submit_preprocess(data, name="", session_id=None):
+    """Start preprocessing in the background and return a Future for the result.
+
+    With a ``session_id`` the result is a StoredPhoto spooled to disk for that
+    session, so neither variant stays in memory; otherwise a ProcessedImage.
+    """
+    if session_id is not None:
+        return _executor.submit(_preprocess_and_spool, data, name, session_id)
+    return _executor.submit(preprocess_image, data, name)
+
+
+def summarize(processed_images):
+    """Aggregate byte and timing figures for a batch of processed photos"""
+    original = sum(p.original_size for p in processed_images)
+    transmit = sum(len(p.transmit) for p in processed_images)
+    return {
+        "count": len(processed_images),
+        "original_bytes": original,
+        "transmit_bytes": transmit,
+        "bytes_saved": original - transmit,
+        "max_elapsed": max((p.elapsed for p in processed_images), default=0.0),
+        "total_elapsed": sum(p.elapsed for p in processed_images),
+    }
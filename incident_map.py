@@ -0,0 +1,257 @@
+import os
+import time
+import math
+import threading
+import numpy as np
+from incident_store import REPORTED, NOTIFIED, FAILED, RESOLVED
+
+# Screen distance within which incidents are drawn as one cluster
+CLUSTER_PX = 60
+# From this zoom level on every incident gets its own marker
+MAX_CLUSTER_ZOOM = 15
+TILE_SIZE = 256
+
+# Index order is severity order: a cluster takes the colour of its worst member
+STATUSES = (REPORTED, NOTIFIED, FAILED)
+STATUS_COLORS = {REPORTED: "#FF9800", NOTIFIED: "#4CAF50", FAILED: "#F44336"}
+CLUSTER_COLOR = "#1E88E5"
+
+
+def mercator_pixels(lats, lons, zoom):
+    """Web Mercator pixel coordinates of many points at a zoom level"""
+    scale = TILE_SIZE * 2.0 ** zoom
+    x = (lons + 180.0) / 360.0 * scale
+    lat_rad = np.radians(np.clip(lats, -85.0511, 85.0511))
+    y = (1 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / math.pi) / 2 * scale
+    return x, y
+
+
+class _Incident:
+    def __init__(self, slot, incident_type):
+        self.slot = slot
+        self.type = incident_type
+        self.reports = {}
+
+
+class IncidentMap:
+    """Open incidents held in NumPy arrays for viewport clustering on the server.
+
+    ``sync()`` applies only the store changes since the last call, so each
+    refresh costs time proportional to what changed, not to the number of
+    open incidents. Merged reports are folded into one marker per incident.
+    ``features()`` bins the incidents inside the viewport into screen-space
+    grid cells with one vectorized pass and returns a GeoJSON
+    FeatureCollection holding at most one feature per cell, whatever the
+    total count. Incidents are dropped once all their reports are resolved
+    or they fall out of ``window``, and the arrays are compacted when most
+    slots are free, so memory follows the number of open incidents.
+    """
+
+    def __init__(self, window=24 * 3600):
+        self.window = window
+        self.version = 0
+        # Bumped whenever something drawn on the map changes
+        self.revision = 0
+        self._incidents = {}
+        self._keys = []
+        self._lats = np.empty(0)
+        self._lons = np.empty(0)
+        self._updated = np.empty(0)
+        self._status = np.empty(0, dtype=np.int8)
+        self._reports = np.empty(0, dtype=np.int32)
+        self._open = np.empty(0, dtype=bool)
+        # Slots of dropped incidents, reclaimed by the next compaction
+        self._free = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return int(self._open[:len(self._keys)].sum())
+
+    def _grow(self):
+        capacity = max(1024, 2 * len(self._lats))
+        for name in ("_lats", "_lons", "_updated", "_status", "_reports", "_open"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _drop(self, slot):
+        del self._incidents[self._keys[slot]]
+        self._keys[slot] = None
+        self._open[slot] = False
+        self._free += 1
+
+    def _compact(self):
+        slots = np.flatnonzero(self._open[:len(self._keys)])
+        capacity = max(1024, 2 * len(slots))
+        for name in ("_lats", "_lons", "_updated", "_status", "_reports", "_open"):
+            compacted = np.zeros(capacity, dtype=getattr(self, name).dtype)
+            compacted[:len(slots)] = getattr(self, name)[slots]
+            setattr(self, name, compacted)
+        self._keys = [self._keys[slot] for slot in slots.tolist()]
+        for slot, key in enumerate(self._keys):
+            self._incidents[key].slot = slot
+        self._free = 0
+
+    def _expire(self, now):
+        count = len(self._keys)
+        expired = np.flatnonzero(self._open[:count] & (self._updated[:count] < now - self.window))
+        for slot in expired.tolist():
+            self._drop(slot)
+        # Compacting only once half the slots are free keeps its cost amortized
+        if self._free > max(512, count // 2):
+            self._compact()
+        return len(expired) > 0
+
+    def _apply(self, record):
+        if record.latitude is None or record.longitude is None:
+            return False
+        key = record.incident_id or record.id
+        incident = self._incidents.get(key)
+        if incident is None:
+            if record.status == RESOLVED:
+                return False
+            if len(self._keys) >= len(self._lats):
+                # Reuse the slots of dropped incidents before asking for more
+                if self._free > len(self._keys) // 4:
+                    self._compact()
+                else:
+                    self._grow()
+            slot = len(self._keys)
+            incident = self._incidents[key] = _Incident(slot, record.type)
+            self._keys.append(key)
+            # The first report places the marker, as it does the incident
+            self._lats[slot], self._lons[slot] = record.latitude, record.longitude
+        slot = incident.slot
+        incident.reports[record.id] = record.status
+        statuses = [status for status in incident.reports.values() if status != RESOLVED]
+        if not statuses:
+            # Resolved: a later report of the same incident starts it afresh
+            self._drop(slot)
+            return True
+        self._open[slot] = True
+        self._status[slot] = max((STATUSES.index(status) for status in statuses if status in STATUSES), default=0)
+        self._reports[slot] = len(incident.reports)
+        self._updated[slot] = max(self._updated[slot], record.updated_at)
+        return True
+
+    def apply(self, records):
+        """Fold new or changed incident records into the map"""
+        with self._lock:
+            changed = False
+            for record in records:
+                changed |= self._apply(record)
+                self.version = max(self.version, record.version or 0)
+            if changed:
+                self.revision += 1
+
+    def expire(self, now=None):
+        """Drop incidents not updated within ``window`` and reclaim free slots"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._expire(now):
+                self.revision += 1
+
+    def sync(self, store, limit=5000, now=None):
+        """Apply every change written to ``store`` since the previous sync"""
+        while True:
+            records, version = store.changes(self.version, limit)
+            self.apply(records)
+            with self._lock:
+                self.version = max(self.version, version)
+            if len(records) < limit:
+                self.expire(now)
+                return self.revision
+
+    def _visible(self, bounds, now):
+        count = len(self._keys)
+        mask = self._open[:count] & (self._updated[:count] >= now - self.window)
+        if bounds is not None:
+            south, west, north, east = bounds
+            # A margin keeps markers from popping in at the edges while panning
+            pad_lat, pad_lon = (north - south) * 0.1, (east - west) * 0.1
+            lats, lons = self._lats[:count], self._lons[:count]
+            mask &= (lats >= south - pad_lat) & (lats <= north + pad_lat)
+            mask &= (lons >= west - pad_lon) & (lons <= east + pad_lon)
+        return np.flatnonzero(mask)
+
+    def counts(self, now=None):
+        """Open incidents by delivery status"""
+        now = time.time() if now is None else now
+        with self._lock:
+            slots = self._visible(None, now)
+            per_status = np.bincount(self._status[slots], minlength=len(STATUSES))
+        return {status: int(per_status[i]) for i, status in enumerate(STATUSES)}
+
+    def features(self, bounds=None, zoom=5, since=None, now=None):
+        """GeoJSON of open incidents in ``bounds`` (south, west, north, east), clustered for ``zoom``.
+
+        Single incidents carry their type, status and report count; clusters
+        their size and worst status. Incidents updated after ``since`` are
+        flagged as new.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            slots = self._visible(bounds, now)
+            lats, lons = self._lats[slots], self._lons[slots]
+            status, reports, updated = self._status[slots], self._reports[slots], self._updated[slots]
+            keys = [self._keys[slot] for slot in slots.tolist()]
+            types = [self._incidents[key].type for key in keys]
+
+        if zoom >= MAX_CLUSTER_ZOOM or len(slots) < 2:
+            groups, sizes = np.arange(len(slots)), np.ones(len(slots), dtype=np.int64)
+        else:
+            x, y = mercator_pixels(lats, lons, zoom)
+            cells = (x // CLUSTER_PX).astype(np.int64) << 32 | (y // CLUSTER_PX).astype(np.int64)
+            _, groups, sizes = np.unique(cells, return_inverse=True, return_counts=True)
+        group_count = len(sizes)
+
+        center_lats = np.bincount(groups, lats, group_count) / np.maximum(sizes, 1)
+        center_lons = np.bincount(groups, lons, group_count) / np.maximum(sizes, 1)
+        report_totals = np.bincount(groups, reports, group_count).astype(np.int64)
+        worst = np.zeros(group_count, dtype=np.int8)
+        np.maximum.at(worst, groups, status)
+        latest = np.zeros(group_count)
+        np.maximum.at(latest, groups, updated)
+        # Any member stands for a group of one
+        member = np.empty(group_count, dtype=np.int64)
+        member[groups] = np.arange(len(groups))
+        new = latest > since if since is not None else np.zeros(group_count, dtype=bool)
+
+        features = []
+        for lat, lon, size, total, worst_status, index, is_new in zip(
+            np.round(center_lats, 5).tolist(), np.round(center_lons, 5).tolist(), sizes.tolist(),
+            report_totals.tolist(), worst.tolist(), member.tolist(), new.tolist(),
+        ):
+            status_name = STATUSES[worst_status]
+            if size == 1:
+                label = f"{types[index]} · {status_name} · {total} report(s)"
+                style = {"radius": 7, "fillColor": STATUS_COLORS[status_name], "color": "#FFFFFF" if is_new else "#000000",
+                         "weight": 3 if is_new else 1, "fillOpacity": 0.9}
+                properties = {"id": keys[index], "type": types[index], "status": status_name, "reports": total}
+            else:
+                label = f"{size} incidents · {total} report(s)"
+                style = {"radius": min(30, 9 + 3 * math.log2(size)), "fillColor": CLUSTER_COLOR,
+                         "color": STATUS_COLORS[status_name], "weight": 4 if is_new else 3, "fillOpacity": 0.7}
+                properties = {"count": size, "reports": total, "status": status_name}
+            properties.update(label=label, new=is_new, style=style)
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": properties,
+            })
+        return {"type": "FeatureCollection", "features": features}
+
+
+_map = None
+_map_lock = threading.Lock()
+
+
+def get_incident_map():
+    """Return the process-wide incident map shared by every dashboard session"""
+    global _map
+    if _map is None:
+        with _map_lock:
+            if _map is None:
+                _map = IncidentMap(window=float(os.getenv("ADMIN_MAP_WINDOW", str(24 * 3600))))
+    return _map
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+REPORTED = "reported"
+NOTIFIED = "notified"
+FAILED = "failed"
+RESOLVED = "resolved"
+
+FIELDS = ("id", "incident_id", "type", "status", "latitude", "longitude",
+          "created_at", "updated_at", "estimated_minutes", "details")
+
+
+class IncidentRecord:
+    """One submitted emergency as every replica and the admin view see it"""
+
+    def __init__(self, id, type, status=REPORTED, latitude=None, longitude=None, created_at=None,
+                 updated_at=None, estimated_minutes=None, details=None, incident_id=None, version=None):
+        self.id = id
+        self.incident_id = incident_id
+        self.type = type
+        self.status = status
+        self.latitude = latitude
+        self.longitude = longitude
+        self.created_at = created_at if created_at is not None else time.time()
+        self.updated_at = updated_at if updated_at is not None else self.created_at
+        self.estimated_minutes = estimated_minutes
+        self.details = details or {}
+        self.version = version
+
+    @classmethod
+    def from_row(cls, row):
+        values = dict(zip(FIELDS + ("version",), row))
+        values["details"] = json.loads(values["details"])
+        return cls(**values)
+
+    def to_row(self):
+        values = [getattr(self, field) for field in FIELDS]
+        values[FIELDS.index("details")] = json.dumps(self.details, default=str)
+        return tuple(values)
+
+
+class IncidentStore(ABC):
+    """Interface for incident storage shared by every app process.
+
+    A backend must make writes from one process visible to all others and
+    give each write a version that increases across the whole store, so
+    ``changes()`` can replay everything after a version a caller has seen.
+    SqliteIncidentStore covers processes on one host; a networked backend
+    (e.g. Postgres with LISTEN/NOTIFY) only has to implement the abstract
+    methods and can be plugged in with register_backend(); one that misses
+    any fails when it is constructed.
+    """
+
+    @abstractmethod
+    def put_many(self, records):
+        """Insert or replace records in one batch"""
+
+    @abstractmethod
+    def update_status(self, updates):
+        """Apply (record ID, status) pairs in one batch"""
+
+    @abstractmethod
+    def update_details(self, updates):
+        """Replace the details of (record ID, details) pairs in one batch, keeping their status"""
+
+    @abstractmethod
+    def get(self, record_id):
+        """Return the record with this ID, or None"""
+
+    @abstractmethod
+    def query(self, status=None, since=None, until=None, limit=None):
+        """Records by status and creation time window, newest first"""
+
+    @abstractmethod
+    def changes(self, after_version=0, limit=1000):
+        """Records written after ``after_version`` and the latest version seen"""
+
+    def wait_for_changes(self, after_version, timeout=None, poll_interval=0.5):
+        """Block until something newer than ``after_version`` is written or ``timeout`` passes"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            records, version = self.changes(after_version)
+            if records or (deadline is not None and time.monotonic() >= deadline):
+                return records, version
+            time.sleep(poll_interval)
+
+    def put(self, record):
+        self.put_many([record])
+
+    def subscribe(self, callback, after_version=0):
+        """Call ``callback(records)`` from a background thread for every batch of changes.
+
+        Returns an Event; set it to stop the subscription.
+        """
+        stopped = threading.Event()
+
+        def run():
+            version = after_version
+            while not stopped.is_set():
+                try:
+                    records, version = self.wait_for_changes(version, timeout=1.0)
+                    if records:
+                        callback(records)
+                except Exception as e:
+                    logger.error(f"Incident subscription error: {e}")
+                    stopped.wait(1.0)
+
+        threading.Thread(target=run, name="incident-subscriber", daemon=True).start()
+        return stopped
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id TEXT PRIMARY KEY,
+    incident_id TEXT,
+    type TEXT,
+    status TEXT NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    estimated_minutes REAL,
+    details TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS incidents_status ON incidents (status, created_at);
+CREATE INDEX IF NOT EXISTS incidents_created ON incidents (created_at);
+CREATE INDEX IF NOT EXISTS incidents_version ON incidents (version);
+CREATE INDEX IF NOT EXISTS incidents_cluster ON incidents (incident_id);
+"""
+
+COLUMNS = ", ".join(FIELDS + ("version",))
+
+
+class SqliteIncidentStore(IncidentStore):
+    """Incident store for worker processes sharing one host, in SQLite WAL mode.
+
+    Every batch takes the next block of versions inside its write
+    transaction, so versions are unique and ordered across processes.
+    ``wait_for_changes`` wakes immediately for writes from this process and
+    notices other processes' commits through ``PRAGMA data_version``, which
+    only requires reading a page header.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, statement, rows):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                (version,) = self._conn.execute("SELECT COALESCE(MAX(version), 0) FROM incidents").fetchone()
+                self._conn.executemany(statement, [row + (version + i + 1,) for i, row in enumerate(rows)])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._changed.notify_all()
+
+    def put_many(self, records):
+        if records:
+            placeholders = ", ".join("?" * (len(FIELDS) + 1))
+            self._write(
+                f"INSERT OR REPLACE INTO incidents ({COLUMNS}) VALUES ({placeholders})",
+                [record.to_row() for record in records],
+            )
+
+    def update_status(self, updates):
+        if updates:
+            now = time.time()
+            self._write(
+                # The batch version is appended to each row as the fourth parameter
+                "UPDATE incidents SET status = ?1, updated_at = ?2, version = ?4 WHERE id = ?3",
+                [(status, now, record_id) for record_id, status in updates],
+            )
+
+    def update_details(self, updates):
+        if updates:
+            now = time.time()
+            self._write(
+                "UPDATE incidents SET details = ?1, updated_at = ?2, version = ?4 WHERE id = ?3",
+                [(json.dumps(details, default=str), now, record_id) for record_id, details in updates],
+            )
+
+    def _select(self, where, params, suffix=""):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {COLUMNS} FROM incidents {where} {suffix}", params).fetchall()
+        return [IncidentRecord.from_row(row) for row in rows]
+
+    def get(self, record_id):
+        records = self._select("WHERE id = ?", (record_id,))
+        return records[0] if records else None
+
+    def query(self, status=None, since=None, until=None, limit=None):
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        suffix = "ORDER BY created_at DESC"
+        if limit is not None:
+            suffix += " LIMIT ?"
+            params.append(limit)
+        return self._select(where, params, suffix)
+
+    def changes(self, after_version=0, limit=1000):
+        records = self._select("WHERE version > ?", (after_version, limit), "ORDER BY version LIMIT ?")
+        return records, (records[-1].version if records else after_version)
+
+    def _data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def wait_for_changes(self, after_version, timeout=None, poll_interval=0.2):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            seen = self._data_version()
+        while True:
+            records, version = self.changes(after_version)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if records or (remaining is not None and remaining <= 0):
+                return records, version
+            with self._lock:
+                # Local writes notify; other processes' commits bump data_version
+                if self._data_version() == seen:
+                    self._changed.wait(poll_interval if remaining is None else min(poll_interval, remaining))
+                seen = self._data_version()
+
+
+BACKENDS = {}
+
+
+def register_backend(scheme, factory):
+    """Make ``factory(url)`` build the store for INCIDENT_STORE_URL values with this scheme"""
+    BACKENDS[scheme] = factory
+
+
+def sqlite_path(url):
+    """File path of a sqlite:// URL: sqlite://relative/path.db or sqlite:///absolute/path.db"""
+    parsed = urlparse(url)
+    # urlparse reads the first segment of a relative path as the host
+    return parsed.netloc + parsed.path
+
+
+register_backend("sqlite", lambda url: SqliteIncidentStore(sqlite_path(url)))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_incident_store():
+    """Return the process-wide incident store selected by INCIDENT_STORE_URL"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                default_path = os.path.join(BASE_DIR, ".cache", "incidents.sqlite3")
+                url = os.getenv("INCIDENT_STORE_URL", f"sqlite://{default_path}")
+                scheme = urlparse(url).scheme
+                if scheme not in BACKENDS:
+                    raise ValueError(f"No incident store backend for {scheme!r} URLs")
+                _store = BACKENDS[scheme](url)
+                logger.info(f"Incident store ready at {url}")
+    return _store
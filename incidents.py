@@ -0,0 +1,198 @@
+import os
+import math
+import time
+import uuid
+import heapq
+import threading
+from datetime import datetime
+from offline_geocoder import haversine_km, EARTH_RADIUS_KM
+
+KM_PER_DEGREE = 111.32
+# Keeps cells near the poles from becoming infinitely wide
+MIN_COS = 0.01
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def report_location(emergency_details):
+    """Return (latitude, longitude) of a report's shared location, or None"""
+    location = emergency_details.get('current_location')
+    if not location:
+        return None
+    try:
+        if isinstance(location, str):
+            lat, lon = map(float, location.split(','))
+        else:
+            lat, lon = float(location['latitude']), float(location['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return lat, lon
+
+
+def report_time(emergency_details):
+    """Seconds since the epoch at which a report was filed, defaulting to now.
+
+    Times in the future are taken as now, so a wrong clock cannot make a
+    report outlive or expire the incidents around it.
+    """
+    try:
+        return min(datetime.strptime(emergency_details['time'], TIME_FORMAT).timestamp(), time.time())
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class Incident:
+    """One real-world emergency, possibly reported by many people"""
+
+    def __init__(self, emergency_type, latitude, longitude, reported_at, alert_key):
+        self.id = uuid.uuid4().hex
+        self.type = emergency_type
+        self.latitude = latitude
+        self.longitude = longitude
+        self.first_seen = reported_at
+        self.last_seen = reported_at
+        self.alert_key = alert_key
+        self.report_keys = [alert_key]
+        self.cell = None
+
+    @property
+    def reports(self):
+        return len(self.report_keys)
+
+    def summary(self):
+        """JSON-serializable reference carried by merged reports"""
+        return {"id": self.id, "parent": self.alert_key, "reports": self.reports}
+
+
+class IncidentClusterer:
+    """Match incoming reports to recent incidents of the same type nearby.
+
+    Incidents are indexed by (type, grid cell) on a grid whose rows are
+    ``radius_km`` tall. Each row's columns are at least ``radius_km`` wide,
+    measured at the row's edge nearest the pole, so a lookup scans the cells
+    overlapping the radius around a report (normally a 3x3 block) and touches
+    a bounded number of buckets. A heap keyed by last activity expires
+    incidents once they have been quiet for ``window`` seconds of report time,
+    even when back-dated reports arrive out of order; stale heap entries left
+    behind by later activity are skipped lazily.
+
+    The clusterer lives in one process: reports of one emergency that reach
+    different replicas are not merged with each other.
+    """
+
+    def __init__(self, radius_km=0.5, window=1800):
+        self.radius_km = radius_km
+        self.window = window
+        self._cells = {}
+        self._incidents = {}
+        self._by_report = {}
+        self._expiry = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._incidents)
+
+    def _row(self, lat):
+        return math.floor(lat * KM_PER_DEGREE / self.radius_km)
+
+    def _col(self, row, lon):
+        # One width per row, so points of a row never disagree about their columns
+        edge = min(90.0, max(abs(row), abs(row + 1)) * self.radius_km / KM_PER_DEGREE)
+        scale = KM_PER_DEGREE * max(math.cos(math.radians(edge)), MIN_COS)
+        return math.floor(lon * scale / self.radius_km)
+
+    def _cell(self, lat, lon):
+        row = self._row(lat)
+        return row, self._col(row, lon)
+
+    def _expire(self, now):
+        while self._expiry and self._expiry[0][0] < now - self.window:
+            last_seen, incident_id = heapq.heappop(self._expiry)
+            incident = self._incidents.get(incident_id)
+            if incident is None or incident.last_seen != last_seen:
+                continue
+            del self._incidents[incident_id]
+            bucket = self._cells[incident.cell]
+            bucket.remove(incident)
+            if not bucket:
+                del self._cells[incident.cell]
+            for key in incident.report_keys:
+                self._by_report.pop(key, None)
+
+    def _nearest(self, emergency_type, lat, lon, reported_at):
+        # Bounding box of the radius around the report, in degrees
+        dlat = math.degrees(self.radius_km / EARTH_RADIUS_KM)
+        dlon = min(180.0, dlat / max(math.cos(math.radians(min(90.0, abs(lat) + dlat))), MIN_COS))
+        candidates = []
+        for row in range(self._row(lat - dlat), self._row(lat + dlat) + 1):
+            for col in range(self._col(row, lon - dlon), self._col(row, lon + dlon) + 1):
+                for incident in self._cells.get((emergency_type, row, col), ()):
+                    if abs(reported_at - incident.last_seen) <= self.window:
+                        candidates.append(incident)
+        if not candidates:
+            return None
+        distances = haversine_km(
+            lat, lon, [c.latitude for c in candidates], [c.longitude for c in candidates]
+        )
+        best = int(distances.argmin())
+        return candidates[best] if distances[best] <= self.radius_km else None
+
+    def observe(self, emergency_details, alert_key):
+        """Record a report and return ``(incident, merged)``.
+
+        ``merged`` is True when the report joined an existing incident. Reports
+        without coordinates are never merged and return ``(None, False)``.
+        Observing the same ``alert_key`` twice returns the incident it already
+        belongs to without counting it again.
+        """
+        location = report_location(emergency_details)
+        if location is None:
+            return None, False
+        lat, lon = location
+        reported_at = report_time(emergency_details)
+        emergency_type = emergency_details.get('type')
+
+        with self._lock:
+            # Report time, not wall-clock time, so replayed batches still merge;
+            # never later than now, so one future-dated report cannot expire everything
+            self._expire(min(reported_at, time.time()))
+            incident = self._by_report.get(alert_key)
+            if incident is not None:
+                return incident, incident.alert_key != alert_key
+
+            incident = self._nearest(emergency_type, lat, lon, reported_at)
+            if incident is None:
+                incident = Incident(emergency_type, lat, lon, reported_at, alert_key)
+                incident.cell = (emergency_type,) + self._cell(lat, lon)
+                self._incidents[incident.id] = incident
+                self._cells.setdefault(incident.cell, []).append(incident)
+                merged = False
+            else:
+                incident.report_keys.append(alert_key)
+                incident.last_seen = max(incident.last_seen, reported_at)
+                merged = True
+            self._by_report[alert_key] = incident
+            heapq.heappush(self._expiry, (incident.last_seen, incident.id))
+        return incident, merged
+
+    def active(self):
+        """Snapshot of the incidents currently inside the time window"""
+        with self._lock:
+            self._expire(time.time())
+            return list(self._incidents.values())
+
+
+_clusterer = None
+_clusterer_lock = threading.Lock()
+
+
+def get_clusterer():
+    """Return the process-wide incident clusterer (not shared between replicas)"""
+    global _clusterer
+    if _clusterer is None:
+        with _clusterer_lock:
+            if _clusterer is None:
+                _clusterer = IncidentClusterer(
+                    radius_km=float(os.getenv("INCIDENT_RADIUS_KM", "0.5")),
+                    window=float(os.getenv("INCIDENT_WINDOW", "1800")),
+                )
+    return _clusterer
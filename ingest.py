@@ -0,0 +1,424 @@
+"""Headless intake for partner call centers and panic buttons.
+
+    python ingest.py alerts.jsonl [more.jsonl ...]   # "-" reads stdin
+    python ingest.py --serve 8502                    # POST JSONL to /alerts
+
+Each input line is one JSON object with the fields the summary step builds:
+``type``, ``time``, ``current_location`` and ``text_address``, plus an
+optional ``id`` so a replay after an outage never alerts twice. Ids are
+scoped to the source that sent them (``--source``, or the partner whose
+token authenticated the request), so two partners using the same id do not
+suppress each other's alerts. Input is read line by line and processed in batches: records
+are validated and geocoded on a bounded thread pool, then handed to the
+outbox in one transaction per batch, which delivers them exactly as alerts
+sent from the app. One JSON status line is written per record, followed by a
+summary with the throughput.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import metrics
+from address_index import resolve_address
+from dispatch import submit_alerts, get_ticket, count_undelivered
+from eta import EMERGENCY_CAPABILITIES, estimate_minutes
+from incidents import TIME_FORMAT
+from triage import DESCRIPTION_MAX_CHARS
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+MERGED = "merged"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+ERROR = "error"
+
+MAX_LINE_BYTES = 64 * 1024
+# How far ahead of this host's clock a source's report time may be
+MAX_CLOCK_SKEW = 300
+DEFAULT_SOURCE = "default"
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def _coordinates(location):
+    if isinstance(location, str):
+        parts = location.split(",")
+        if len(parts) != 2:
+            raise InvalidRecord("current_location must be 'latitude,longitude'")
+        lat, lon = parts
+    elif isinstance(location, dict):
+        lat, lon = location.get("latitude"), location.get("longitude")
+    else:
+        raise InvalidRecord("current_location must be an object or 'latitude,longitude'")
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise InvalidRecord("current_location needs numeric latitude and longitude")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise InvalidRecord("current_location is out of range")
+    return {"latitude": lat, "longitude": lon}
+
+
+def validate(record):
+    """Return the ``emergency_details`` dict and idempotency key for an input record.
+
+    Raises InvalidRecord when a required field is missing or malformed.
+    """
+    if not isinstance(record, dict):
+        raise InvalidRecord("record must be a JSON object")
+    emergency_type = record.get("type")
+    if not isinstance(emergency_type, str) or emergency_type not in EMERGENCY_CAPABILITIES:
+        raise InvalidRecord(f"type must be one of: {', '.join(EMERGENCY_CAPABILITIES)}")
+
+    reported_at = record.get("time")
+    if reported_at is None:
+        reported_at = datetime.now().strftime(TIME_FORMAT)
+    else:
+        try:
+            parsed = datetime.strptime(reported_at, TIME_FORMAT)
+        except (TypeError, ValueError):
+            raise InvalidRecord(f"time must be formatted as {TIME_FORMAT}")
+        if (parsed - datetime.now()).total_seconds() > MAX_CLOCK_SKEW:
+            raise InvalidRecord("time is in the future")
+
+    location = record.get("current_location")
+    text_address = record.get("text_address")
+    if text_address is not None and not isinstance(text_address, str):
+        raise InvalidRecord("text_address must be a string")
+    text_address = text_address.strip() if text_address else None
+    if not location and not text_address:
+        raise InvalidRecord("current_location or text_address is required")
+
+    description = record.get("description")
+    if description is not None and not isinstance(description, str):
+        raise InvalidRecord("description must be a string")
+    description = description.strip()[:DESCRIPTION_MAX_CHARS] if description else None
+
+    key = record.get("id")
+    if key is not None and (not isinstance(key, str) or not key.strip()):
+        raise InvalidRecord("id must be a non-empty string")
+
+    emergency_details = {
+        'type': emergency_type,
+        'time': reported_at,
+        'current_location': _coordinates(location) if location else None,
+        'text_address': text_address,
+        'description': description or None,
+    }
+    return emergency_details, key
+
+
+def prepare(record):
+    """Validate and geocode one record; runs on the ingestion thread pool"""
+    emergency_details, key = validate(record)
+    if emergency_details['current_location'] is None:
+        # Same lookup the address step does; an unresolved address still goes out
+        coordinates = resolve_address(emergency_details['text_address'])
+        if coordinates:
+            emergency_details['current_location'] = {"latitude": coordinates[0], "longitude": coordinates[1]}
+
+    return emergency_details, key, estimate_minutes(emergency_details)
+
+
+def parse_line(line):
+    try:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        return json.loads(line)
+    except ValueError as e:
+        raise InvalidRecord(f"not valid JSON: {e}")
+
+
+class IngestReport:
+    """Running per-status counts and throughput of one ingestion run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts = Counter()
+
+    def add(self, result):
+        self.counts[result["status"]] += 1
+        metrics.inc("ingest_records_total", 1, "Records received by bulk ingestion by outcome",
+                    status=result["status"])
+
+    @property
+    def records(self):
+        return sum(self.counts.values())
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "records": self.records,
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(self.records / elapsed, 1) if elapsed > 0 else 0.0,
+            **self.counts,
+        }
+
+
+def _process_batch(batch, pool, source):
+    """Turn a batch of (line number, raw line) pairs into per-record results"""
+    results = [{"line": number} for number, _ in batch]
+
+    def load(line):
+        return prepare(parse_line(line))
+
+    futures = [pool.submit(load, line) for _, line in batch]
+    accepted, seen = [], set()
+    for result, future in zip(results, futures):
+        try:
+            emergency_details, key, estimated_minutes = future.result()
+        except InvalidRecord as e:
+            result.update(status=INVALID, error=str(e))
+            continue
+        except Exception as e:
+            logger.error(f"Ingestion failed for line {result['line']}: {e}")
+            result.update(status=ERROR, error=str(e))
+            continue
+        if key is not None:
+            result["id"] = key
+            key = f"{source}:{key}"
+            # Replays of records the outbox already holds, or repeats within the batch
+            if key in seen or get_ticket(key) is not None:
+                result["status"] = DUPLICATE
+                continue
+            seen.add(key)
+        accepted.append((result, (emergency_details, None, key, estimated_minutes)))
+
+    if accepted:
+        try:
+            tickets = submit_alerts([alert for _, alert in accepted])
+        except Exception as e:
+            logger.error(f"Failed to queue ingested batch: {e}")
+            for result, _ in accepted:
+                result.update(status=ERROR, error=str(e))
+        else:
+            for (result, _), ticket in zip(accepted, tickets):
+                result["ticket"] = ticket
+                # Folded into an incident someone else already reported
+                result["status"] = MERGED if get_ticket(ticket).merged else QUEUED
+    return results
+
+
+def ingest(lines, report=None, batch_size=100, concurrency=8, source=DEFAULT_SOURCE):
+    """Process an iterable of JSONL lines, yielding one status dict per record.
+
+    Lines are consumed lazily, ``batch_size`` at a time, so arbitrarily long
+    streams run in constant memory as long as the caller does not keep the
+    results. At most ``concurrency`` records are validated and geocoded at
+    once. Record ids become idempotency keys ``"<source>:<id>"``.
+    """
+    report = report if report is not None else IngestReport()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest") as pool:
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            batch.append((number, line))
+            if len(batch) >= batch_size:
+                yield from _finish(_process_batch(batch, pool, source), report)
+                batch = []
+        if batch:
+            yield from _finish(_process_batch(batch, pool, source), report)
+
+
+def _finish(results, report):
+    for result in results:
+        report.add(result)
+        yield result
+
+
+def wait_for_delivery(tickets, timeout, poll_interval=0.5):
+    """Wait until every ticket is sent or failed; return the ones still pending"""
+    deadline = time.monotonic() + timeout
+    pending = list(tickets)
+    while pending and time.monotonic() < deadline:
+        pending = [ticket for ticket in pending if not get_ticket(ticket).done]
+        if pending:
+            time.sleep(poll_interval)
+    return pending
+
+
+def wait_for_backlog(since, timeout, poll_interval=0.5):
+    """Wait until every alert queued since ``since``, by anyone, is sent or failed; return how many are not"""
+    deadline = time.monotonic() + timeout
+    pending = count_undelivered(since)
+    while pending and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        pending = count_undelivered(since)
+    return pending
+
+
+# HTTP endpoint
+
+def _parse_tokens(value):
+    """Map bearer tokens to the sources they authenticate, from "source:token,..." """
+    tokens = {}
+    for entry in (value or "").split(","):
+        source, _, token = entry.strip().partition(":")
+        if source and token:
+            tokens[token] = source
+    return tokens
+
+
+def _read_lines(rfile, headers):
+    """Yield body lines as they arrive, for Content-Length and chunked uploads"""
+    if headers.get("Transfer-Encoding", "").lower() == "chunked":
+        buffer = b""
+        while True:
+            header = rfile.readline(MAX_LINE_BYTES).split(b";")[0]
+            try:
+                size = int(header, 16)
+            except ValueError:
+                size = -1
+            if size < 0:
+                raise InvalidRecord(f"malformed chunk size {header.strip()[:20]!r}")
+            if size == 0:
+                rfile.readline()
+                break
+            # A chunk may announce any size, so it is read a line's worth at a time
+            while size > 0:
+                piece = rfile.read(min(size, MAX_LINE_BYTES))
+                if not piece:
+                    raise InvalidRecord("body ended inside a chunk")
+                size -= len(piece)
+                buffer += piece
+                *complete, buffer = buffer.split(b"\n")
+                yield from complete
+                if len(buffer) > MAX_LINE_BYTES:
+                    raise InvalidRecord(f"line longer than {MAX_LINE_BYTES} bytes")
+            rfile.readline()
+        if buffer:
+            yield buffer
+        return
+
+    try:
+        remaining = int(headers.get("Content-Length") or 0)
+    except ValueError:
+        raise InvalidRecord("malformed Content-Length")
+    while remaining > 0:
+        line = rfile.readline(min(remaining, MAX_LINE_BYTES + 1))
+        if not line:
+            break
+        remaining -= len(line)
+        if len(line) > MAX_LINE_BYTES:
+            raise InvalidRecord(f"line longer than {MAX_LINE_BYTES} bytes")
+        yield line
+
+
+def make_server(host, port, tokens=None, batch_size=100, concurrency=8):
+    """HTTP server accepting JSONL alerts on POST /alerts and streaming back statuses.
+
+    ``tokens`` maps each accepted bearer token to the source whose ids it
+    may use. Without tokens the endpoint is open and every request uses the
+    default source.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _start(self, status):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-ndjson")
+            if status != 200:
+                self.send_header("Connection", "close")
+            self.end_headers()
+
+        def do_POST(self):
+            if self.path.split("?")[0] != "/alerts":
+                self.send_error(404)
+                return
+            source = DEFAULT_SOURCE
+            if tokens:
+                authorization = self.headers.get("Authorization", "")
+                source = tokens.get(authorization[len("Bearer "):]) if authorization.startswith("Bearer ") else None
+                if source is None:
+                    self.send_error(401)
+                    return
+            report = IngestReport()
+            # Statuses stream back as batches finish, so the status line waits
+            # for the first one: a body that is broken from the start gets a 400
+            started = False
+            try:
+                for result in ingest(_read_lines(self.rfile, self.headers), report, batch_size, concurrency, source):
+                    if not started:
+                        self._start(200)
+                        started = True
+                    self.wfile.write(json.dumps(result).encode() + b"\n")
+            except InvalidRecord as e:
+                if not started:
+                    self._start(400)
+                    started = True
+                self.wfile.write(json.dumps({"error": str(e)}).encode() + b"\n")
+            if not started:
+                self._start(200)
+            summary = report.summary()
+            self.wfile.write(json.dumps({"summary": summary}).encode() + b"\n")
+            logger.info(f"Ingested over HTTP from {self.client_address[0]} ({source}): {summary}")
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def _open(source):
+    if source == "-":
+        return sys.stdin
+    return open(source, encoding="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Submit emergency alerts from JSONL without the web app")
+    parser.add_argument("sources", nargs="*", default=["-"], help="JSONL files, or - for stdin")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="accept JSONL over HTTP instead")
+    parser.add_argument("--source", default=os.getenv("INGEST_SOURCE", DEFAULT_SOURCE),
+                        help="partner the records come from; their ids are unique only within it")
+    parser.add_argument("--host", default=os.getenv("INGEST_HOST", "127.0.0.1"))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", "100")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("INGEST_CONCURRENCY", "8")))
+    parser.add_argument("--wait", type=float, default=30.0,
+                        help="seconds to wait for queued alerts to be delivered before exiting")
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        tokens = _parse_tokens(os.getenv("INGEST_TOKENS"))
+        if os.getenv("INGEST_TOKEN"):
+            tokens[os.getenv("INGEST_TOKEN")] = DEFAULT_SOURCE
+        server = make_server(args.host, args.serve, tokens, args.batch_size, args.concurrency)
+        logger.info(f"Accepting alerts on http://{args.host}:{args.serve}/alerts")
+        server.serve_forever()
+        return 0
+
+    report = IngestReport()
+    started = time.time()
+    for path in args.sources:
+        with _open(path) as lines:
+            # Written as they come and not kept, so memory stays flat however long the input
+            for result in ingest(lines, report, args.batch_size, args.concurrency, args.source):
+                print(json.dumps(result))
+    sys.stdout.flush()
+    summary = report.summary()
+    logger.info(
+        f"Ingested {summary['records']} records in {summary['elapsed_seconds']} s "
+        f"({summary['records_per_second']} records/s): "
+        + ", ".join(f"{count} {status}" for status, count in report.counts.items())
+    )
+
+    # Anything not delivered here stays in the outbox for the app's worker
+    queued = report.counts[QUEUED] + report.counts[MERGED]
+    pending = wait_for_backlog(started, args.wait) if args.wait > 0 and queued else 0
+    if pending:
+        logger.warning(f"{pending} alert(s) still queued for delivery")
+    return 1 if report.counts[INVALID] or report.counts[ERROR] else 0
+
+
+if __name__ == "__main__":
+    import bootstrap  # noqa: F401  logging setup
+    sys.exit(main())
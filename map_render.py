@@ -0,0 +1,153 @@
+import os
+import copy
+import math
+from functools import lru_cache
+import streamlit as st
+from bootstrap import lazy_import
+
+folium = lazy_import("folium")
+streamlit_folium = lazy_import("streamlit_folium")
+
+DARK_TILES = "cartodbdark_matter"
+STATIC_TILE_URL = "https://basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png"
+TILE_SIZE = 256
+
+# "static" renders the confirmation screen as plain tile images instead of a Leaflet component
+MAP_PREVIEW_MODE = os.getenv("MAP_PREVIEW_MODE", "static")
+# Base map templates kept; every location previewed in interactive mode has its own center
+TEMPLATE_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _template(center, zoom, tiles, control_scale):
+    return folium.Map(location=list(center), zoom_start=zoom, tiles=tiles, control_scale=control_scale)
+
+
+def base_map(center, zoom, tiles=DARK_TILES, control_scale=True):
+    """Return a copy of a cached base map template.
+
+    Copying the template is roughly ten times cheaper than building a
+    folium.Map, and because the base map never carries markers its generated
+    script is identical on every rerun, so streamlit-folium keeps the same
+    component instance in the browser instead of reloading it.
+    """
+    return copy.deepcopy(_template(tuple(center), zoom, tiles, control_scale))
+
+
+def marker_layer(markers):
+    """Build the feature group of (latitude, longitude, popup) markers sent as a delta"""
+    layer = folium.FeatureGroup(name="markers")
+    for latitude, longitude, popup in markers:
+        folium.Marker(
+            [latitude, longitude],
+            popup=popup,
+            icon=folium.Icon(color="red", icon="exclamation-triangle"),
+        ).add_to(layer)
+    return layer
+
+
+def incident_layer(geojson):
+    """Feature group drawing clustered incident GeoJSON from incident_map as circle markers"""
+    layer = folium.FeatureGroup(name="incidents")
+    if geojson["features"]:
+        folium.GeoJson(
+            geojson,
+            marker=folium.CircleMarker(),
+            style_function=lambda feature: feature["properties"]["style"],
+            tooltip=folium.GeoJsonTooltip(fields=["label"], labels=False),
+        ).add_to(layer)
+    return layer
+
+
+def interactive_map(center, zoom, markers=(), key="map", width=700, height=500):
+    """Render a clickable map and return the last clicked point, if any.
+
+    Only ``last_clicked`` is returned from the browser, so panning and zooming
+    do not trigger reruns.
+    """
+    map_data = streamlit_folium.st_folium(
+        base_map(center, zoom),
+        key=key,
+        width=width,
+        height=height,
+        feature_group_to_add=marker_layer(markers),
+        returned_objects=["last_clicked"],
+    )
+    return (map_data or {}).get("last_clicked")
+
+
+def incident_overview_map(center, zoom, geojson, key="incident_map", height=650):
+    """Render the admin incident map and return the browser's (bounds, zoom) view, if reported.
+
+    The base map stays mounted; only the incident layer is sent on refresh.
+    Panning and zooming rerun the caller so it can recluster for the new view.
+    """
+    map_data = streamlit_folium.st_folium(
+        base_map(center, zoom),
+        key=key,
+        height=height,
+        use_container_width=True,
+        feature_group_to_add=incident_layer(geojson),
+        returned_objects=["bounds", "zoom"],
+    ) or {}
+    bounds, view_zoom = map_data.get("bounds"), map_data.get("zoom")
+    if not bounds or view_zoom is None:
+        return None
+    south_west, north_east = bounds["_southWest"], bounds["_northEast"]
+    if south_west.get("lat") is None:
+        return None
+    return (south_west["lat"], south_west["lng"], north_east["lat"], north_east["lng"]), view_zoom
+
+
+def _pixel(lat, lon, zoom):
+    scale = TILE_SIZE * 2 ** zoom
+    x = (lon + 180.0) / 360.0 * scale
+    lat_rad = math.radians(max(min(lat, 85.0511), -85.0511))
+    y = (1 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2 * scale
+    return x, y
+
+
+def static_map_html(latitude, longitude, zoom=15, height=400, radius=1):
+    """HTML for a non-interactive map: a grid of tile images centred on a marker"""
+    x, y = _pixel(latitude, longitude, zoom)
+    tile_x, tile_y = int(x // TILE_SIZE), int(y // TILE_SIZE)
+    tiles_per_side = 2 * radius + 1
+    offset_x = x - (tile_x - radius) * TILE_SIZE
+    offset_y = y - (tile_y - radius) * TILE_SIZE
+    last_tile = 2 ** zoom - 1
+
+    images = []
+    for row in range(tiles_per_side):
+        for col in range(tiles_per_side):
+            tx = (tile_x - radius + col) % (last_tile + 1)
+            ty = min(max(tile_y - radius + row, 0), last_tile)
+            url = STATIC_TILE_URL.format(z=zoom, x=tx, y=ty)
+            images.append(
+                f'<img src="{url}" style="position:absolute;left:{col * TILE_SIZE}px;'
+                f'top:{row * TILE_SIZE}px;width:{TILE_SIZE}px;height:{TILE_SIZE}px;">'
+            )
+
+    return (
+        f'<div class="folium-map" style="position:relative;overflow:hidden;height:{height}px;width:100%;">'
+        f'<div style="position:absolute;left:calc(50% - {offset_x:.0f}px);top:calc(50% - {offset_y:.0f}px);">'
+        + "".join(images)
+        + "</div>"
+        '<div style="position:absolute;left:50%;top:50%;transform:translate(-50%,-100%);'
+        'font-size:32px;line-height:1;">📍</div>'
+        "</div>"
+    )
+
+
+def location_preview(latitude, longitude, zoom=15, height=400):
+    """Show a read-only map of a single location, static or interactive per MAP_PREVIEW_MODE"""
+    if MAP_PREVIEW_MODE == "static":
+        st.markdown(static_map_html(latitude, longitude, zoom, height), unsafe_allow_html=True)
+    else:
+        streamlit_folium.st_folium(
+            base_map((latitude, longitude), zoom),
+            key="location_preview",
+            width=700,
+            height=height,
+            feature_group_to_add=marker_layer([(latitude, longitude, "Your Location")]),
+            returned_objects=[],
+        )
@@ -0,0 +1,249 @@
+"""Prometheus-style counters and histograms for the emergency request path.
+
+Collection is off unless METRICS_ENABLED=1, METRICS_PORT or METRICS_FILE is
+set; when off, ``span()`` and ``observe()`` return after a single flag check.
+With METRICS_PORT the text exposition format is served at /metrics, and with
+METRICS_FILE it is rewritten every METRICS_FILE_INTERVAL seconds.
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = None
+_enabled_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, help_text, **kwargs)
+        return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in sorted(metrics, key=lambda m: m.name):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def enabled():
+    """Whether metrics are collected; exporters start the first time this returns True"""
+    global _enabled
+    if _enabled is None:
+        with _enabled_lock:
+            if _enabled is None:
+                port, path = os.getenv("METRICS_PORT"), os.getenv("METRICS_FILE")
+                _enabled = bool(port or path or os.getenv("METRICS_ENABLED") == "1")
+                if port:
+                    _start_http_exporter(int(port))
+                if path:
+                    _start_file_exporter(path, float(os.getenv("METRICS_FILE_INTERVAL", "15")))
+    return _enabled
+
+
+def inc(name, amount=1, help_text="", **labels):
+    if enabled():
+        registry.counter(name, help_text).inc(amount, **labels)
+
+
+def set_gauge(name, value, help_text="", **labels):
+    if enabled():
+        registry.gauge(name, help_text).set(value, **labels)
+
+
+def observe(name, value, help_text="", **labels):
+    if enabled():
+        registry.histogram(name, help_text).observe(value, **labels)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+@contextmanager
+def _span(name, labels):
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        registry.histogram(f"{name}_seconds", f"Duration of {name.replace('_', ' ')}").observe(
+            time.perf_counter() - started, **labels
+        )
+        registry.counter(f"{name}_total", f"Completed {name.replace('_', ' ')}").inc(outcome=outcome, **labels)
+
+
+def span(name, **labels):
+    """Time a block into ``<name>_seconds`` and count it in ``<name>_total`` by outcome"""
+    if not enabled():
+        return _NULL_SPAN
+    return _span(name, labels)
+
+
+def _start_http_exporter(port):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.expose().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    except OSError as e:
+        # Another worker process on this host already serves the port
+        logger.error(f"Metrics endpoint not started on port {port}: {e}")
+        return
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+
+def _start_file_exporter(path, interval):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(registry.expose())
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.error(f"Failed to write metrics file {path}: {e}")
+
+    threading.Thread(target=run, name="metrics-file", daemon=True).start()
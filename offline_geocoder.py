@@ -0,0 +1,184 @@
+import os
+import math
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_GAZETTEER = os.path.join(BASE_DIR, "data", "gazetteer_in.tsv")
+
+EARTH_RADIUS_KM = 6371.0088
+# GeoNames feature classes worth reverse geocoding to: populated places and admin areas
+GEONAMES_CLASSES = {"P", "A"}
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance from one point to arrays of points, in kilometres"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def beyond_km(lat, lon, row, col, radius, cell_size):
+    """Lower bound on the distance from a point in cell (row, col) to anything
+    outside the cells within ``radius`` rings of it, in kilometres.
+
+    Cells are square in degrees, so a degree of longitude is only cos(lat) as
+    long as one of latitude; the longitude bound is the distance to the
+    nearest meridian plane past the block.
+    """
+    dlat = min(lat - (row - radius) * cell_size, (row + radius + 1) * cell_size - lat)
+    dlon = min(lon - (col - radius) * cell_size, (col + radius + 1) * cell_size - lon)
+    across = math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(math.radians(min(dlon, 90.0)))))
+    return EARTH_RADIUS_KM * min(math.radians(dlat), across)
+
+
+class Place:
+    """A gazetteer entry matched to a query point"""
+
+    def __init__(self, name, admin, latitude, longitude, distance_km):
+        self.name = name
+        self.admin = admin
+        self.latitude = latitude
+        self.longitude = longitude
+        self.distance_km = distance_km
+
+    def describe(self):
+        label = f"{self.name}, {self.admin}" if self.admin else self.name
+        if self.distance_km < 1:
+            return label
+        return f"{self.distance_km:.0f} km from {label}"
+
+
+def _load_admin1_names(directory):
+    path = os.path.join(directory, "admin1CodesASCII.txt")
+    names = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) >= 2:
+                    names[parts[0]] = parts[1]
+    return names
+
+
+def load_gazetteer(path):
+    """Read a gazetteer into (names, admins, lats, lons).
+
+    Accepts GeoNames dump files (19 tab-separated columns) or the simple
+    ``name, admin1, latitude, longitude[, population]`` layout of the bundled
+    seed file. Lines starting with ``#`` are ignored.
+    """
+    admin1_names = _load_admin1_names(os.path.dirname(path))
+    names, admins, lats, lons = [], [], [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 19:
+                if parts[6] not in GEONAMES_CLASSES:
+                    continue
+                name, lat, lon = parts[1], parts[4], parts[5]
+                admin = admin1_names.get(f"{parts[8]}.{parts[10]}", "")
+            else:
+                name, admin, lat, lon = parts[:4]
+            names.append(name)
+            admins.append(admin)
+            lats.append(float(lat))
+            lons.append(float(lon))
+    return names, admins, np.array(lats), np.array(lons)
+
+
+class OfflineGeocoder:
+    """Nearest-place lookup over a grid of geohash-style buckets.
+
+    Points are sorted by grid cell so each cell is a contiguous slice of the
+    coordinate arrays. A query walks outward ring by ring, running one
+    vectorized haversine per ring, and stops once nothing in the next ring
+    can be closer than the best place found (see ``beyond_km``).
+    """
+
+    def __init__(self, names, admins, lats, lons, cell_size=0.5):
+        self.cell_size = cell_size
+        rows = np.floor(lats / cell_size).astype(np.int64)
+        cols = np.floor(lons / cell_size).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        self.names = [names[i] for i in order]
+        self.admins = [admins[i] for i in order]
+        self.lats = np.ascontiguousarray(lats[order])
+        self.lons = np.ascontiguousarray(lons[order])
+        rows, cols = rows[order], cols[order]
+
+        self._cells = {}
+        self._bounds = None
+        if len(order):
+            boundaries = np.flatnonzero((np.diff(rows) != 0) | (np.diff(cols) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(order)]))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self._cells[(int(rows[start]), int(cols[start]))] = (start, end)
+            self._bounds = (int(rows.min()), int(rows.max()), int(cols.min()), int(cols.max()))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _ring(self, row, col, radius):
+        if radius == 0:
+            yield row, col
+            return
+        for dc in range(-radius, radius + 1):
+            yield row - radius, col + dc
+            yield row + radius, col + dc
+        for dr in range(-radius + 1, radius):
+            yield row + dr, col - radius
+            yield row + dr, col + radius
+
+    def _max_ring(self, row, col):
+        top, bottom, left, right = self._bounds
+        return max(abs(row - top), abs(row - bottom), abs(col - left), abs(col - right))
+
+    def reverse(self, lat, lon, max_distance_km=None):
+        """Return the nearest Place, or None if nothing lies within range"""
+        if not self._cells:
+            return None
+        row = math.floor(lat / self.cell_size)
+        col = math.floor(lon / self.cell_size)
+        limit = math.inf if max_distance_km is None else max_distance_km
+        best, best_distance = None, math.inf
+        for radius in range(self._max_ring(row, col) + 1):
+            spans = [self._cells[cell] for cell in self._ring(row, col, radius) if cell in self._cells]
+            if spans:
+                index = np.concatenate([np.arange(start, end) for start, end in spans])
+                distances = haversine_km(lat, lon, self.lats[index], self.lons[index])
+                nearest = int(np.argmin(distances))
+                if distances[nearest] < best_distance:
+                    best, best_distance = int(index[nearest]), float(distances[nearest])
+            if min(best_distance, limit) <= beyond_km(lat, lon, row, col, radius, self.cell_size):
+                break
+        if best is None or best_distance > limit:
+            return None
+        return Place(self.names[best], self.admins[best], float(self.lats[best]), float(self.lons[best]),
+                     best_distance)
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_offline_geocoder():
+    """Return the process-wide offline geocoder built from GAZETTEER_PATH"""
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                path = os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER)
+                names, admins, lats, lons = load_gazetteer(path)
+                _geocoder = OfflineGeocoder(
+                    names, admins, lats, lons, cell_size=float(os.getenv("GAZETTEER_CELL_SIZE", "0.5"))
+                )
+                logger.info(f"Offline geocoder loaded {len(_geocoder)} places from {path}")
+    return _geocoder
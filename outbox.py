@@ -0,0 +1,532 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+from alerts import deliver_alert, deliver_incident_update, delivery_chat, chat_delay, photo_bytes
+from blob_store import BlobHandle
+from telegram_client import TelegramFile
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+PURGE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    photos TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress TEXT NOT NULL DEFAULT '{}',
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    lease_owner TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    incident_id TEXT,
+    parent_key TEXT,
+    priority INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+# Columns added after the first release; older databases gain them on open
+COLUMNS = [
+    ("incident_id", "TEXT"),
+    ("parent_key", "TEXT"),
+    ("priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("lease_owner", "TEXT"),
+]
+
+
+class ParentPending(Exception):
+    """An incident update whose incident's own alert has not been delivered yet"""
+
+    def __init__(self, parent_key, due):
+        super().__init__(f"waiting for incident alert {parent_key}")
+        self.due = due
+
+
+class Outbox:
+    """Durable alert queue backed by SQLite in WAL mode.
+
+    Alerts and their photos are written to disk before any network I/O. A
+    worker thread claims due rows under a lease, most severe first (the
+    ``priority`` triage score), and delivers them in one lane per chat, up to
+    ``chat_lanes`` chats at a time, so a chat waiting for its Telegram quota
+    holds up only its own alerts. A row whose chat would wait more than
+    ``defer_after`` seconds goes back to the queue until its quota allows.
+
+    Each row's lease is renewed just before it is delivered and its outcome
+    committed right after, both only while this worker still owns the lease.
+    Rows whose lease expires (for example because the process died
+    mid-delivery) are picked up again by any worker, and the recorded
+    delivery progress keeps already-sent stages from repeating.
+    """
+
+    def __init__(self, path, spool_dir, batch_size=10, lease=120, base_delay=2.0,
+                 max_delay=300.0, max_attempts=20, poll_interval=1.0, chat_lanes=4, defer_after=5.0):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.lease = lease
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.defer_after = defer_after
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+        self._listeners = []
+        self._lanes = ThreadPoolExecutor(max_workers=chat_lanes, thread_name_prefix="outbox-lane")
+
+    def _migrate(self):
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for name, column_type in COLUMNS:
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {name} {column_type}")
+
+    # Photo spool
+
+    def _refresh(self, path):
+        """Mark a spooled file as in use so purge leaves it alone; False if it is gone"""
+        # Under the lock purge holds from its age check to the removal
+        with self._lock:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def _spool_photo(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.spool_dir, digest)
+        if not self._refresh(path):
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def _spool(self, photo):
+        """Spool one photo and return its reference, or None if it is gone"""
+        # Photos already on Telegram need no spooling, only their file_id
+        if isinstance(photo, TelegramFile):
+            return {"file_id": photo.file_id}
+        # Photos already in the session spool carry their digest: hard-link
+        # the file instead of reading it back into memory
+        blob = getattr(photo, "transmit", photo)
+        try:
+            if not isinstance(blob, BlobHandle):
+                return self._spool_photo(photo_bytes(photo))
+            path = os.path.join(self.spool_dir, blob.digest)
+            if not self._refresh(path):
+                try:
+                    os.link(blob.path, path)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    # Different filesystem or links unsupported; a missing source fails again below
+                    return self._spool_photo(blob.getvalue())
+            return blob.digest
+        except FileNotFoundError:
+            # The session spool dropped it; the alert matters more than the photo
+            logger.warning("A photo was missing from the session spool; queueing the alert without it")
+            metrics.inc("alert_photos_unavailable_total", 1, "Photos lost from the session spool before submit")
+            return None
+
+    def _load_photo(self, digest):
+        if isinstance(digest, dict):
+            return TelegramFile(digest["file_id"])
+        with open(os.path.join(self.spool_dir, digest), "rb") as f:
+            return f.read()
+
+    def _load_photos(self, details, photo_refs):
+        """Load a row's photos, dropping (and noting in ``details``) any missing from the spool"""
+        photos, missing = [], 0
+        for digest in photo_refs:
+            try:
+                photos.append(self._load_photo(digest))
+            except FileNotFoundError:
+                missing += 1
+        if missing:
+            # As when spooling: the alert matters more than the photo
+            logger.warning(f"{missing} photo(s) missing from the outbox spool; delivering the alert without them")
+            metrics.inc("alert_photos_unavailable_total", missing, "Photos lost from the session spool before submit")
+            details["photos_unavailable"] = details.get("photos_unavailable", 0) + missing
+        return photos
+
+    # Producer side
+
+    def enqueue(self, emergency_details, photos=None, idempotency_key=None):
+        """Persist an alert for delivery and return its idempotency key"""
+        return self.enqueue_many([(emergency_details, photos, idempotency_key)])[0]
+
+    def enqueue_many(self, alerts):
+        """Persist several (details, photos, idempotency_key) tuples in one transaction.
+
+        Details carrying an ``incident`` reference from the clusterer are
+        delivered as updates to the alert of the parent incident. Details
+        carrying a ``triage`` score are delivered ahead of less severe ones.
+        """
+        now = time.time()
+        rows, keys = [], []
+        for emergency_details, photos, idempotency_key in alerts:
+            key = idempotency_key or uuid.uuid4().hex
+            refs = [self._spool(photo) for photo in photos or []]
+            if None in refs:
+                emergency_details = {**emergency_details, "photos_unavailable": refs.count(None)}
+                refs = [ref for ref in refs if ref is not None]
+            incident = emergency_details.get("incident") or {}
+            priority = (emergency_details.get("triage") or {}).get("score", 0)
+            rows.append((
+                key, json.dumps(emergency_details, default=str), json.dumps(refs), PENDING, now, now, now,
+                incident.get("id"), incident.get("parent"), priority,
+            ))
+            keys.append(key)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # An existing key means this alert was already accepted; keep the original
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (idempotency_key, payload, photos, status, "
+                    "next_attempt_at, created_at, updated_at, incident_id, parent_key, priority) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._wakeup.set()
+        return keys
+
+    def get(self, idempotency_key):
+        """Return the outbox row for a key as a dict, or None"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT idempotency_key, status, attempts, last_error, created_at, updated_at, parent_key "
+                "FROM outbox WHERE idempotency_key = ?",
+                (idempotency_key,),
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def count_undelivered(self, since=0.0):
+        """Number of alerts created at or after ``since`` that are neither sent nor failed"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE created_at >= ? AND status IN (?, ?)", (since, PENDING, SENDING)
+            ).fetchone()[0]
+
+    def retry(self, idempotency_key):
+        """Put a failed alert back in the queue for immediate delivery"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "WHERE idempotency_key = ? AND status = ?",
+                (PENDING, time.time(), time.time(), idempotency_key, FAILED),
+            )
+        self._wakeup.set()
+
+    def reroute(self, routes):
+        """Give pending alerts new routes; ``routes`` maps idempotency keys to route dicts.
+
+        Alerts already posted, or being delivered right now, keep their chat.
+        Returns the keys whose route changed.
+        """
+        keys = list(routes)
+        rerouted = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = []
+                # Stays under SQLite's limit on bound parameters
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows += self._conn.execute(
+                        f"SELECT id, idempotency_key, payload, progress FROM outbox "
+                        f"WHERE status = ? AND idempotency_key IN ({', '.join('?' * len(chunk))})",
+                        [PENDING] + chunk,
+                    ).fetchall()
+                updates = []
+                for row_id, key, payload, progress in rows:
+                    if "message_id" in json.loads(progress):
+                        continue
+                    details = json.loads(payload)
+                    details["route"] = routes[key]
+                    updates.append((json.dumps(details, default=str), time.time(), row_id))
+                    rerouted.append(key)
+                self._conn.executemany("UPDATE outbox SET payload = ?, updated_at = ? WHERE id = ?", updates)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rerouted
+
+    def add_listener(self, callback):
+        """Call ``callback([(idempotency_key, status), ...])`` after each delivered batch"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    # Consumer side
+
+    def _claim(self):
+        now = time.time()
+        # Fences this worker's lease: a row taken over by another worker has a new owner
+        owner = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, idempotency_key, payload, photos, attempts, progress, created_at, parent_key "
+                    "FROM outbox "
+                    "WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until < ?) "
+                    "ORDER BY priority DESC, next_attempt_at LIMIT ?",
+                    (PENDING, now, SENDING, now, self.batch_size),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET status = ?, lease_until = ?, lease_owner = ?, updated_at = ? WHERE id = ?",
+                    [(SENDING, now + self.lease, owner, now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return owner, rows
+
+    def _renew(self, row_id, owner):
+        """Extend a row's lease before delivering it; False if another worker has taken it over"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE outbox SET lease_until = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (now + self.lease, now, row_id, SENDING, owner),
+            )
+        return cursor.rowcount == 1
+
+    def _finish(self, row_id, owner, result):
+        """Commit a delivery outcome while the lease is still ours"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, progress = ?, next_attempt_at = ?, "
+                "last_error = ?, updated_at = ?, lease_until = NULL, lease_owner = NULL "
+                "WHERE id = ? AND lease_owner = ?",
+                result + (row_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def _defer(self, row_ids, owner, until):
+        """Put leased rows back in the queue untried, due at ``until``"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, updated_at = ?, lease_until = NULL, "
+                "lease_owner = NULL WHERE id = ? AND lease_owner = ?",
+                [(PENDING, until, time.time(), row_id, owner) for row_id in row_ids],
+            )
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _parent(self, parent_key):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT status, payload, progress, next_attempt_at FROM outbox WHERE idempotency_key = ?",
+                (parent_key,),
+            ).fetchone()
+
+    def _chat(self, row, claimed):
+        """Chat a row is delivered to; an incident update goes wherever its incident's alert went"""
+        parent_key = row[7]
+        if parent_key in claimed:
+            return self._chat(claimed[parent_key], claimed)
+        parent = self._parent(parent_key) if parent_key else None
+        if parent is not None and parent[0] != FAILED:
+            return delivery_chat(json.loads(parent[1]), json.loads(parent[2]))
+        return delivery_chat(json.loads(row[2]), json.loads(row[5]))
+
+    def _deliver_update(self, details, photos, progress, parent_key, edit):
+        parent = self._parent(parent_key)
+        if parent is None or parent[0] == FAILED:
+            # The incident's own alert never went out, so this report stands alone
+            deliver_alert(details, photos, progress)
+            return
+        parent_progress = json.loads(parent[2])
+        if "message_id" not in parent_progress:
+            # Retried no sooner than the parent itself; standalone only once it has FAILED
+            raise ParentPending(parent_key, max(parent[3], time.time() + self.poll_interval))
+        deliver_incident_update(details, photos, json.loads(parent[1]), parent_progress, progress, edit)
+
+    def _deliver(self, row, edit=True):
+        row_id, key, payload, photo_refs, attempts, progress, created_at, parent_key = row
+        progress = json.loads(progress)
+        attempts += 1
+        try:
+            with metrics.span("alert_delivery_attempt"):
+                details = json.loads(payload)
+                photos = self._load_photos(details, json.loads(photo_refs))
+                if parent_key:
+                    self._deliver_update(details, photos, progress, parent_key, edit)
+                else:
+                    deliver_alert(details, photos, progress)
+        except ParentPending as e:
+            # Not an attempt of this row: it waits for its parent without counting towards max_attempts
+            logger.info(f"Outbox delivery of {key} deferred: {e}")
+            return (PENDING, attempts - 1, json.dumps(progress), e.due, str(e), time.time())
+        except Exception as e:
+            now = time.time()
+            status = FAILED if attempts >= self.max_attempts else PENDING
+            logger.error(f"Outbox delivery of {key} failed (attempt {attempts}): {e}")
+            return (status, attempts, json.dumps(progress), now + self._backoff(attempts), str(e), now)
+        now = time.time()
+        # End to end: from the user's confirm (enqueue) to the admin chat
+        metrics.observe("alert_delivery_seconds", now - created_at, "Time from confirm to admin notification")
+        return (SENT, attempts, json.dumps(progress), now, None, now)
+
+    def _deliver_lane(self, chat_id, rows, owner, editors):
+        """Deliver one chat's rows in order; returns (idempotency_key, status) of those finished"""
+        outcomes = []
+        for position, row in enumerate(rows):
+            wait = chat_delay(chat_id)
+            if wait > self.defer_after:
+                # This chat's quota is spent for a while; the rest of its rows wait in the queue,
+                # not on this worker
+                self._defer([later[0] for later in rows[position:]], owner, time.time() + wait)
+                break
+            if not self._renew(row[0], owner):
+                logger.warning(f"Outbox lease on {row[1]} was taken over, leaving it to the other worker")
+                continue
+            result = self._deliver(row, edit=not row[7] or row[0] in editors)
+            if self._finish(row[0], owner, result):
+                outcomes.append((row[1], result[0]))
+        return outcomes
+
+    def drain_once(self):
+        """Deliver one batch of due alerts; returns the number of rows claimed"""
+        owner, rows = self._claim()
+        if not rows:
+            return 0
+        # Several reports of one incident in a batch need only one edit of its
+        # alert: the one with the highest report count
+        latest = {}
+        for row in rows:
+            if row[7]:
+                reports = json.loads(row[2])["incident"]["reports"]
+                if reports >= latest.get(row[7], (0, None))[0]:
+                    latest[row[7]] = (reports, row[0])
+        editors = {row_id for _, row_id in latest.values()}
+        # A severe update may be claimed ahead of its incident's own alert;
+        # deliver the alert first so the update does not wait a retry
+        claimed = {row[1]: row for row in rows}
+        rows.sort(key=lambda row: row[7] in claimed)
+        lanes = {}
+        for row in rows:
+            lanes.setdefault(self._chat(row, claimed), []).append(row)
+        futures = [self._lanes.submit(self._deliver_lane, chat_id, lane, owner, editors)
+                   for chat_id, lane in lanes.items()]
+        outcomes = [outcome for future in futures for outcome in future.result()]
+        for callback in self._listeners:
+            try:
+                callback(outcomes)
+            except Exception as e:
+                logger.error(f"Outbox listener error: {e}")
+        return len(rows)
+
+    def _run(self):
+        last_purge = 0.0
+        while not self._stopping.is_set():
+            try:
+                if time.time() - last_purge > PURGE_INTERVAL:
+                    self.purge()
+                    last_purge = time.time()
+                if self.drain_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the background delivery worker if it is not already running"""
+        if self._worker is None or not self._worker.is_alive():
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def purge(self, older_than=7 * 24 * 3600):
+        """Delete delivered rows past retention and spool files no row references"""
+        cutoff = time.time() - older_than
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE status = ? AND updated_at < ?", (SENT, cutoff))
+            referenced = set()
+            for (refs,) in self._conn.execute("SELECT photos FROM outbox"):
+                referenced.update(ref for ref in json.loads(refs) if isinstance(ref, str))
+            # Files are spooled (or refreshed, if already there) just before their
+            # row is inserted; leave recent ones alone so an enqueue in progress
+            # does not lose its photos
+            recent = time.time() - PURGE_INTERVAL
+            for name in os.listdir(self.spool_dir):
+                path = os.path.join(self.spool_dir, name)
+                if name in referenced or name.endswith(".tmp"):
+                    continue
+                try:
+                    if os.stat(path).st_ctime < recent:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """Return the process-wide outbox with its delivery worker running"""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                data_dir = os.getenv("OUTBOX_DIR", os.path.join(BASE_DIR, ".cache", "outbox"))
+                _outbox = Outbox(
+                    os.path.join(data_dir, "outbox.sqlite3"),
+                    os.path.join(data_dir, "spool"),
+                    max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20")),
+                    chat_lanes=int(os.getenv("OUTBOX_CHAT_LANES", "4")),
+                )
+                _outbox.start()
+    return _outbox
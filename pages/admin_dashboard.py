@@ -0,0 +1,83 @@
+import os
+import hmac
+import time
+from datetime import datetime
+import streamlit as st
+import metrics
+from bootstrap import rerun_timer
+from styles import APP_CSS
+from incident_store import get_incident_store
+from incident_map import get_incident_map, STATUSES
+from map_render import incident_overview_map
+
+MAP_CENTER = (20.5937, 78.9629)  # Center of India
+MAP_ZOOM = 5
+REFRESH_SECONDS = float(os.getenv("ADMIN_REFRESH_SECONDS", "5"))
+
+
+def authorized():
+    """Ask for ADMIN_DASHBOARD_PASSWORD; without one the page stays closed.
+
+    The page sits in the reporters' app, so an unset password must not
+    expose their locations and photos to anyone who opens the sidebar.
+    """
+    password = os.getenv("ADMIN_DASHBOARD_PASSWORD")
+    if not password:
+        st.error("The dashboard is disabled: set ADMIN_DASHBOARD_PASSWORD on the server to enable it.")
+        return False
+    if st.session_state.get('admin_authorized'):
+        return True
+    attempt = st.text_input("Dashboard password", type="password")
+    if attempt and hmac.compare_digest(attempt, password):
+        st.session_state.admin_authorized = True
+        st.rerun()
+    elif attempt:
+        st.error("Wrong password")
+    return False
+
+
+def live_incidents():
+    """Refresh the map from the shared store, sending only what changed to the browser"""
+    incident_map = get_incident_map()
+    revision = incident_map.sync(get_incident_store())
+    bounds, zoom = st.session_state.admin_view
+
+    # Reclustering is skipped unless the incidents or the view changed, so
+    # an idle refresh hands the component identical arguments
+    cache_key = (revision, bounds, zoom, int(time.time() // 60))
+    if st.session_state.get('admin_cache_key') != cache_key:
+        st.session_state.admin_geojson = incident_map.features(bounds, zoom, since=st.session_state.admin_opened_at)
+        st.session_state.admin_cache_key = cache_key
+    geojson = st.session_state.admin_geojson
+
+    counts = incident_map.counts()
+    columns = st.columns(len(STATUSES) + 1)
+    columns[0].metric("Open incidents", sum(counts.values()))
+    for column, status in zip(columns[1:], STATUSES):
+        column.metric(status.capitalize(), counts[status])
+
+    view = incident_overview_map(MAP_CENTER, MAP_ZOOM, geojson, key="admin_incident_map")
+    if view is not None and view != st.session_state.admin_view:
+        st.session_state.admin_view = view
+        st.rerun(scope="fragment")
+    st.caption(f"{len(geojson['features'])} marker(s) in view · updated {datetime.now():%H:%M:%S}")
+
+
+def main():
+    st.set_page_config(page_title="Incident Dashboard", page_icon="🗺️", layout="wide")
+    st.markdown(APP_CSS, unsafe_allow_html=True)
+    st.markdown('<h1 class="emergency-title">🗺️ Live Incidents</h1>', unsafe_allow_html=True)
+    if not authorized():
+        st.stop()
+
+    if 'admin_view' not in st.session_state:
+        st.session_state.admin_view = (None, MAP_ZOOM)
+        # Incidents updated after the dashboard opened are outlined as new
+        st.session_state.admin_opened_at = time.time()
+
+    st.fragment(run_every=REFRESH_SECONDS)(live_incidents)()
+
+
+if __name__ == "__main__":
+    with rerun_timer(), metrics.span("admin_dashboard_rerun"):
+        main()
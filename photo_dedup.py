@@ -0,0 +1,227 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageOps
+import metrics
+from telegram_client import TelegramFile
+
+logger = logging.getLogger(__name__)
+
+# Hamming distance between 64-bit pHashes still counted as the same picture;
+# recompression and resizing stay within about 4, different scenes above 20
+PHOTO_DEDUP_DISTANCE = int(os.getenv("PHOTO_DEDUP_DISTANCE", "6"))
+# dHash distance a pHash match must also pass, to reject chance collisions
+DHASH_CONFIRM_DISTANCE = 12
+# How long a delivered photo's file_id is offered for reuse
+PHOTO_DEDUP_WINDOW = float(os.getenv("PHOTO_DEDUP_WINDOW", str(6 * 3600)))
+
+_HASH_EDGE = 32
+_cosines = np.cos(np.pi * np.outer(np.arange(8), 2 * np.arange(_HASH_EDGE) + 1) / (2 * _HASH_EDGE))
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def _grayscale(data):
+    image = Image.open(io.BytesIO(data))
+    # JPEG draft mode decodes at 1/2 to 1/8 scale, several times faster than a full decode
+    image.draft("L", (4 * _HASH_EDGE, 4 * _HASH_EDGE))
+    return ImageOps.exif_transpose(image).convert("L")
+
+
+def ahash(image):
+    """64-bit average hash: which 8x8 cells are brighter than the mean"""
+    pixels = np.asarray(image.resize((8, 8), Image.BILINEAR), dtype=np.float32)
+    return _pack(pixels > pixels.mean())
+
+
+def dhash(image):
+    """64-bit difference hash: horizontal brightness gradients on a 9x8 grid"""
+    pixels = np.asarray(image.resize((9, 8), Image.BILINEAR), dtype=np.float32)
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image):
+    """64-bit perceptual hash: signs of the lowest 8x8 DCT frequencies against their median"""
+    pixels = np.asarray(image.resize((_HASH_EDGE, _HASH_EDGE), Image.BILINEAR), dtype=np.float32)
+    frequencies = _cosines @ pixels @ _cosines.T
+    # The DC term only carries overall brightness
+    return _pack(frequencies > np.median(frequencies.ravel()[1:]))
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class PlannedPhoto:
+    """One photo of a report ready to send: its upload bytes, or the file_id of a near-duplicate"""
+
+    def __init__(self, data, phash_value, dhash_value, file_id=None):
+        self.data = data
+        self.phash = phash_value
+        self.dhash = dhash_value
+        self.file_id = file_id
+
+    @property
+    def payload(self):
+        return self.file_id or self.data
+
+
+class PhotoIndex:
+    """Recently delivered photos keyed by perceptual hash, for upload deduplication.
+
+    ``plan()`` hashes a report's photos, drops near-duplicates within the
+    report and replaces photos that match one already delivered in the
+    last ``window`` seconds with its Telegram file_id, so the bytes are not
+    uploaded again. ``remember()`` records the file_ids Telegram returns.
+
+    Hashes live in NumPy slot arrays, 24 bytes per photo, and a lookup is
+    one vectorized XOR and popcount over all of them: tens of microseconds
+    for tens of thousands of photos. Tree indexes such as BK-trees prune
+    poorly at this radius, since unrelated 64-bit hashes all sit about 32
+    bits apart. Hashes are memoized by content digest, since outbox retries
+    send the same bytes again.
+    """
+
+    def __init__(self, max_distance=PHOTO_DEDUP_DISTANCE, window=PHOTO_DEDUP_WINDOW, hash_cache=4096):
+        self.max_distance = max_distance
+        self.window = window
+        self._count = 0
+        self._phashes = np.empty(0, dtype=np.uint64)
+        self._dhashes = np.empty(0, dtype=np.uint64)
+        self._expires = np.empty(0)
+        self._file_ids = []
+        self._hashes = OrderedDict()
+        self._hash_cache = hash_cache
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return int((self._expires[:self._count] > time.time()).sum())
+
+    def hashes(self, data):
+        """(pHash, dHash) of encoded image bytes"""
+        digest = hashlib.sha256(data).digest()
+        with self._lock:
+            cached = self._hashes.get(digest)
+            if cached is not None:
+                self._hashes.move_to_end(digest)
+                return cached
+        image = _grayscale(data)
+        result = (phash(image), dhash(image))
+        with self._lock:
+            self._hashes[digest] = result
+            while len(self._hashes) > self._hash_cache:
+                self._hashes.popitem(last=False)
+        return result
+
+    def _make_room(self, now):
+        # Drop expired and forgotten slots before growing
+        live = np.flatnonzero(self._expires[:self._count] > now)
+        if len(live) < self._count // 2:
+            for name in ("_phashes", "_dhashes", "_expires"):
+                array = getattr(self, name)
+                array[:len(live)] = array[live]
+            self._file_ids = [self._file_ids[slot] for slot in live.tolist()]
+            self._count = len(live)
+        if self._count >= len(self._expires):
+            capacity = max(1024, 2 * len(self._expires))
+            for name in ("_phashes", "_dhashes", "_expires"):
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+
+    def _match(self, phash_value, dhash_value, now):
+        count = self._count
+        distances = np.bitwise_count(self._phashes[:count] ^ np.uint64(phash_value))
+        candidates = np.flatnonzero((distances <= self.max_distance) & (self._expires[:count] > now))
+        if not len(candidates):
+            return None
+        confirmed = np.bitwise_count(self._dhashes[candidates] ^ np.uint64(dhash_value)) <= DHASH_CONFIRM_DISTANCE
+        candidates = candidates[confirmed]
+        if not len(candidates):
+            return None
+        return self._file_ids[int(candidates[np.argmin(distances[candidates])])]
+
+    def lookup(self, data, now=None):
+        """file_id of a recently delivered near-duplicate of ``data``, or None"""
+        phash_value, dhash_value = self.hashes(data)
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._match(phash_value, dhash_value, now)
+
+    def plan(self, photos, now=None):
+        """Return the PlannedPhoto list to send for a report's photo bytes or TelegramFiles"""
+        now = time.time() if now is None else now
+        planned, kept = [], []
+        for data in photos:
+            if isinstance(data, TelegramFile):
+                # Already on Telegram: nothing to upload, and no bytes to hash
+                planned.append(PlannedPhoto(None, None, None, data.file_id))
+                continue
+            try:
+                phash_value, dhash_value = self.hashes(data)
+            except Exception as e:
+                # Not decodable as an image: send it as is and let Telegram judge
+                logger.warning(f"Could not hash photo: {e}")
+                planned.append(PlannedPhoto(data, None, None))
+                continue
+            if any(hamming(phash_value, p) <= self.max_distance and hamming(dhash_value, d) <= DHASH_CONFIRM_DISTANCE
+                   for p, d in kept):
+                metrics.inc("photo_dedup_total", 1, "Photos by deduplication outcome", result="within_report")
+                continue
+            kept.append((phash_value, dhash_value))
+            with self._lock:
+                file_id = self._match(phash_value, dhash_value, now)
+            if file_id is not None:
+                metrics.inc("photo_dedup_total", 1, "Photos by deduplication outcome", result="reused")
+                metrics.inc("photo_upload_bytes_saved_total", len(data), "Photo bytes not re-uploaded")
+            else:
+                metrics.inc("photo_dedup_total", 1, "Photos by deduplication outcome", result="uploaded")
+            planned.append(PlannedPhoto(data, phash_value, dhash_value, file_id))
+        return planned
+
+    def remember(self, planned, messages, now=None):
+        """Index the file_ids Telegram assigned to the uploaded photos in ``planned``"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for photo, message in zip(planned, messages):
+                sizes = (message or {}).get("photo") or []
+                if photo.file_id or photo.phash is None or not sizes:
+                    continue
+                if self._count >= len(self._expires):
+                    self._make_room(now)
+                slot = self._count
+                self._phashes[slot], self._dhashes[slot] = photo.phash, photo.dhash
+                self._expires[slot] = now + self.window
+                # Sizes are listed smallest first; the largest is what was uploaded
+                self._file_ids.append(sizes[-1]["file_id"])
+                self._count += 1
+
+    def forget(self, planned):
+        """Stop offering the file_ids in ``planned``, e.g. after Telegram rejected one"""
+        file_ids = {photo.file_id for photo in planned if photo.file_id}
+        with self._lock:
+            for slot, file_id in enumerate(self._file_ids):
+                if file_id in file_ids:
+                    self._expires[slot] = 0.0
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_photo_index():
+    """Return the process-wide index of delivered photos"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PhotoIndex()
+    return _index
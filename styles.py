@@ -0,0 +1,96 @@
+# Dark theme styles injected on every rerun (Streamlit drops elements that
+# are not re-emitted), so keep the markup as a module-level constant
+APP_CSS = """
+<style>
+/* Dark theme styles */
+body {
+    background-color: #121212;
+    color: #FFFFFF;
+}
+.main {
+    padding: 2rem;
+    max-width: 900px;
+    margin: 0 auto;
+    background-color: #121212;
+}
+.stButton button {
+    width: 100%;
+    border-radius: 20px;
+    height: 3em;
+    font-weight: 600;
+    background-color: #2C2C2C;
+    color: #FFFFFF;
+    border: 1px solid #404040;
+    transition: all 0.3s ease;
+}
+.stButton button:hover {
+    background-color: #404040;
+    border-color: #505050;
+    transform: scale(1.02);
+}
+.emergency-title {
+    color: #FF4B4B;
+    text-align: center;
+    margin-bottom: 1em;
+    font-size: 2.5em;
+}
+.stTextInput input, .stTextArea textarea {
+    background-color: #2C2C2C;
+    color: #FFFFFF;
+    border: 1px solid #404040;
+}
+.stTextInput input:focus, .stTextArea textarea:focus {
+    border-color: #505050;
+    box-shadow: 0 0 0 1px #505050;
+}
+.uploadedFile {
+    background-color: #2C2C2C;
+    color: #FFFFFF;
+    border: 1px solid #404040;
+}
+.css-1d391kg {
+    background-color: #1E1E1E;
+}
+.folium-map {
+    border: 2px solid #404040;
+    border-radius: 10px;
+}
+/* Override Streamlit's default white background */
+.stApp {
+    background-color: #121212;
+}
+/* Emergency type buttons */
+.emergency-btn {
+    height: 120px !important;
+    display: flex;
+    flex-direction: column;
+    justify-content: center;
+    align-items: center;
+    font-size: 1.2em !important;
+}
+.emergency-btn span {
+    font-size: 2em;
+    margin-bottom: 10px;
+}
+/* Progress bar styling */
+.stProgress > div > div > div {
+    background-color: #FF4B4B;
+}
+/* All text elements to white */
+p, li, div, span, .stMarkdown, .stAlert, .stSuccess, .stWarning, .stError {
+    color: #FFFFFF !important;
+}
+/* Input labels */
+label {
+    color: #FFFFFF !important;
+}
+/* Expander headers */
+.stExpander label {
+    color: #FFFFFF !important;
+}
+/* Dataframe text */
+.stDataFrame {
+    color: #FFFFFF !important;
+}
+</style>
+"""
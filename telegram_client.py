@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram's documented broadcast limits
+GLOBAL_RATE = 30.0           # messages per second across all chats
+PRIVATE_CHAT_RATE = 1.0      # messages per second to a single chat
+GROUP_CHAT_RATE = 20 / 60.0  # messages per second to a group chat
+MEDIA_GROUP_MAX = 10         # items per sendMediaGroup call
+
+
+class TelegramError(Exception):
+    """A Bot API call that failed after all retries"""
+
+    def __init__(self, method, description, error_code=None):
+        super().__init__(f"{method} failed: {description}")
+        self.method = method
+        self.description = description
+        self.error_code = error_code
+
+
+class TelegramFile:
+    """A photo already on Telegram's servers, e.g. one a user sent the bot.
+
+    It is sent on by ``file_id``, so the bytes are never downloaded or
+    uploaded again. A file_id only works for the bot that received it.
+    """
+
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class TokenBucket:
+    """Blocking token bucket; acquire() waits until enough tokens are available"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, cost):
+        """Take tokens and return how long the caller must wait before using them.
+
+        A cost above the capacity (an album of several photos) waits only for a
+        full bucket; the rest is carried as debt that later calls wait out.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            need = min(cost, self.capacity)
+            wait = (need - self._tokens) / self.rate if self._tokens < need else 0.0
+            self._tokens -= cost
+            return max(wait, self._blocked_until - now)
+
+    def acquire(self, cost=1):
+        wait = self._reserve(cost)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def delay(self, cost=1):
+        """How long acquire(cost) would wait right now, without taking any tokens"""
+        with self._lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            wait = (min(cost, self.capacity) - tokens) / self.rate if tokens < min(cost, self.capacity) else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def block_for(self, seconds):
+        """Stop handing out tokens for a while, e.g. after a 429 retry_after"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """Global plus per-chat token buckets following the Bot API quotas"""
+
+    def __init__(self, global_rate=GLOBAL_RATE, private_rate=PRIVATE_CHAT_RATE, group_rate=GROUP_CHAT_RATE):
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self._global = TokenBucket(global_rate)
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        key = str(chat_id)
+        with self._lock:
+            bucket = self._chats.get(key)
+            if bucket is None:
+                # Group and channel IDs are negative
+                rate = self.group_rate if key.startswith("-") else self.private_rate
+                bucket = self._chats[key] = TokenBucket(rate, capacity=1)
+            return bucket
+
+    def acquire(self, chat_id=None, cost=1):
+        waited = 0.0
+        if chat_id is not None:
+            waited += self._chat_bucket(chat_id).acquire(cost)
+        waited += self._global.acquire(cost)
+        return waited
+
+    def delay(self, chat_id):
+        """How long a message to ``chat_id`` would wait for its chat's quota right now"""
+        return self._chat_bucket(chat_id).delay() if chat_id is not None else 0.0
+
+    def block(self, chat_id, seconds):
+        if chat_id is not None:
+            self._chat_bucket(chat_id).block_for(seconds)
+        else:
+            self._global.block_for(seconds)
+
+
+class TelegramClient:
+    """Bot API client with a keep-alive connection pool and quota-aware scheduling.
+
+    ``base_url`` can point at a local stub server for testing. Failed calls
+    raise TelegramError instead of being silently dropped.
+    """
+
+    def __init__(self, token, base_url="https://api.telegram.org", pool_size=10,
+                 timeout=15, max_retries=3, rate_limiter=None):
+        self.api_url = f"{base_url.rstrip('/')}/bot{token}"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._token = token
+        self._started = time.monotonic()
+        self._latencies = deque(maxlen=1000)
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "retries": 0, "rate_limited": 0, "throttle_wait": 0.0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _backoff(self, attempt):
+        if attempt < self.max_retries:
+            time.sleep(min(2 ** attempt, 10))
+
+    def call(self, method, chat_id=None, data=None, files=None, cost=1):
+        """Invoke a Bot API method and return its ``result``"""
+        description, error_code = "no attempt made", None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count("retries")
+            self._count("throttle_wait", self.rate_limiter.acquire(chat_id, cost))
+            started = time.monotonic()
+            outcome = "network_error"
+            try:
+                if files:
+                    response = self.session.post(f"{self.api_url}/{method}", data=data, files=files, timeout=self.timeout)
+                else:
+                    response = self.session.post(f"{self.api_url}/{method}", json=data, timeout=self.timeout)
+                outcome = f"http_{response.status_code}"
+                payload = response.json()
+            except (requests.RequestException, ValueError) as e:
+                self._count("errors")
+                description = str(e).replace(self._token, "<token>") if self._token else str(e)
+                self._backoff(attempt)
+                continue
+            finally:
+                elapsed = time.monotonic() - started
+                with self._stats_lock:
+                    self._stats["requests"] += 1
+                    self._latencies.append(elapsed)
+                metrics.observe("telegram_request_seconds", elapsed, "Bot API call latency", method=method)
+                metrics.inc("telegram_requests_total", 1, "Bot API calls by outcome", method=method, outcome=outcome)
+
+            if payload.get("ok"):
+                return payload.get("result")
+
+            self._count("errors")
+            description = payload.get("description", f"HTTP {response.status_code}")
+            error_code = payload.get("error_code", response.status_code)
+            retry_after = (payload.get("parameters") or {}).get("retry_after")
+            if retry_after is not None:
+                self._count("rate_limited")
+                logger.warning(f"Telegram {method} rate limited, retrying after {retry_after}s")
+                self.rate_limiter.block(chat_id, retry_after)
+            elif response.status_code < 500:
+                # Client errors (bad chat ID, malformed request) will not succeed on retry
+                break
+            else:
+                self._backoff(attempt)
+        raise TelegramError(method, description, error_code)
+
+    def send_message(self, chat_id, text, **params):
+        return self.call("sendMessage", chat_id, {"chat_id": chat_id, "text": text, **params})
+
+    def edit_message_text(self, chat_id, message_id, text, **params):
+        return self.call("editMessageText", chat_id, {"chat_id": chat_id, "message_id": message_id, "text": text, **params})
+
+    def send_photo(self, chat_id, photo, caption=None, **params):
+        data = {"chat_id": chat_id, **params}
+        if caption:
+            data["caption"] = caption
+        if isinstance(photo, str):
+            # A file_id of a photo Telegram already has is sent without re-uploading it
+            data["photo"] = photo
+            return self.call("sendPhoto", chat_id, data)
+        return self.call("sendPhoto", chat_id, data, files={"photo": photo})
+
+    def send_media_group(self, chat_id, photos, caption=None, **params):
+        """Send photos as albums of up to ten; returns the list of sent messages.
+
+        Each photo is either image bytes or the file_id of a photo already
+        delivered, which Telegram reuses without an upload.
+        """
+        messages = []
+        for start in range(0, len(photos), MEDIA_GROUP_MAX):
+            chunk = photos[start:start + MEDIA_GROUP_MAX]
+            if len(chunk) == 1:
+                messages.append(self.send_photo(chat_id, chunk[0], caption, **params))
+                continue
+            media, files = [], {}
+            for i, photo in enumerate(chunk):
+                if isinstance(photo, str):
+                    item = {"type": "photo", "media": photo}
+                else:
+                    name = f"photo{i}"
+                    item = {"type": "photo", "media": f"attach://{name}"}
+                    files[name] = photo
+                if caption and i == 0:
+                    item["caption"] = caption
+                media.append(item)
+            data = {"chat_id": chat_id, "media": json.dumps(media), **params}
+            messages.extend(self.call("sendMediaGroup", chat_id, data, files=files or None, cost=len(chunk)))
+        return messages
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        elapsed = time.monotonic() - self._started
+        stats["throughput"] = stats["requests"] / elapsed if elapsed else 0.0
+        if latencies:
+            stats["latency_avg"] = sum(latencies) / len(latencies)
+            stats["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide Telegram client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient(
+                    os.getenv("TELEGRAM_BOT_TOKEN"),
+                    base_url=os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org"),
+                    pool_size=int(os.getenv("TELEGRAM_POOL_SIZE", "10")),
+                    timeout=float(os.getenv("TELEGRAM_TIMEOUT", "15")),
+                    rate_limiter=RateLimiter(
+                        global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", str(GLOBAL_RATE))),
+                        private_rate=float(os.getenv("TELEGRAM_CHAT_RATE", str(PRIVATE_CHAT_RATE))),
+                        group_rate=float(os.getenv("TELEGRAM_GROUP_RATE", str(GROUP_CHAT_RATE))),
+                    ),
+                )
+    return _client
@@ -0,0 +1,78 @@
+"""Prefix ranges, fuzzy matching and ranking of the local address index.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+from address_index import AddressIndex, build_index  # noqa: E402
+
+PLACES = [
+    ("Mumbai, Maharashtra", "city", 19.076, 72.878, 7.1, "Mumbai Maharashtra"),
+    ("Navi Mumbai, Maharashtra", "city", 19.033, 73.030, 6.1, "Navi Mumbai Maharashtra"),
+    ("Pune, Maharashtra", "city", 18.520, 73.857, 6.5, "Pune Maharashtra"),
+    ("Punalur, Kerala", "city", 9.018, 76.926, 4.7, "Punalur Kerala"),
+    ("Aurangabad, Maharashtra", "city", 19.876, 75.343, 6.0, "Aurangabad Maharashtra"),
+    ("Aurangabad, Bihar", "city", 24.752, 84.374, 5.0, "Aurangabad Bihar"),
+]
+
+
+def levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        previous, row = row, [i]
+        for j, y in enumerate(b, 1):
+            row.append(min(row[j - 1] + 1, previous[j] + 1, previous[j - 1] + (x != y)))
+    return row[-1]
+
+
+@pytest.fixture(scope="module")
+def words():
+    rng = random.Random(3)
+    return sorted({"".join(rng.choice("abcd") for _ in range(rng.randint(1, 6))) for _ in range(400)})
+
+
+@pytest.fixture(scope="module")
+def word_index(words, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("index") / "words.bin")
+    build_index([(word, "city", 0.0, 0.0, 1.0, word) for word in words], path)
+    return AddressIndex(path)
+
+
+@pytest.fixture(scope="module")
+def places(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("index") / "places.bin")
+    build_index(PLACES, path)
+    return AddressIndex(path)
+
+
+def test_prefix_range_covers_exactly_the_tokens_with_that_prefix(words, word_index):
+    tokens = sorted({word.encode() for word in words})
+    prefixes = {word[:n] for word in words for n in range(1, len(word) + 1)} | {"abcdab", "e", "dddddddd"}
+    for prefix in prefixes:
+        lo, hi = word_index.prefix_range(prefix.encode())
+        assert [word_index._token(i) for i in range(lo, hi)] == \
+            [token for token in tokens if token.startswith(prefix.encode())], prefix
+
+
+def test_fuzzy_tokens_match_a_brute_force_edit_distance(words, word_index):
+    for query in ["abca", "bdda", "cccc", "dabcd", "aaaaaa"]:
+        for distance in (1, 2):
+            found = {word_index._token(i).decode() for i in word_index.fuzzy_tokens(query.encode(), distance)}
+            assert found == {word for word in words if word[0] == query[0] and levenshtein(word, query) <= distance}
+
+
+def test_suggest_completes_the_last_word_and_prefers_exact_namesakes(places):
+    assert {match.label for match in places.suggest("Pun")} >= {"Pune, Maharashtra", "Punalur, Kerala"}
+    assert places.suggest("Mumbai ")[0].label == "Mumbai, Maharashtra"
+
+
+def test_resolve_tolerates_a_typo_and_refuses_distant_namesakes(places):
+    assert places.resolve("Mumbay Maharashtra").label == "Mumbai, Maharashtra"
+    assert places.resolve("Aurangabad") is None
+    assert places.resolve("Aurangabad Bihar").label == "Aurangabad, Bihar"
@@ -0,0 +1,64 @@
+"""Photo albums and the HTML of admin alerts.
+
+    python -m pytest tests
+"""
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+import alerts  # noqa: E402
+from photo_dedup import PhotoIndex  # noqa: E402
+from telegram_client import TelegramError, TelegramFile  # noqa: E402
+
+
+def jpeg(seed):
+    image = Image.effect_mandelbrot((64, 64), (-2 + seed, -1.5, 1 + seed, 1.5), 50)
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class FakeClient:
+    """Rejects albums holding a stale file_id, like Telegram does"""
+
+    def __init__(self, stale):
+        self.stale = stale
+        self.albums = []
+
+    def send_media_group(self, chat_id, media, caption=None, **params):
+        self.albums.append(list(media))
+        if self.stale in media:
+            raise TelegramError("sendMediaGroup", "Bad Request: wrong file identifier", 400)
+        return [{"photo": [{"file_id": f"new-{n}"}]} for n in range(len(media))]
+
+
+def test_rejected_reuse_is_uploaded_and_bot_photos_stay_file_ids(monkeypatch):
+    index = PhotoIndex()
+    reused, fresh = jpeg(0), jpeg(0.7)
+    index.remember(index.plan([reused]), [{"photo": [{"file_id": "stale"}]}])
+    monkeypatch.setattr(alerts, "get_photo_index", lambda: index)
+    client = FakeClient("stale")
+
+    alerts.send_photos(client, "-100", [TelegramFile("from-bot"), reused, fresh], "caption")
+
+    assert client.albums[0] == ["from-bot", "stale", fresh]
+    assert client.albums[1] == ["from-bot", reused, fresh]
+    assert index.lookup(reused) == "new-1"
+
+
+def test_untrusted_text_is_escaped_for_html():
+    details = {"type": "Fire", "time": "2026-10-17 10:00:00", "current_location": "18.52,73.85",
+               "text_address": "Shop <3 & Sons, M.G. Road"}
+    message = alerts.build_alert_message(details, {"address": "Lane <A> & B"})
+    assert "Shop &lt;3 &amp; Sons" in message and "Lane &lt;A&gt; &amp; B" in message
+    assert "<" not in message
+
+    update = alerts.build_incident_update(
+        dict(details, text_address="Gate 2"),
+        dict(details, incident={"reports": 2}), {},
+    )
+    assert "Latest Provided Address: Shop &lt;3 &amp; Sons" in update
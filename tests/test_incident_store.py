@@ -0,0 +1,38 @@
+"""Incident store URLs and backend interface.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+from incident_store import BACKENDS, IncidentStore, IncidentRecord, sqlite_path  # noqa: E402
+
+
+def test_relative_sqlite_url_stays_relative(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    assert sqlite_path("sqlite://data/incidents.sqlite3") == "data/incidents.sqlite3"
+    store = BACKENDS["sqlite"]("sqlite://data/incidents.sqlite3")
+    store.put(IncidentRecord("r1", "Fire"))
+    assert (tmp_path / "data" / "incidents.sqlite3").exists()
+
+
+def test_absolute_sqlite_url(tmp_path):
+    path = tmp_path / "incidents.sqlite3"
+    assert sqlite_path(f"sqlite://{path}") == str(path)
+    store = BACKENDS["sqlite"](f"sqlite://{path}")
+    store.put(IncidentRecord("r1", "Fire"))
+    assert store.get("r1").type == "Fire" and path.exists()
+
+
+def test_incomplete_backend_fails_on_construction():
+    class Partial(IncidentStore):
+        def put_many(self, records):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,66 @@
+"""Merging of nearby reports by the incident clusterer.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import random
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from incidents import IncidentClusterer  # noqa: E402
+from offline_geocoder import haversine_km  # noqa: E402
+
+
+def report(lat, lon, time="2026-10-17 10:00:00", emergency_type="Fire"):
+    return {"type": emergency_type, "time": time, "current_location": {"latitude": lat, "longitude": lon}}
+
+
+def test_reports_in_neighbouring_columns_merge():
+    clusterer = IncidentClusterer(radius_km=0.5)
+    first, merged = clusterer.observe(report(29.46123, 93.46351), "a")
+    assert not merged
+    second, merged = clusterer.observe(report(29.45805, 93.46650), "b")
+    assert merged and second is first
+
+
+def test_every_report_within_radius_merges():
+    rng = random.Random(7)
+    for n in range(2000):
+        clusterer = IncidentClusterer(radius_km=0.5)
+        lat, lon = rng.uniform(-75, 75), rng.uniform(-170, 170)
+        other_lat, other_lon = lat + rng.uniform(-0.005, 0.005), lon + rng.uniform(-0.02, 0.02)
+        clusterer.observe(report(lat, lon), f"a{n}")
+        _, merged = clusterer.observe(report(other_lat, other_lon), f"b{n}")
+        assert merged == (float(haversine_km(lat, lon, [other_lat], [other_lon])[0]) <= 0.5)
+
+
+def test_back_dated_reports_merge_with_each_other():
+    clusterer = IncidentClusterer(radius_km=0.5, window=1800)
+    clusterer.observe(report(18.52, 73.85, time="2024-01-01 10:00:00"), "a")
+    _, merged = clusterer.observe(report(18.5201, 73.8501, time="2024-01-01 10:05:00"), "b")
+    assert merged
+    # Outside the window of report time they stay apart
+    _, merged = clusterer.observe(report(18.5201, 73.8501, time="2024-01-01 11:00:00"), "c")
+    assert not merged
+
+
+def test_back_dated_report_does_not_hold_up_expiry():
+    clusterer = IncidentClusterer(radius_km=0.5, window=1800)
+    clusterer.observe(report(18.52, 73.85, time="2024-01-01 12:00:00"), "new")
+    clusterer.observe(report(28.61, 77.20, time="2024-01-01 10:00:00"), "old")
+    # Past the old report's window only: it expires although it was observed last
+    clusterer.observe(report(12.97, 77.59, time="2024-01-01 10:45:00"), "later")
+    assert sorted(clusterer._by_report) == ["later", "new"]
+    assert len(clusterer) == 2
+
+
+def test_future_dated_report_does_not_expire_live_incidents():
+    clusterer = IncidentClusterer(radius_km=0.5, window=1800)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    first, _ = clusterer.observe(report(19.0, 72.8, time=now), "now")
+    clusterer.observe(report(19.0, 72.8, time="2099-01-01 00:00:00"), "future")
+    incident, merged = clusterer.observe(report(19.0, 72.8, time=now), "again")
+    assert merged and incident is first
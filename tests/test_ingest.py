@@ -0,0 +1,64 @@
+"""Validation of ingested records and their INVALID/ERROR classification.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import json
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+import ingest  # noqa: E402
+from ingest import validate, InvalidRecord, INVALID, ERROR  # noqa: E402
+from incidents import TIME_FORMAT  # noqa: E402
+
+
+def record(**fields):
+    return {"type": "Fire", "time": "2024-01-01 10:00:00", "current_location": "19.07,72.87", **fields}
+
+
+def test_valid_record_is_normalized():
+    details, key = validate(record(id="call-1", text_address="  Fort, Mumbai ", description=" smoke "))
+    assert key == "call-1"
+    assert details["current_location"] == {"latitude": 19.07, "longitude": 72.87}
+    assert details["text_address"] == "Fort, Mumbai" and details["description"] == "smoke"
+
+
+@pytest.mark.parametrize("fields", [
+    {"type": "Flood"},
+    {"type": ["Fire"]},
+    {"type": {"name": "Fire"}},
+    {"time": "01/01/2024 10:00"},
+    {"current_location": "19.07"},
+    {"current_location": {"latitude": 91, "longitude": 0}},
+    {"current_location": None},
+    {"text_address": 5},
+    {"id": ""},
+])
+def test_malformed_fields_are_invalid(fields):
+    with pytest.raises(InvalidRecord):
+        validate(record(**fields))
+
+
+def test_future_time_beyond_clock_skew_is_invalid():
+    soon = datetime.now() + timedelta(seconds=ingest.MAX_CLOCK_SKEW / 2)
+    validate(record(time=soon.strftime(TIME_FORMAT)))
+    with pytest.raises(InvalidRecord):
+        validate(record(time="2099-01-01 00:00:00"))
+
+
+def test_client_errors_are_reported_invalid_not_error(monkeypatch):
+    def fail(line):
+        raise RuntimeError("geocoder down")
+
+    lines = [b"not json", b"\xff\xfe", json.dumps(record(type=["Fire"])).encode(), json.dumps([1]).encode()]
+    with ThreadPoolExecutor(2) as pool:
+        results = ingest._process_batch(list(enumerate(lines, 1)), pool, "test")
+        assert [result["status"] for result in results] == [INVALID] * len(lines)
+        monkeypatch.setattr(ingest, "prepare", fail)
+        [result] = ingest._process_batch([(1, json.dumps(record()).encode())], pool, "test")
+    assert result["status"] == ERROR
@@ -0,0 +1,190 @@
+"""Crash replay, lease expiry and idempotency of the outbox.
+
+Delivery is replaced by a fake that records each alert it sends, so every
+test can assert that each idempotency key reached Telegram exactly once.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import subprocess
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+import outbox  # noqa: E402
+from outbox import Outbox, PENDING, SENT  # noqa: E402
+
+# Runs in a separate process that the test SIGKILLs in the middle of a batch
+CRASHING_WORKER = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+import outbox
+
+def deliver(details, photos, progress):
+    if details["n"] == {crash_at}:
+        open({ready!r}, "w").close()
+        time.sleep(60)
+    with open({log!r}, "a") as f:
+        f.write(details["key"] + "\\n")
+    progress["message_id"] = details["n"]
+
+outbox.deliver_alert = deliver
+outbox.chat_delay = lambda chat_id: 0.0
+outbox.Outbox({path!r}, {spool!r}, batch_size=10, lease=1.0).drain_once()
+"""
+
+
+class FakeTelegram:
+    """Stands in for alerts.deliver_alert, recording one delivery per call"""
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.delivered = []
+        self._lock = threading.Lock()
+
+    def __call__(self, details, photos, progress):
+        time.sleep(self.seconds)
+        with self._lock:
+            self.delivered.append(details["key"])
+        progress["message_id"] = details["n"]
+        progress["chat_id"] = (details.get("route") or {}).get("chat_id")
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "outbox.sqlite3"), str(tmp_path / "spool")
+
+
+@pytest.fixture
+def telegram(monkeypatch):
+    fake = FakeTelegram()
+    monkeypatch.setattr(outbox, "deliver_alert", fake)
+    monkeypatch.setattr(outbox, "chat_delay", lambda chat_id: 0.0)
+    return fake
+
+
+def enqueue(queue, count, chat_id=None):
+    keys = [f"alert-{chat_id}-{n}" for n in range(count)]
+    route = {"chat_id": chat_id} if chat_id else None
+    queue.enqueue_many([({"type": "Fire", "key": key, "n": n, "route": route}, None, key)
+                        for n, key in enumerate(keys)])
+    return keys
+
+
+def drain(queue, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with queue._lock:
+            waiting = queue._conn.execute("SELECT COUNT(*) FROM outbox WHERE status != ?", (SENT,)).fetchone()[0]
+        if not waiting:
+            return
+        if not queue.drain_once():
+            time.sleep(0.05)
+    raise AssertionError("outbox did not drain")
+
+
+def test_worker_killed_mid_batch_delivers_each_alert_once(paths, telegram, tmp_path):
+    path, spool = paths
+    keys = enqueue(Outbox(path, spool), 10)
+    log, ready = str(tmp_path / "delivered.log"), str(tmp_path / "ready")
+    script = CRASHING_WORKER.format(root=ROOT, crash_at=4, ready=ready, log=log, path=path, spool=spool)
+    worker = subprocess.Popen([sys.executable, "-c", script])
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(ready):
+            assert worker.poll() is None and time.monotonic() < deadline, "worker never reached the 5th alert"
+            time.sleep(0.05)
+    finally:
+        worker.send_signal(signal.SIGKILL)
+        worker.wait()
+    with open(log) as f:
+        before = f.read().split()
+    assert before == keys[:4]
+
+    # Another replica picks up the dead worker's rows once their lease runs out
+    time.sleep(1.1)
+    drain(Outbox(path, spool, lease=1.0))
+    assert Counter(before + telegram.delivered) == Counter(keys)
+
+
+def test_expired_lease_is_not_delivered_twice(paths, telegram):
+    path, spool = paths
+    first, second = Outbox(path, spool, batch_size=10, lease=0.3), Outbox(path, spool, lease=0.3)
+    keys = enqueue(first, 10)
+    # The batch outlasts its lease, so the other replica claims its tail meanwhile
+    telegram.seconds = 0.1
+    slow = threading.Thread(target=first.drain_once)
+    slow.start()
+    time.sleep(0.35)
+    drain(second)
+    slow.join()
+    assert Counter(telegram.delivered) == Counter(keys)
+
+
+def test_repeated_key_is_queued_and_delivered_once(paths, telegram):
+    queue = Outbox(*paths)
+    details = {"type": "Fire", "key": "same", "n": 1}
+    assert queue.enqueue(details, idempotency_key="same") == "same"
+    assert queue.enqueue(dict(details, n=2), idempotency_key="same") == "same"
+    drain(queue)
+    drain(queue)
+    assert telegram.delivered == ["same"]
+    assert json.loads(queue._conn.execute("SELECT progress FROM outbox").fetchone()[0])["message_id"] == 1
+
+
+def test_throttled_chat_does_not_hold_up_other_chats(paths, telegram, monkeypatch):
+    queue = Outbox(*paths)
+    monkeypatch.setattr(outbox, "chat_delay", lambda chat_id: 60.0 if chat_id == "-100" else 0.0)
+    throttled = enqueue(queue, 3, chat_id="-100")
+    other = enqueue(queue, 3, chat_id="-200")
+    queue.drain_once()
+    assert telegram.delivered == other
+    rows = queue._conn.execute(
+        "SELECT idempotency_key, status, attempts, next_attempt_at FROM outbox WHERE status != ?", (SENT,)
+    ).fetchall()
+    assert sorted(row[0] for row in rows) == sorted(throttled)
+    assert all(row[1] == PENDING and row[2] == 0 and row[3] > time.time() + 50 for row in rows)
+
+
+def test_photo_missing_from_spool_is_dropped_not_retried(paths, monkeypatch):
+    queue = Outbox(*paths)
+    sent = []
+    monkeypatch.setattr(outbox, "deliver_alert", lambda details, photos, progress: sent.append((details, photos)))
+    monkeypatch.setattr(outbox, "chat_delay", lambda chat_id: 0.0)
+    queue.enqueue({"type": "Fire"}, [b"kept", b"lost"], "key")
+    os.remove(os.path.join(queue.spool_dir, outbox.hashlib.sha256(b"lost").hexdigest()))
+    drain(queue)
+    [(details, photos)] = sent
+    assert photos == [b"kept"] and details["photos_unavailable"] == 1
+
+
+
+def test_update_waits_for_its_failing_incident_alert_without_using_attempts(paths, monkeypatch):
+    queue = Outbox(*paths, base_delay=0.0, max_attempts=3, poll_interval=0.0)
+    failures, updates = [RuntimeError("Telegram down")] * 2, []
+
+    def deliver(details, photos, progress):
+        if failures:
+            raise failures.pop()
+        progress["message_id"] = 1
+
+    monkeypatch.setattr(outbox, "deliver_alert", deliver)
+    monkeypatch.setattr(outbox, "deliver_incident_update",
+                        lambda details, photos, parent, parent_progress, progress, edit: updates.append(details))
+    monkeypatch.setattr(outbox, "chat_delay", lambda chat_id: 0.0)
+    queue.enqueue({"type": "Fire"}, idempotency_key="alert")
+    queue.enqueue({"type": "Fire", "incident": {"id": "i", "parent": "alert", "reports": 2}},
+                  idempotency_key="update")
+    for _ in range(2):
+        queue.drain_once()
+        assert queue.get("update")["attempts"] == 0
+    drain(queue)
+    assert [details["incident"]["reports"] for details in updates] == [2]
+    assert queue.get("alert")["attempts"] == 3 and queue.get("update")["attempts"] == 1
@@ -0,0 +1,69 @@
+"""Near-duplicate detection and file_id reuse of the photo index.
+
+    python -m pytest tests
+"""
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+from photo_dedup import PhotoIndex  # noqa: E402
+from telegram_client import TelegramFile  # noqa: E402
+
+
+def photo(seed, quality=90, size=(320, 240)):
+    # Smooth random blobs: a scene with structure, unlike pure noise
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize(size, Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def sent(*file_ids):
+    return [{"photo": [{"file_id": f"{file_id}-small"}, {"file_id": file_id}]} for file_id in file_ids]
+
+
+def test_recompressed_copy_within_a_report_is_dropped():
+    planned = PhotoIndex().plan([photo(1), photo(1, quality=60, size=(640, 480)), photo(2)])
+    assert len(planned) == 2 and all(p.file_id is None for p in planned)
+
+
+def test_delivered_photo_is_reused_by_file_id_until_the_window_ends():
+    index = PhotoIndex(window=60)
+    first = index.plan([photo(1), photo(2)], now=1000)
+    index.remember(first, sent("one", "two"), now=1000)
+    again = index.plan([photo(2, quality=70), photo(3)], now=1030)
+    assert [p.payload if p.file_id else None for p in again] == ["two", None]
+    assert all(p.file_id is None for p in index.plan([photo(2)], now=1061))
+
+
+def test_forgotten_file_id_is_not_offered_again():
+    index = PhotoIndex()
+    index.remember(index.plan([photo(1)]), sent("one"))
+    reused = index.plan([photo(1)])
+    assert reused[0].file_id == "one"
+    index.forget(reused)
+    assert index.plan([photo(1)])[0].file_id is None and len(index) == 0
+
+
+def test_telegram_files_and_undecodable_bytes_pass_through():
+    planned = PhotoIndex().plan([TelegramFile("abc"), b"not an image"])
+    assert [p.payload for p in planned] == ["abc", b"not an image"]
+
+
+def test_expired_slots_are_reclaimed_without_losing_live_ones():
+    index = PhotoIndex(window=10)
+    stale, live, later = index.plan([photo(1)]), index.plan([photo(2)]), index.plan([photo(3)])
+    for _ in range(1023):
+        index.remember(stale, sent("stale"), now=0)
+    index.remember(live, sent("live"), now=100)
+    # The arrays are full: the expired slots make room instead of growing them
+    index.remember(later, sent("later"), now=100)
+    assert index._count == 2 and len(index._expires) == 1024
+    assert [index.plan([photo(seed)], now=105)[0].file_id for seed in (1, 2, 3)] == [None, "live", "later"]
@@ -0,0 +1,53 @@
+"""Negation handling and scoring of the triage rules.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+from triage import TriageEngine, CRITICAL, ROUTINE  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return TriageEngine()
+
+
+def reasons(engine, description, emergency_type="Medical Emergency"):
+    return engine.assess(emergency_type, description).reasons
+
+
+@pytest.mark.parametrize("description, expected", [
+    ("He is unconscious", ["unconscious"]),
+    ("He is not unconscious", []),
+    ("She isn't bleeding", []),
+    ("There is no smoke", []),
+    # The negation ends at a scope break or punctuation
+    ("Not bleeding, but unconscious", ["unconscious"]),
+    ("no blood. He collapsed", ["collapsed"]),
+    # ... or after NEGATION_REACH words
+    ("No one here knows why he suddenly collapsed", ["collapsed"]),
+])
+def test_negation_reaches_only_the_words_it_governs(engine, description, expected):
+    assert reasons(engine, description) == expected
+
+
+def test_phrases_that_contain_a_negation_still_count(engine):
+    assert reasons(engine, "He is not breathing") == ["not breathing"]
+    assert reasons(engine, "she can't breathe") == ["cannot breathe"]
+    assert reasons(engine, "no pulse") == ["no pulse"]
+
+
+def test_stems_match_other_word_forms(engine):
+    assert reasons(engine, "The wound bleeds a lot") == ["bleeding"]
+    assert "seizure" in reasons(engine, "having seizures")
+
+
+def test_mitigating_phrases_lower_the_level(engine):
+    assert engine.assess("Accident", "not breathing, heavy bleeding").level == CRITICAL
+    assert engine.assess("Accident", "minor scrape, no injuries").level == ROUTINE
+    assert engine.assess("Accident", "minor scrape, no injuries").reasons == []
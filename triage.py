@@ -0,0 +1,242 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+from functools import lru_cache
+from bootstrap import get_nltk
+
+logger = logging.getLogger(__name__)
+
+CRITICAL = "critical"
+URGENT = "urgent"
+ROUTINE = "routine"
+
+# Score thresholds for each level, highest first
+LEVELS = ((80, CRITICAL), (55, URGENT), (0, ROUTINE))
+
+# Severity of a report that says nothing beyond its type
+TYPE_SEVERITY = {
+    "Heart/Chest Pain": 60,
+    "Fire": 55,
+    "Accident": 50,
+    "Medical Emergency": 45,
+    "Pregnancy": 45,
+    "Other Emergency": 30,
+}
+DEFAULT_SEVERITY = 30
+
+# (phrase, weight, negatable) added to the type's severity when the description
+# mentions them. Phrases are matched on word stems, so "bleeding" and "bleeds"
+# count alike; negatable phrases are ignored after "no", "not" and the like.
+RULES = [
+    ("unconscious", 60, True),
+    ("unresponsive", 60, True),
+    ("not responding", 60, False),
+    ("not breathing", 70, False),
+    ("stopped breathing", 70, False),
+    ("cannot breathe", 60, False),
+    ("no pulse", 70, False),
+    ("cardiac arrest", 70, True),
+    ("heart attack", 50, True),
+    ("collapsed", 45, True),
+    ("passed out", 40, True),
+    ("fainted", 35, True),
+    ("seizure", 45, True),
+    ("convulsions", 45, True),
+    ("choking", 50, True),
+    ("drowning", 60, True),
+    ("stroke", 45, True),
+    ("overdose", 45, True),
+    ("difficulty breathing", 45, True),
+    ("short of breath", 35, True),
+    ("blue lips", 50, True),
+    ("allergic reaction", 35, True),
+    ("severe bleeding", 55, True),
+    ("heavy bleeding", 55, True),
+    ("bleeding heavily", 55, True),
+    ("bleeding", 25, True),
+    ("blood", 20, True),
+    ("head injury", 35, True),
+    ("broken", 15, True),
+    ("burns", 30, True),
+    ("burning", 20, True),
+    ("trapped", 45, True),
+    ("explosion", 50, True),
+    ("gas leak", 40, True),
+    ("fire spreading", 35, True),
+    ("smoke", 15, True),
+    ("gunshot", 60, True),
+    ("stabbed", 55, True),
+    ("water broke", 15, True),
+    ("contractions", 10, True),
+    ("labour", 10, True),
+    ("labor", 10, True),
+    ("baby", 15, True),
+    ("child", 15, True),
+    ("children", 20, True),
+    ("infant", 20, True),
+    ("elderly", 10, True),
+    ("multiple people", 25, True),
+    ("several people", 25, True),
+    ("many people", 30, True),
+    ("minor", -15, False),
+    ("small cut", -15, False),
+    ("stable", -15, True),
+    ("breathing normally", -20, False),
+    ("no injuries", -25, False),
+    ("not serious", -20, False),
+]
+
+NEGATIONS = {"no", "not", "never", "without", "nobody"}
+# Words that end the reach of a negation: "not bleeding, but unconscious"
+_SCOPE_BREAKS = {"and", "but", "or", "also", "then"}
+NEGATION_REACH = 3
+# Longest description the intake forms accept
+DESCRIPTION_MAX_CHARS = 500
+# Longest description scored; anything after this is ignored
+MAX_CHARS = 2000
+
+# "can't" and "isn't" tokenize into pieces; rewrite them to "can not", "is not"
+_CONTRACTIONS = re.compile(r"\b(\w*?)(?:n['’]t|(?<=can)not)\b")
+_IRREGULAR = {"ca": "can", "wo": "will", "sha": "shall"}
+
+_nltk_lock = threading.Lock()
+_tokenize = None
+_stemmer = None
+
+
+def _tools():
+    global _tokenize, _stemmer
+    if _stemmer is None:
+        with _nltk_lock:
+            if _stemmer is None:
+                nltk = get_nltk()
+                # wordpunct_tokenize is regex based and needs no downloaded corpora
+                _tokenize = nltk.tokenize.wordpunct_tokenize
+                _stemmer = nltk.stem.porter.PorterStemmer()
+    return _tokenize, _stemmer
+
+
+@lru_cache(maxsize=20000)
+def _stem(token):
+    return _tools()[1].stem(token)
+
+
+def stems(text):
+    """Lowercase word stems of ``text``, punctuation kept as separate tokens"""
+    text = _CONTRACTIONS.sub(lambda m: f"{_IRREGULAR.get(m.group(1), m.group(1))} not", text[:MAX_CHARS].lower())
+    return [_stem(token) for token in _tools()[0](text)]
+
+
+class Triage:
+    """Severity of one report: a 0-100 score, its level and the phrases that raised it"""
+
+    def __init__(self, score, level, reasons):
+        self.score = score
+        self.level = level
+        self.reasons = reasons
+
+    def as_dict(self):
+        return {"score": self.score, "level": self.level, "reasons": self.reasons}
+
+
+def level_for(score):
+    return next(level for threshold, level in LEVELS if score >= threshold)
+
+
+class TriageEngine:
+    """Scores report severity from the emergency type and the free-text description.
+
+    Rule phrases are stemmed once when the engine is built and indexed by
+    their first stem, so scoring a description is one pass over its tokens
+    with a dictionary lookup each; a typical report takes tens of
+    microseconds. An optional linear model (``TRIAGE_MODEL``, a JSON file
+    of ``{"bias": b, "weights": {stem: w}}``) can raise the score further;
+    it never lowers what the rules found.
+    """
+
+    def __init__(self, rules=RULES, type_severity=TYPE_SEVERITY, model=None):
+        self.type_severity = type_severity
+        self.model = model
+        self._rules = {}
+        for phrase, weight, negatable in rules:
+            key = tuple(stems(phrase))
+            self._rules.setdefault(key[0], []).append((key, weight, negatable, phrase))
+        # Longest phrase first, so "not breathing" wins over "breathing"
+        for candidates in self._rules.values():
+            candidates.sort(key=lambda rule: -len(rule[0]))
+
+    def _matches(self, tokens):
+        found, negated_until, i = {}, -1, 0
+        while i < len(tokens):
+            token = tokens[i]
+            for key, weight, negatable, phrase in self._rules.get(token, ()):
+                if tuple(tokens[i:i + len(key)]) == key:
+                    if not (negatable and i <= negated_until):
+                        found[phrase] = weight
+                    i += len(key)
+                    break
+            else:
+                if token in NEGATIONS:
+                    negated_until = i + NEGATION_REACH
+                elif token in _SCOPE_BREAKS or not token.isalnum():
+                    negated_until = -1
+                i += 1
+        return found
+
+    def _model_score(self, tokens):
+        weights = self.model["weights"]
+        logit = self.model.get("bias", 0.0) + sum(weights.get(token, 0.0) for token in set(tokens))
+        return 100.0 / (1.0 + math.exp(-logit))
+
+    def assess(self, emergency_type, description=None):
+        """Return the Triage of a report"""
+        score = self.type_severity.get(emergency_type, DEFAULT_SEVERITY)
+        reasons = []
+        if description:
+            tokens = stems(description)
+            found = self._matches(tokens)
+            score += sum(found.values())
+            reasons = [phrase for phrase, weight in sorted(found.items(), key=lambda item: -item[1]) if weight > 0]
+            if self.model is not None:
+                score = max(score, self._model_score(tokens))
+        score = int(round(min(100, max(0, score))))
+        return Triage(score, level_for(score), reasons)
+
+
+def load_model(path):
+    """Read a linear triage model from a JSON file"""
+    with open(path, encoding="utf-8") as f:
+        model = json.load(f)
+    if not isinstance(model.get("weights"), dict):
+        raise ValueError(f"{path}: expected a 'weights' object")
+    return model
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_triage_engine():
+    """Return the process-wide triage engine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                model = None
+                model_path = os.getenv("TRIAGE_MODEL")
+                if model_path:
+                    try:
+                        model = load_model(model_path)
+                        logger.info(f"Loaded triage model from {model_path}")
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Triage model not loaded, using rules only: {e}")
+                _engine = TriageEngine(model=model)
+    return _engine
+
+
+def triage(emergency_details):
+    """Triage of an alert's ``emergency_details``"""
+    return get_triage_engine().assess(emergency_details.get('type'), emergency_details.get('description'))